@@ -0,0 +1,82 @@
+"""
+Upcoming-birthdays query over synthetic contacts, old full-date filter against the MMDD column.
+
+Seeds 1 000 000 contacts spread over 100 users in a temporary SQLite database
+and times, per user:
+
+* legacy   - birthday BETWEEN today AND today + 7 on the full date (misses past years),
+* computed - month/day derived from the date in SQL, correct but not indexable,
+* mmdd     - birthday_window() on the indexed birthday_mmdd column.
+
+Run from the project root: python -m benchmarks.bench_birthdays [contacts] [users]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func, insert, select, text, Integer
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.models import Base, Contacts, Users, birthday_key
+from src.repository.contacts import birthday_window
+
+DAYS = 7
+CHUNK = 50000
+
+
+async def seed(engine, contacts: int, users: int):
+    rnd = random.Random(42)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("CREATE INDEX ix_contacts_user_id_birthday ON contacts (user_id, birthday)"))
+        await conn.execute(insert(Users), [{"id": i, "username": f"user{i}@example.com", "password": "x"}
+                                           for i in range(1, users + 1)])
+        for start in range(0, contacts, CHUNK):
+            rows = []
+            for i in range(start, min(start + CHUNK, contacts)):
+                birthday = date(1950, 1, 1) + timedelta(days=rnd.randrange(365 * 60))
+                rows.append({"name": f"name{i}", "lastname": f"lastname{i}", "email": f"c{i}@example.com",
+                             "phone": str(i), "birthday": birthday, "birthday_mmdd": birthday_key(birthday),
+                             "user_id": i % users + 1})
+            await conn.execute(insert(Contacts), rows)
+
+
+def queries(today: date):
+    last = today + timedelta(days=DAYS)
+    computed = func.cast(func.strftime('%m%d', Contacts.birthday), Integer)
+    return {
+        "legacy": Contacts.birthday.between(today, last),
+        "computed": computed.between(birthday_key(today), birthday_key(last)),
+        "mmdd": birthday_window(today, DAYS),
+    }
+
+
+async def main(contacts: int, users: int):
+    today = date(2024, 6, 10)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        start = time.perf_counter()
+        await seed(engine, contacts, users)
+        print(f"seeded {contacts} contacts for {users} users in {time.perf_counter() - start:.1f} s")
+
+        print(f"{'query':<10}{'rows/user':>12}{'median, ms':>12}")
+        async with engine.connect() as conn:
+            for name, condition in queries(today).items():
+                samples, found = [], 0
+                for user_id in range(1, users + 1):
+                    stmt = select(Contacts.id).filter(and_(Contacts.user_id == user_id, condition))
+                    begin = time.perf_counter()
+                    found += len((await conn.execute(stmt)).all())
+                    samples.append(time.perf_counter() - begin)
+                print(f"{name:<10}{found / users:>12.1f}{statistics.median(samples) * 1000:>12.2f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 100))
@@ -0,0 +1,96 @@
+"""
+Requests per second of GET /api/contacts/?limit=100 with and without the fast JSON path.
+
+Seeds one user with 1 000 contacts in a temporary SQLite database and drives the
+app in process through httpx's ASGI transport, so the numbers include routing,
+the query and serialization but no network. Auth, rate limiting and the response
+cache are overridden, every request reaches the database.
+
+Run from the project root: python -m benchmarks.bench_json [seconds]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from main import app
+from src.config.config import settings1
+from src.database.db import get_db
+from src.database.models import Base, Contacts, Users
+from src.database.redis_db import get_redis
+from src.repository.auth import get_current_user
+from src.schemas import UserCache
+
+CONTACTS = 1000
+LIMIT = 100
+SECONDS = 5.0
+
+
+async def seed(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Users), [{"id": 1, "username": "smith@gmail.com", "password": "x"}])
+        rows = [
+            {"name": f"name{i}", "lastname": f"lastname{i % 97}", "email": f"c{i}@example.com",
+             "phone": str(i), "birthday": date(1990, 1, 1 + i % 28), "additional": "note", "user_id": 1}
+            for i in range(CONTACTS)
+        ]
+        await conn.execute(insert(Contacts), rows)
+
+
+def override_dependencies(session_factory):
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    async def no_limit():
+        return None
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_redis] = lambda: None
+    app.dependency_overrides[get_current_user] = lambda: UserCache(id=1, username="smith@gmail.com")
+    for route in app.routes:
+        for dependency in getattr(route, "dependencies", []):
+            app.dependency_overrides[dependency.dependency] = no_limit
+
+
+async def requests_per_second(client: httpx.AsyncClient, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        response = await client.get("/api/contacts/", params={"limit": LIMIT})
+        assert response.status_code == 200 and len(response.json()) == LIMIT, response.text
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+async def main(seconds: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        await seed(engine)
+        override_dependencies(async_sessionmaker(engine, expire_on_commit=False))
+
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, fast in (("models", False), ("fast json", True)):
+                settings1.fast_json_responses = fast
+                await requests_per_second(client, seconds / 5)
+                results[name] = await requests_per_second(client, seconds)
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    print(f"GET /api/contacts/?limit={LIMIT}, {seconds:.0f} s per path")
+    for name, value in results.items():
+        print(f"{name:<12}{value:>10.0f} req/s")
+    print(f"speedup     {results['fast json'] / results['models']:>10.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS))
@@ -0,0 +1,57 @@
+"""
+Throughput of get_current_user with and without the verified-JWT cache.
+
+The Redis user cache is replaced by an in-memory dict with a warm entry, so
+the numbers show the token decoding cost and not network latency.
+
+Run from the project root: python -m benchmarks.bench_jwt_cache
+"""
+import asyncio
+import time
+
+from src.repository import auth
+from src.schemas import UserCache
+from src.servises.token_cache import TokenCache
+
+CALLS = 20000
+
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+async def run(cache: DictCache, token: str) -> float:
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await auth.get_current_user(token=token, db=None, cache=cache)
+    return CALLS / (time.perf_counter() - start)
+
+
+async def main():
+    username = "smith@gmail.com"
+    user = UserCache(id=1, username=username, confirmed=True, avatar="https://example.com/avatar.png")
+    cache = DictCache()
+    cache.data[auth.user_cache_key(username)] = auth.dump_cached_user(user)
+    token = await auth.create_access_token(data={"sub": username})
+
+    auth.token_cache = TokenCache(maxsize=0)
+    without_cache = await run(cache, token)
+
+    auth.token_cache = TokenCache(maxsize=10000)
+    with_cache = await run(cache, token)
+
+    print(f"{'jwt cache':<12}{'calls/s':>12}")
+    print(f"{'off':<12}{without_cache:>12.0f}")
+    print(f"{'on':<12}{with_cache:>12.0f}")
+    print(f"hits={auth.token_cache.hits} misses={auth.token_cache.misses}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
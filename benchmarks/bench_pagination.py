@@ -0,0 +1,76 @@
+"""
+Offset versus keyset pagination of a user's contacts, page 1 against page 500.
+
+Seeds one user with 50 000 contacts (100 per page) in a temporary SQLite
+database and times the repository functions behind GET /api/contacts/.
+
+Run from the project root: python -m benchmarks.bench_pagination [contacts]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contacts, Users
+from src.repository import contacts as repository_contacts
+
+LIMIT = 100
+PAGE = 500
+REPEAT = 20
+
+
+async def seed(engine, count: int) -> Users:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Users), [{"id": 1, "username": "smith@gmail.com", "password": "x"}])
+        rows = [
+            {"name": f"name{i % 997}", "lastname": f"lastname{i % 1009}", "email": f"c{i}@example.com",
+             "phone": str(i), "birthday": date(1990, 1, 1), "user_id": 1}
+            for i in range(count)
+        ]
+        await conn.execute(insert(Contacts), rows)
+    return Users(id=1)
+
+
+async def timed(func) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def main(count: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        user = await seed(engine, count)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with session_factory() as db:
+            rows = await repository_contacts.get_contacts_after(None, (PAGE - 1) * LIMIT, user, db)
+            after = (rows[-1].lastname, rows[-1].name, rows[-1].id)
+
+            results = {
+                "offset page 1": await timed(lambda: repository_contacts.get_contacts(0, LIMIT, user, db)),
+                f"offset page {PAGE}": await timed(
+                    lambda: repository_contacts.get_contacts((PAGE - 1) * LIMIT, LIMIT, user, db)),
+                "keyset page 1": await timed(lambda: repository_contacts.get_contacts_after(None, LIMIT, user, db)),
+                f"keyset page {PAGE}": await timed(
+                    lambda: repository_contacts.get_contacts_after(after, LIMIT, user, db)),
+            }
+        await engine.dispose()
+
+    print(f"{count} contacts, {LIMIT} per page, median of {REPEAT} runs")
+    for name, value in results.items():
+        print(f"{name:<20}{value:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else LIMIT * PAGE))
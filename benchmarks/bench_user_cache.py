@@ -0,0 +1,50 @@
+"""
+Compare the user cache entry formats used by get_current_user.
+
+Old format: pickle of the SQLAlchemy Users instance.
+New format: JSON of the UserCache projection.
+
+Run from the project root: python -m benchmarks.bench_user_cache
+"""
+import pickle
+import timeit
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Users
+from src.schemas import UserCache
+
+NUMBER = 20000
+
+
+def load_user() -> Users:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Users(username="smith@gmail.com",
+                          password="$2b$12$" + "x" * 53,
+                          refresh_token="r" * 180,
+                          confirmed=True,
+                          avatar="https://www.gravatar.com/avatar/0123456789abcdef0123456789abcdef"))
+        session.commit()
+        user = session.execute(select(Users)).scalar_one()
+        session.expunge(user)
+    return user
+
+
+def main():
+    user = load_user()
+    pickled = pickle.dumps(user)
+    projected = UserCache.model_validate(user).model_dump_json().encode()
+
+    pickle_time = timeit.timeit(lambda: pickle.loads(pickled), number=NUMBER) / NUMBER
+    json_time = timeit.timeit(lambda: UserCache.model_validate_json(projected), number=NUMBER) / NUMBER
+
+    print(f"{'format':<12}{'bytes':>8}{'decode, us':>14}")
+    print(f"{'pickle':<12}{len(pickled):>8}{pickle_time * 1e6:>14.2f}")
+    print(f"{'UserCache':<12}{len(projected):>8}{json_time * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
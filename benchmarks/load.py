@@ -0,0 +1,428 @@
+"""
+Load test of the API: seeds users with contacts, drives a weighted mix of requests from
+concurrent clients and writes latency percentiles and requests per second to JSON.
+
+The app runs in process behind httpx's ASGI transport, so the numbers cover routing,
+auth, Redis and the database but no network. The database is a temporary SQLite file
+unless --database-url points at another one, e.g. a local PostgreSQL. Redis is the one
+from settings when it answers PING, else an in-process dict stands in for it and the
+report says so. Rate limits are disabled and the Cloudinary upload endpoint is replaced by
+a local stand-in. The avatar mix measures the 202 answer, the uploads finish in the
+background and are waited for before the run ends.
+
+Run from the project root:
+
+    python -m benchmarks.load --mix mixed --users 20 --contacts 500 --concurrency 16 --duration 30
+    python -m benchmarks.load --compare before.json after.json
+
+Mixes: read, write, mixed, auth, avatar. The JSON keeps its keys sorted, so two runs
+can also be compared with a plain diff.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from src.config.config import settings1
+from src.database import redis_db
+from src.database.db import create_engine_from_settings, get_db
+from src.database.models import Base, Contacts, Users, birthday_key
+from src.repository import auth as repository_auth
+from src.routes import auth as auth_routes, contacts as contacts_routes, users as users_routes
+from src.servises.avatars import avatar_uploader
+from src.servises.response_cache import contacts_cache
+
+PASSWORD = "loadtest-password"
+CHUNK = 10000
+LAST_NAMES = ("Smith", "Johnson", "Brown", "Taylor", "Wilson", "Davies", "Evans", "Thomas", "Roberts", "Walker")
+FIRST_NAMES = ("John", "Mary", "James", "Anna", "Robert", "Linda", "David", "Susan", "Peter", "Helen")
+
+MIXES = {
+    "read": {"list": 40, "read": 25, "search": 25, "birthdays": 10},
+    "write": {"create": 40, "update": 40, "delete": 20},
+    "mixed": {"list": 25, "read": 20, "search": 15, "birthdays": 5,
+              "create": 10, "update": 10, "delete": 5, "login": 5, "avatar": 5},
+    "auth": {"login": 100},
+    "avatar": {"avatar": 100},
+}
+
+
+class MemoryRedis:
+    """
+    Dict with the few Redis commands the app uses, for runs without a Redis server. Expiry is ignored.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def incr(self, key):
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    async def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({name: str(value).encode() for name, value in mapping.items()})
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+    async def aclose(self):
+        self.data.clear()
+
+
+class MemoryPipeline:
+    """
+    Queues MemoryRedis commands and runs them on execute(), nothing runs in between anyway.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands.clear()
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        return [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class VirtualUser:
+    """
+    Seeded user driven by one or more clients: credentials, token and the ids of their contacts.
+    """
+
+    def __init__(self, username: str, contact_ids: list[int], token: str, seed: int):
+        self.username = username
+        self.contact_ids = contact_ids
+        self.created = []
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rnd = random.Random(seed)
+
+
+def contact_row(index: int, user_id: int, rnd: random.Random) -> dict:
+    birthday = date(1950, 1, 1) + timedelta(days=rnd.randrange(365 * 60))
+    return {"name": FIRST_NAMES[index % len(FIRST_NAMES)], "lastname": f"{rnd.choice(LAST_NAMES)}{index % 50}",
+            "email": f"c{index}@example.com", "phone": f"{3800000000 + index}", "birthday": birthday,
+            "birthday_mmdd": birthday_key(birthday), "additional": "seeded", "user_id": user_id}
+
+
+async def seed(engine, users: int, contacts: int, reset: bool, rnd: random.Random) -> list[tuple[int, str]]:
+    """
+    Create the schema and insert users with contacts, all users share one password hash.
+    """
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        if await conn.scalar(select(func.count()).select_from(Users)):
+            raise SystemExit("The database already has users, pass --reset to drop its tables first")
+
+        password = repository_auth.hash_password(PASSWORD)
+        accounts = [{"id": i, "username": f"load{i}@example.com", "password": password, "confirmed": True,
+                     "avatar": "https://example.com/avatar.png"} for i in range(1, users + 1)]
+        await conn.execute(insert(Users), accounts)
+        rows = [contact_row(i, i % users + 1, rnd) for i in range(users * contacts)]
+        for start in range(0, len(rows), CHUNK):
+            await conn.execute(insert(Contacts), rows[start:start + CHUNK])
+    return [(account["id"], account["username"]) for account in accounts]
+
+
+async def connect_redis(use_redis: bool):
+    """
+    The Redis client from settings when it answers PING, else a MemoryRedis.
+
+    MemoryRedis has no sorted sets and ignores expiry, so the response cache's size cap is off then.
+    """
+    if use_redis:
+        client = await redis_db.init_redis()
+        try:
+            await asyncio.wait_for(client.ping(), timeout=1)
+            return client, "redis"
+        except (OSError, asyncio.TimeoutError, redis_db.redis.RedisError):
+            await redis_db.close_redis()
+    contacts_cache.max_total_bytes = 0
+    return MemoryRedis(), "memory"
+
+
+def override_dependencies(session_factory, cache):
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    async def no_limit():
+        return None
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[redis_db.get_redis] = lambda: cache
+    for router in (contacts_routes.router, auth_routes.router, users_routes.router):
+        for route in router.routes:
+            for dependency in route.dependencies:
+                app.dependency_overrides[dependency.dependency] = no_limit
+
+
+def fake_upload(request: httpx.Request) -> httpx.Response:
+    request.read()
+    return httpx.Response(200, json={"version": int(time.time())})
+
+
+async def op_list(client, user):
+    return await client.get("/api/contacts/", params={"limit": 20}, headers=user.headers)
+
+
+async def op_read(client, user):
+    return await client.get(f"/api/contacts/{user.rnd.choice(user.contact_ids)}", headers=user.headers)
+
+
+async def op_search(client, user):
+    return await client.get("/api/contacts/search/", params={"query": user.rnd.choice(LAST_NAMES)},
+                            headers=user.headers)
+
+
+async def op_birthdays(client, user):
+    return await client.get("/api/contacts/birthdays/", params={"days": 7}, headers=user.headers)
+
+
+async def op_create(client, user):
+    index = user.rnd.randrange(10 ** 6)
+    body = {"name": "Load", "lastname": f"Test{index}", "email": f"load{index}@example.com",
+            "phone": f"{3900000000 + index}", "birthday": "1990-05-17", "additional": "created"}
+    response = await client.post("/api/contacts/", json=body, headers=user.headers)
+    if response.status_code == 201:
+        user.created.append(response.json()["id"])
+    return response
+
+
+async def op_update(client, user):
+    body = {"phone": f"{3700000000 + user.rnd.randrange(10 ** 6)}"}
+    return await client.patch(f"/api/contacts/{user.rnd.choice(user.contact_ids)}", json=body, headers=user.headers)
+
+
+async def op_delete(client, user):
+    if not user.created:
+        return await op_create(client, user)
+    return await client.delete(f"/api/contacts/{user.created.pop()}", headers=user.headers)
+
+
+async def op_login(client, user):
+    return await client.post("/api/auth/login", data={"username": user.username, "password": PASSWORD})
+
+
+async def op_avatar(client, user):
+    files = {"file": ("avatar.png", b"\x89PNG" + b"\0" * 2048, "image/png")}
+    return await client.patch("/api/users/avatar", files=files, headers=user.headers)
+
+
+OPERATIONS = {
+    "list": op_list, "read": op_read, "search": op_search, "birthdays": op_birthdays,
+    "create": op_create, "update": op_update, "delete": op_delete, "login": op_login, "avatar": op_avatar,
+}
+
+
+async def drive(client, users, mix, concurrency, warmup, duration):
+    """
+    Run concurrency clients for warmup + duration seconds, only requests started after the warm-up are kept.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop = measure_from + duration
+
+    async def worker(index):
+        user = users[index % len(users)]
+        while (began := time.perf_counter()) < stop:
+            name = user.rnd.choices(names, weights)[0]
+            try:
+                response = await OPERATIONS[name](client, user)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            if began >= measure_from:
+                samples[name].append(time.perf_counter() - began)
+                errors[name] += failed
+
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return samples, errors
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "errors": errors, "rps": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    if len(latencies) == 1:
+        p50 = p95 = p99 = latencies[0]
+    else:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / duration, 1),
+            "p50_ms": round(p50 * 1000, 2), "p95_ms": round(p95 * 1000, 2), "p99_ms": round(p99 * 1000, 2)}
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit.strip(), "dirty": bool(dirty.strip())}
+
+
+async def run(args) -> dict:
+    rnd = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        engine = create_engine_from_settings(url, "load")
+        accounts = await seed(engine, args.users, args.contacts, args.reset or not args.database_url, rnd)
+        cache, redis_kind = await connect_redis(not args.no_redis)
+        override_dependencies(async_sessionmaker(engine, expire_on_commit=False), cache)
+
+        users = []
+        async with async_sessionmaker(engine)() as db:
+            for user_id, username in accounts:
+                # stale entries of an earlier run would otherwise be served for the same ids
+                await repository_auth.invalidate_cached_user(username, cache)
+                await contacts_cache.invalidate(cache, user_id)
+                ids = list((await db.scalars(select(Contacts.id).where(Contacts.user_id == user_id))).all())
+                token = await repository_auth.create_access_token({"sub": username},
+                                                                  expires_delta=args.warmup + args.duration + 600)
+                users.append(VirtualUser(username, ids, token, rnd.randrange(2 ** 32)))
+
+        transport = httpx.ASGITransport(app=app)
+        try:
+            avatar_uploader.sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+            avatar_uploader.start(transport=httpx.MockTransport(fake_upload))
+            async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=60) as client:
+                samples, errors = await drive(client, users, MIXES[args.mix], args.concurrency,
+                                              args.warmup, args.duration)
+        finally:
+            await avatar_uploader.stop()
+            app.dependency_overrides.clear()
+            await cache.aclose()
+            redis_db.redis_client = None
+            await engine.dispose()
+
+    operations = {name: summarize(samples[name], errors[name], args.duration) for name in sorted(samples)}
+    everything = [latency for name in samples for latency in samples[name]]
+    return {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "redis": redis_kind,
+            "fast_json_responses": settings1.fast_json_responses,
+            "mix": args.mix,
+            "users": args.users,
+            "contacts_per_user": args.contacts,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "duration": args.duration,
+            "seed": args.seed,
+        },
+        "total": summarize(everything, sum(errors.values()), args.duration),
+        "operations": operations,
+    }
+
+
+def print_report(report: dict) -> None:
+    meta = report["meta"]
+    print(f"{meta['mix']} mix, {meta['users']} users x {meta['contacts_per_user']} contacts, "
+          f"{meta['concurrency']} clients, {meta['duration']:.0f} s on {meta['database']} with {meta['redis']}")
+    print(f"{'operation':<12}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in [*report["operations"].items(), ("total", report["total"])]:
+        print(f"{name:<12}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}"
+              f"{row['p50_ms'] or '-':>10}{row['p95_ms'] or '-':>10}{row['p99_ms'] or '-':>10}")
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    print(f"{before['meta']['commit'] or before_path} -> {after['meta']['commit'] or after_path}")
+    print(f"{'operation':<12}{'metric':<8}{'before':>10}{'after':>10}{'change':>10}")
+    names = sorted(set(before["operations"]) | set(after["operations"])) + ["total"]
+    for name in names:
+        old = before["total"] if name == "total" else before["operations"].get(name, {})
+        new = after["total"] if name == "total" else after["operations"].get(name, {})
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            a, b = old.get(metric), new.get(metric)
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "-"
+            print(f"{name:<12}{metric:<8}{a if a is not None else '-':>10}{b if b is not None else '-':>10}{change:>10}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=200, help="contacts per user")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds run before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="database to seed and use instead of a temporary SQLite file")
+    parser.add_argument("--reset", action="store_true", help="drop the tables of --database-url first")
+    parser.add_argument("--no-redis", action="store_true", help="use the in-process stand-in even if Redis is up")
+    parser.add_argument("--output", help="JSON file, default benchmarks/results/<mix>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join("benchmarks", "results", f"{args.mix}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
+    print_report(report)
+    print(f"written to {output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,8 +3,16 @@ from fastapi import FastAPI
 from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.routes import contacts, auth, users
+from src.routes import contacts, auth, users, metrics
 from src.config.config import settings1
+from src.database.redis_db import init_redis, close_redis
+from src.database.replicas import replicas
+from src.servises.avatars import avatar_uploader
+from src.servises.birthday_digest import birthday_digest
+from src.servises.email import templates
+from src.servises.mail_worker import mail_worker
+from src.servises.metrics import MetricsMiddleware
+from src.servises.query_log import QueryLogMiddleware
 
 
 app = FastAPI()
@@ -16,10 +24,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if settings1.query_debug:
+    app.add_middleware(QueryLogMiddleware,
+                       max_queries=settings1.query_max_per_request,
+                       repeat_threshold=settings1.query_repeat_threshold)
 
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix="/api")
+app.include_router(metrics.router)
 
 
 @app.on_event("startup")
@@ -29,6 +43,23 @@ async def startup():
                           db=0, encoding="utf-8",
                           decode_responses=True)
     await FastAPILimiter.init(r)
+    templates.load()
+    avatar_uploader.start()
+    cache = await init_redis()
+    replicas.start(settings1.replica_health_interval)
+    if settings1.mail_worker_in_app:
+        mail_worker.start(cache)
+    if settings1.birthday_digest_in_app:
+        birthday_digest.start(cache, settings1.birthday_digest_hour, settings1.birthday_digest_interval)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await birthday_digest.stop()
+    await mail_worker.stop()
+    await avatar_uploader.stop()
+    await replicas.stop()
+    await close_redis()
 
 
 @app.get("/")
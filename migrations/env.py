@@ -22,6 +22,17 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL)
 
+# the search index is created by migration a0aecb466e2c outside the models:
+# the SQLite FTS5 table with its shadow tables and the PostgreSQL trigram index
+SEARCH_INDEX_OBJECTS = {'contacts_fts', 'contacts_fts_config', 'contacts_fts_data', 'contacts_fts_idx',
+                        'contacts_fts_docsize', 'ix_contacts_search_trgm'}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Keep the search index out of autogenerate and alembic check."""
+    return name not in SEARCH_INDEX_OBJECTS
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -44,6 +55,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -67,7 +79,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,24 @@
+"""'Contacts_keyset_index'
+
+Revision ID: 148fc7f69288
+Revises: 805aee56cb3f
+Create Date: 2026-10-17 10:12:41.530918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '148fc7f69288'
+down_revision: Union[str, None] = '805aee56cb3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_lastname_name_id', 'contacts', ['user_id', 'lastname', 'name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_lastname_name_id', table_name='contacts')
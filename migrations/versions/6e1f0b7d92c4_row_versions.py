@@ -0,0 +1,34 @@
+"""'Row_versions'
+
+Revision ID: 6e1f0b7d92c4
+Revises: a0aecb466e2c
+Create Date: 2026-10-17 15:42:18.311027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '6e1f0b7d92c4'
+down_revision: Union[str, None] = 'a0aecb466e2c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('contacts', 'users'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+        # SQLite cannot add a column with a non-constant default, the column is filled and
+        # tightened separately there, new rows get updated_at from the model
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP")
+        if op.get_bind().dialect.name != 'sqlite':
+            op.alter_column(table, 'updated_at', nullable=False, server_default=sa.text('CURRENT_TIMESTAMP'))
+
+
+def downgrade() -> None:
+    for table in ('users', 'contacts'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
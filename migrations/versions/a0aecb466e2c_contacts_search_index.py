@@ -0,0 +1,52 @@
+"""'Contacts_search_index'
+
+Revision ID: a0aecb466e2c
+Revises: dc4b388f0165
+Create Date: 2026-10-17 13:41:52.208377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = 'a0aecb466e2c'
+down_revision: Union[str, None] = 'dc4b388f0165'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_DOCUMENT = "lower(name || ' ' || lastname || ' ' || email || ' ' || phone)"
+CONTACTS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "name, lastname, email, phone, content='contacts', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, name, lastname, email, phone) "
+    "VALUES (new.id, new.name, new.lastname, new.email, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, lastname, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.lastname, old.email, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, lastname, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.lastname, old.email, old.phone); "
+    "INSERT INTO contacts_fts(rowid, name, lastname, email, phone) "
+    "VALUES (new.id, new.name, new.lastname, new.email, new.phone); END",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in CONTACTS_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+    else:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(f"CREATE INDEX ix_contacts_search_trgm ON contacts USING gin (({SEARCH_DOCUMENT}) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('contacts_fts_insert', 'contacts_fts_delete', 'contacts_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS contacts_fts")
+    else:
+        op.execute("DROP INDEX IF EXISTS ix_contacts_search_trgm")
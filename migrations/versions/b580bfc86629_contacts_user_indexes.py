@@ -0,0 +1,24 @@
+"""'Contacts_user_indexes'
+
+Revision ID: b580bfc86629
+Revises: 148fc7f69288
+Create Date: 2026-10-17 11:03:27.114052
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = 'b580bfc86629'
+down_revision: Union[str, None] = '148fc7f69288'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_birthday', 'contacts', ['user_id', 'birthday'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday', table_name='contacts')
@@ -0,0 +1,35 @@
+"""'Contacts_birthday_mmdd'
+
+Revision ID: dc4b388f0165
+Revises: b580bfc86629
+Create Date: 2026-10-17 12:20:05.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'dc4b388f0165'
+down_revision: Union[str, None] = 'b580bfc86629'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_mmdd', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET birthday_mmdd = CAST(strftime('%m%d', birthday) AS INTEGER) "
+                   "WHERE birthday IS NOT NULL")
+    else:
+        op.execute("UPDATE contacts SET birthday_mmdd = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) "
+                   "WHERE birthday IS NOT NULL")
+    op.create_index('ix_contacts_user_id_birthday_mmdd', 'contacts', ['user_id', 'birthday_mmdd'], unique=False)
+    op.drop_index('ix_contacts_user_id_birthday', table_name='contacts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_contacts_user_id_birthday', 'contacts', ['user_id', 'birthday'], unique=False)
+    op.drop_index('ix_contacts_user_id_birthday_mmdd', table_name='contacts')
+    op.drop_column('contacts', 'birthday_mmdd')
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 from dotenv import load_dotenv
@@ -14,11 +16,57 @@ class Settings(BaseSettings):
     m_from: str
     m_port: int
     m_server: str
+    m_from_name: str = 'Your assistant'
+    m_starttls: bool = True
+    m_ssl_tls: bool = False
+    m_validate_certs: bool = True
+    mail_worker_in_app: bool = True
+    mail_worker_name: str = ''
+    mail_worker_lease: float = 60
+    mail_smtp_connections: int = 2
+    mail_batch_size: int = 20
+    mail_max_attempts: int = 6
+    mail_retry_base: float = 5
+    mail_retry_max: float = 600
+    mail_idle_timeout: float = 60
+    birthday_digest_in_app: bool = True
+    birthday_digest_hour: int = 8
+    birthday_digest_days: int = 7
+    birthday_digest_batch: int = 500
+    birthday_digest_interval: float = 300
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 0
+    replica_database_urls: str = ''
+    replica_sticky_seconds: int = 10
+    replica_health_interval: float = 5
     redis_host: str = 'localhost'
     redis_port: int
+    redis_max_connections: int = 50
+    bcrypt_rounds: int = 12
+    hash_executor: Literal['thread', 'process'] = 'thread'
+    hash_workers: int = 4
+    hash_max_pending: int = 64
+    token_cache_size: int = 10000
+    search_backend: Literal['auto', 'like', 'fts5', 'postgres'] = 'auto'
+    response_cache_ttl: int = 300
+    response_cache_max_bytes: int = 262144
+    response_cache_max_total_bytes: int = 67108864
+    fast_json_responses: bool = False
+    query_debug: bool = False
+    slow_query_ms: int = 200
+    query_repeat_threshold: int = 3
+    query_max_per_request: int = 20
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    cloudinary_upload_prefix: str = 'https://api.cloudinary.com'
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_upload_concurrency: int = 4
+    avatar_job_ttl: int = 3600
 
     model_config = SettingsConfigDict(
         env_file="../.env", env_file_encoding="utf-8", extra="ignore"
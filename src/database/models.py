@@ -1,11 +1,38 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
-from sqlalchemy.sql.sqltypes import Date
-from sqlalchemy.orm import relationship
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Index, DDL, event, text
+from sqlalchemy.sql.sqltypes import Date, DateTime
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 
+def birthday_key(birthday: Optional[date]) -> Optional[int]:
+    """
+    Month and day of a birthday packed as MMDD, e.g. 229 for February 29.
+
+    :param birthday: Birthday.
+    :type birthday: date | None
+    :return: MMDD number or None.
+    :rtype: int | None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
+def utcnow() -> datetime:
+    """
+    Current UTC time without tzinfo, the way updated_at columns store it.
+
+    :return: Current UTC time.
+    :rtype: datetime
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
 class Contacts(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True)
@@ -14,11 +41,47 @@ class Contacts(Base):
     email = Column(String(50), nullable=False)
     phone = Column(String(50), nullable=False)
     birthday = Column(Date)
+    birthday_mmdd = Column(Integer, nullable=True)
     additional = Column(String(150), nullable=True)
+    # bumped by every UPDATE, ETags and If-Match preconditions are derived from it
+    version = Column(Integer, nullable=False, default=1, server_default=text('1'), onupdate=text('version + 1'))
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, server_default=text('CURRENT_TIMESTAMP'))
 
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("Users", back_populates='contact')
 
+    __table_args__ = (
+        Index('ix_contacts_user_id_lastname_name_id', 'user_id', 'lastname', 'name', 'id'),
+        Index('ix_contacts_user_id_birthday_mmdd', 'user_id', 'birthday_mmdd'),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_mmdd = birthday_key(birthday)
+        return birthday
+
+
+CONTACTS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "name, lastname, email, phone, content='contacts', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, name, lastname, email, phone) "
+    "VALUES (new.id, new.name, new.lastname, new.email, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, lastname, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.lastname, old.email, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, lastname, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.lastname, old.email, old.phone); "
+    "INSERT INTO contacts_fts(rowid, name, lastname, email, phone) "
+    "VALUES (new.id, new.name, new.lastname, new.email, new.phone); END",
+)
+
+# SQLite search index, on PostgreSQL the pg_trgm index is created by Alembic
+for statement in CONTACTS_FTS_DDL:
+    event.listen(Contacts.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Contacts.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
+
 
 class Users(Base):
     __tablename__ = "users"
@@ -28,6 +91,8 @@ class Users(Base):
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
     avatar = Column(String(255), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default=text('1'), onupdate=text('version + 1'))
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, server_default=text('CURRENT_TIMESTAMP'))
 
     contact = relationship("Contacts", back_populates='user')
 
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import redis.asyncio as redis
+
+from ..config.config import settings1
+
+redis_client: Optional[redis.Redis] = None
+
+
+async def init_redis() -> redis.Redis:
+    """
+    Create the shared asyncio Redis client with its connection pool.
+
+    :return: Redis client.
+    :rtype: redis.Redis
+    """
+    global redis_client
+    pool = redis.ConnectionPool(host=settings1.redis_host,
+                                port=settings1.redis_port,
+                                db=0,
+                                max_connections=settings1.redis_max_connections)
+    # the client owns the pool, so aclose() disconnects it too
+    redis_client = redis.Redis.from_pool(pool)
+    return redis_client
+
+
+async def close_redis() -> None:
+    """
+    Close the shared Redis client and disconnect its pool.
+
+    :return: None.
+    :rtype: None
+    """
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+
+# Dependency
+async def get_redis() -> redis.Redis:
+    return redis_client
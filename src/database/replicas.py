@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from ..config.config import settings1
+from ..servises import metrics
+from .db import create_engine_from_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin, a replica failing the health check is skipped until it passes again.
+
+    Reads of a user who wrote within the last sticky_seconds go to the primary, so they see their own writes.
+    The mark is kept in Redis and shared by all workers.
+    """
+
+    def __init__(self, urls: list[str], sticky_seconds: int):
+        self.engines = [create_engine_from_settings(url, f"replica{index}") for index, url in enumerate(urls)]
+        self.sessionmakers = [async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+                              for engine in self.engines]
+        self.healthy = [True] * len(self.engines)
+        self.sticky_seconds = sticky_seconds
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def pick(self) -> Optional[int]:
+        """
+        Pick the next healthy replica round-robin.
+
+        :return: Index of the replica, None if there is no healthy one.
+        :rtype: int | None
+        """
+        for _ in range(len(self.engines)):
+            index = next(self._counter) % len(self.engines)
+            if self.healthy[index]:
+                return index
+        return None
+
+    async def check(self, timeout: float = 2.0) -> list[bool]:
+        """
+        Run SELECT 1 on every replica and update which of them are healthy.
+
+        :param timeout: Seconds to wait for a replica.
+        :type timeout: float
+        :return: Health of every replica.
+        :rtype: list[bool]
+        """
+        async def ping(index: int) -> bool:
+            try:
+                async with asyncio.timeout(timeout):
+                    async with self.engines[index].connect() as conn:
+                        await conn.execute(text("SELECT 1"))
+                return True
+            except (SQLAlchemyError, OSError, TimeoutError) as error:
+                logger.warning("Replica %s failed the health check: %s", index, error)
+                return False
+
+        self.healthy = list(await asyncio.gather(*(ping(index) for index in range(len(self.engines)))))
+        for index, healthy in enumerate(self.healthy):
+            metrics.DB_REPLICA_HEALTHY.labels(pool=f"replica{index}").set(int(healthy))
+        return self.healthy
+
+    async def run_health_checks(self, interval: float) -> None:
+        """
+        Check the replicas every interval seconds until cancelled.
+
+        :param interval: Seconds between checks.
+        :type interval: float
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float) -> None:
+        """
+        Start the health checks in the background, nothing to do without replicas.
+
+        :param interval: Seconds between checks.
+        :type interval: float
+        :return: None.
+        :rtype: None
+        """
+        if self.engines and self._task is None:
+            self._task = asyncio.create_task(self.run_health_checks(interval))
+
+    async def stop(self) -> None:
+        """
+        Stop the health checks, waiting for a running check to be cancelled, and close the replicas' pools.
+
+        :return: None.
+        :rtype: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+    @staticmethod
+    def sticky_key(username: str) -> str:
+        """
+        Build the Redis key marking a user's recent write.
+
+        :param username: User's email.
+        :type username: str
+        :return: Redis key.
+        :rtype: str
+        """
+        return f"rw:{username}"
+
+    async def mark_write(self, username: str, cache: Optional[redis.Redis]) -> None:
+        """
+        Send the user's reads to the primary for the next sticky_seconds.
+
+        :param username: User's email.
+        :type username: str
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :return: None.
+        :rtype: None
+        """
+        if not self.engines or cache is None:
+            return
+        try:
+            await cache.set(self.sticky_key(username), 1, ex=self.sticky_seconds)
+        except redis.RedisError as error:
+            logger.warning("Could not mark the write of %s: %s", username, error)
+
+    async def is_sticky(self, username: str, cache: Optional[redis.Redis]) -> bool:
+        """
+        Check if the user wrote within the last sticky_seconds, without Redis it is assumed they did.
+
+        :param username: User's email.
+        :type username: str
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :return: True if the reads have to go to the primary.
+        :rtype: bool
+        """
+        if cache is None:
+            return True
+        try:
+            return await cache.get(self.sticky_key(username)) is not None
+        except redis.RedisError:
+            return True
+
+    @asynccontextmanager
+    async def session(self, username: str, cache: Optional[redis.Redis],
+                      primary: AsyncSession) -> AsyncIterator[AsyncSession]:
+        """
+        Session for the user's read-only queries: a healthy replica, else the given primary session.
+
+        :param username: User's email.
+        :type username: str
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param primary: Session of the primary, it is not closed here.
+        :type primary: AsyncSession
+        :return: Session to read with.
+        :rtype: AsyncIterator[AsyncSession]
+        """
+        index = None
+        if self.engines and not await self.is_sticky(username, cache):
+            index = self.pick()
+        if index is None:
+            yield primary
+            return
+        async with self.sessionmakers[index]() as db:
+            yield db
+
+
+replicas = ReplicaSet([url.strip() for url in settings1.replica_database_urls.split(",") if url.strip()],
+                      sticky_seconds=settings1.replica_sticky_seconds)
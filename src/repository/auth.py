@@ -1,65 +1,149 @@
 from typing import Optional
-import redis
-import pickle
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import redis.asyncio as redis
 from datetime import datetime, timedelta, timezone
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.config.config import settings1
 from src.database.db import get_db
+from src.database.redis_db import get_redis
+from src.database.replicas import replicas
 from src.database.models import Users
+from src.schemas import UserCache
+from src.servises import metrics
+from src.servises.token_cache import TokenCache
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings1.bcrypt_rounds)
+
+
+def hash_password(password: str) -> str:
+    """
+    Convert user's password into hash, runs inside the hash worker pool.
+
+    :param password: User's password.
+    :type password: str
+    :return: Resulting hash.
+    :rtype: str
+    """
+    return pwd_context.hash(password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Verify the password and rehash it when the stored hash is deprecated, runs inside the hash worker pool.
+
+    :param plain_password: User`s password.
+    :type plain_password: str
+    :param hashed_password: Hashed user's password.
+    :type hashed_password: str
+    :return: Verification result and new hash, or None if the stored hash is still up to date.
+    :rtype: tuple[bool, str | None]
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 
 class Hash:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    
-    def verify_password(self, plain_password, hashed_password):
-        """
-        It will check whether the password verifies against the hash.
+    executor: Optional[Executor] = None
+    pending = 0
 
-        :param plain_password: User`s password.
-        :type plain_password: str
-        :param hashed_password: Hashed user's password.
-        :type hashed_password: str
-        :return: True or False.
-        :rtype: bool
+    @classmethod
+    def get_executor(cls) -> Executor:
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        Create the hash worker pool on first use, thread or process pool by settings.
 
-    def get_password_hash(self, password: str):
+        :return: Executor.
+        :rtype: Executor
+        """
+        if cls.executor is None:
+            if settings1.hash_executor == 'process':
+                cls.executor = ProcessPoolExecutor(max_workers=settings1.hash_workers)
+            else:
+                cls.executor = ThreadPoolExecutor(max_workers=settings1.hash_workers, thread_name_prefix='hash')
+        return cls.executor
+
+    async def run_in_pool(self, func, *args):
         """
-        Convert user's password into hash.
+        Run a hashing function in the worker pool, reject the call when too many are pending.
+
+        :param func: Hashing function.
+        :type func: Callable
+        :param args: Function arguments.
+        :type args: tuple
+        :return: Function result.
+        :rtype: Any
+        """
+        if Hash.pending >= settings1.hash_max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail='Too many requests, try again later',
+                                headers={"Retry-After": "1"})
+        Hash.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.get_executor(), func, *args)
+        finally:
+            Hash.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Convert user's password into hash off the event loop.
 
         :param password: User's password.
         :type password: str
         :return: Resulting hash.
         :rtype: str
         """
-        return self.pwd_context.hash(password)
+        return await self.run_in_pool(hash_password, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        Verify the password off the event loop, return a new hash when the stored one is deprecated.
+
+        :param plain_password: User`s password.
+        :type plain_password: str
+        :param hashed_password: Hashed user's password.
+        :type hashed_password: str
+        :return: Verification result and new hash, or None if the stored hash is still up to date.
+        :rtype: tuple[bool, str | None]
+        """
+        return await self.run_in_pool(verify_and_update_password, plain_password, hashed_password)
 
 
 SECRET_KEY = "secret_key"
 ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-r = redis.Redis(host='localhost', port=6379, db=0)
+USER_CACHE_TTL = 900
+USER_CACHE_VERSION = 2
+token_cache = TokenCache(maxsize=settings1.token_cache_size)
+user_cache_stats = metrics.CacheStats()
+metrics.cache_collector.add('jwt', token_cache)
+metrics.cache_collector.add('user', user_cache_stats)
+# jobs beyond hash_workers wait in the executor's queue
+metrics.HASH_QUEUE_DEPTH.set_function(lambda: max(0, Hash.pending - settings1.hash_workers))
 
 
-async def get_user_by_email(email: str, db: Session) -> Users:
+async def get_user_by_email(email: str, db: AsyncSession) -> Users:
     """
     Get user by user's email with sql query.
 
     :param email: User's email.
     :type email: str
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: User.
     :rtype: Users
     """
-    return db.query(Users).filter(Users.username == email).first()
+    result = await db.execute(select(Users).filter(Users.username == email))
+    return result.scalar_one_or_none()
 
 
 async def create_access_token(data: dict, expires_delta: Optional[float] = None):
@@ -124,16 +208,91 @@ async def get_username_from_refresh_token(refresh_token: str):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
     
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def user_cache_key(username: str) -> str:
+    """
+    Build the Redis key of the cached user, tagged with the cache format version.
+
+    :param username: User's email.
+    :type username: str
+    :return: Redis key.
+    :rtype: str
+    """
+    return f"user:v{USER_CACHE_VERSION}:{username}"
+
+
+def dump_cached_user(user: UserCache) -> bytes:
+    """
+    Serialize the fields auth needs into a compact JSON entry.
+
+    :param user: Projection of the user.
+    :type user: UserCache
+    :return: Cache entry.
+    :rtype: bytes
+    """
+    return user.model_dump_json().encode()
+
+
+def load_cached_user(data: bytes) -> Optional[UserCache]:
+    """
+    Deserialize a cache entry, entries that do not match the current format are treated as a miss.
+
+    :param data: Cache entry.
+    :type data: bytes
+    :return: Cached user or None.
+    :rtype: UserCache | None
+    """
+    try:
+        return UserCache.model_validate_json(data)
+    except ValidationError:
+        return None
+
+
+async def invalidate_cached_user(username: str, cache: redis.Redis) -> None:
+    """
+    Drop the cached user, so the next request reloads it from the database.
+
+    :param username: User's email.
+    :type username: str
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: None.
+    :rtype: None
+    """
+    await cache.delete(user_cache_key(username))
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Decode the token, claims of tokens verified before are taken from the in-process cache.
+
+    :param token: User's token.
+    :type token: str
+    :return: Decoded claims.
+    :rtype: dict
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.set(token, payload)
+    return payload
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_db),
+                           cache: redis.Redis = Depends(get_redis)):
     """
-    Get username by decoded token, return user by function get_user_by_email.
+    Get username by decoded token, return user from the Redis cache or by function get_user_by_email.
+
+    On a cache miss the user is read from a replica unless they wrote within the sticky window.
 
     :param token: User's token.
     :type token: str
     :param db: The database session.
-    :type db: Session
-    :return: User.
-    :rtype: Users
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: Cached projection of the user.
+    :rtype: UserCache
     """
     credentials_exeption = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -142,7 +301,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         if payload['scope'] == 'access_token':
             username = payload['sub']
             if username is None:
@@ -152,32 +311,58 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exeption
     
-    user = r.get(f"user:{username}")
-    if user is None:
-        user = await get_user_by_email(username, db)
-        if user is None:
-            raise credentials_exeption
-        r.set(f"user:{username}", pickle.dumps(user))
-        r.expire(f"user:{username}", 900)
-    else:
-        user = pickle.loads(user)
+    key = user_cache_key(username)
+    with metrics.REDIS_DURATION.labels(command='get').time():
+        data = await cache.get(key)
+    user = load_cached_user(data) if data is not None else None
+    if user is not None:
+        user_cache_stats.hits += 1
+        return user
+
+    user_cache_stats.misses += 1
+    async with replicas.session(username, cache, db) as read_db:
+        db_user = await get_user_by_email(username, read_db)
+    if db_user is None:
+        raise credentials_exeption
+    user = UserCache.model_validate(db_user)
+    with metrics.REDIS_DURATION.labels(command='set').time():
+        await cache.set(key, dump_cached_user(user), ex=USER_CACHE_TTL)
     return user
 
 
-async def confirmed_email(email: str, db: Session = Depends(get_db)) -> None:
+async def get_read_db(current_user: UserCache = Depends(get_current_user),
+                      db: AsyncSession = Depends(get_db),
+                      cache: redis.Redis = Depends(get_redis)):
+    """
+    Session for read-only endpoints: a read replica, or the primary within the sticky window after the user wrote.
+
+    :param current_user: The authenticated user.
+    :type current_user: UserCache
+    :param db: The primary database session.
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: Session to read with.
+    :rtype: AsyncSession
+    """
+    async with replicas.session(current_user.username, cache, db) as read_db:
+        yield read_db
+
+
+async def confirmed_email(email: str, db: AsyncSession = Depends(get_db)) -> None:
     """
     Get username by email, change field "confirmed" to True.
 
     :param email: User's email.
     :type email: str
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: None.
     :rtype: None
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
 
 
 def create_email_token(data: dict):
@@ -214,7 +399,7 @@ async def get_email_from_token(token: str):
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid token for email verification")
 
 
-async def update_avatar(email, url: str, db: Session) -> Users:
+async def update_avatar(email, url: str, db: AsyncSession) -> Optional[Users]:
     """
     Get user by email, update field "avatar" to new url.
 
@@ -223,11 +408,13 @@ async def update_avatar(email, url: str, db: Session) -> Users:
     :param url: Avatar's url.
     :type url: str
     :param db: The database session.
-    :type db: Session
-    :return: User.
-    :rtype: Users
+    :type db: AsyncSession
+    :return: User, None if there is no user with this email.
+    :rtype: Users | None
     """
     user = await get_user_by_email(email, db)
+    if user is None:
+        return None
     user.avatar = url
-    db.commit()
+    await db.commit()
     return user
\ No newline at end of file
@@ -1,13 +1,20 @@
-from datetime import datetime, timedelta
+import base64
+import calendar
+import json
+from datetime import date, datetime, timedelta
+from typing import Optional
 
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, select, tuple_, insert, update, delete
 
-from src.database.models import Contacts, Users
-from src.schemas import ContactCreate, ContactUpdate
+from src.database.models import Contacts, Users, birthday_key
+from src.schemas import Contact, ContactCreate, ContactUpdate, ContactPatch, ContactOperation, OperationResult
+from src.repository.search import get_search_backend
 
+CONTACT_FIELDS = tuple(Contact.model_fields)
 
-async def get_contacts(skip: int, limit: int, user: Users, db: Session):
+
+async def get_contacts(skip: int, limit: int, user: Users, db: AsyncSession):
     """
     Display a list of contacts for a specific user with specified pagination parameters.
 
@@ -18,14 +25,157 @@ async def get_contacts(skip: int, limit: int, user: Users, db: Session):
     :param user: The user to retrieve contacts for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: A list of Conatcts.
     :rtype: List[Conatcts]
     """
-    return db.query(Contacts).filter(Contacts.user_id == user.id).offset(skip).limit(limit).all()
+    stmt = select(Contacts).filter(Contacts.user_id == user.id).offset(skip).limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+def contacts_page(columns, skip: int, after: Optional[tuple[str, str, int]], limit: int, user: Users,
+                  keyset: bool = False):
+    """
+    Build the query of the page get_contacts or get_contacts_after would return, selecting only the given columns.
+
+    :param columns: Columns to select.
+    :type columns: Iterable[Column]
+    :param skip: The number of contacts to skip, ignored for keyset pages.
+    :type skip: int
+    :param after: Sort key of the last contact of the previous page, for keyset pages.
+    :type after: tuple[str, str, int] | None
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: Users
+    :param keyset: Mirror get_contacts_after instead of get_contacts.
+    :type keyset: bool
+    :return: Select statement.
+    :rtype: Select
+    """
+    stmt = select(*columns).filter(Contacts.user_id == user.id)
+    if not keyset:
+        return stmt.offset(skip).limit(limit)
+    if after is not None:
+        stmt = stmt.filter(tuple_(Contacts.lastname, Contacts.name, Contacts.id) > tuple_(*after))
+    return stmt.order_by(Contacts.lastname, Contacts.name, Contacts.id).limit(limit)
+
+
+async def get_contacts_validators(skip: int, after: Optional[tuple[str, str, int]], limit: int, user: Users,
+                                  db: AsyncSession, keyset: bool = False):
+    """
+    Fetch only the id, version, updated_at and sort key of a page of contacts.
 
+    Enough to compute the page's ETag and answer a conditional request without loading and serializing the contacts.
 
-async def get_contact(contact_id: int, user: Users, db: Session):
+    :param skip: The number of contacts to skip, ignored for keyset pages.
+    :type skip: int
+    :param after: Sort key of the last contact of the previous page, for keyset pages.
+    :type after: tuple[str, str, int] | None
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :param keyset: Mirror get_contacts_after instead of get_contacts.
+    :type keyset: bool
+    :return: Rows with id, version, updated_at, lastname and name.
+    :rtype: List[Row]
+    """
+    columns = (Contacts.id, Contacts.version, Contacts.updated_at, Contacts.lastname, Contacts.name)
+    result = await db.execute(contacts_page(columns, skip, after, limit, user, keyset))
+    return result.all()
+
+
+async def get_contacts_rows(skip: int, after: Optional[tuple[str, str, int]], limit: int, user: Users,
+                            db: AsyncSession, keyset: bool = False):
+    """
+    Fetch a page of contacts as plain rows of the Contact fields, without building ORM objects.
+
+    :param skip: The number of contacts to skip, ignored for keyset pages.
+    :type skip: int
+    :param after: Sort key of the last contact of the previous page, for keyset pages.
+    :type after: tuple[str, str, int] | None
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :param keyset: Mirror get_contacts_after instead of get_contacts.
+    :type keyset: bool
+    :return: Rows with the CONTACT_FIELDS columns in that order, then version and updated_at.
+    :rtype: List[Row]
+    """
+    columns = [getattr(Contacts, field) for field in CONTACT_FIELDS] + [Contacts.version, Contacts.updated_at]
+    result = await db.execute(contacts_page(columns, skip, after, limit, user, keyset))
+    return result.all()
+
+
+def encode_cursor(contact: Contacts) -> str:
+    """
+    Build an opaque cursor pointing right after the given contact.
+
+    :param contact: The last contact of the page.
+    :type contact: Contacts
+    :return: Url-safe cursor string.
+    :rtype: str
+    """
+    raw = json.dumps([contact.lastname, contact.name, contact.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[tuple[str, str, int]]:
+    """
+    Decode a cursor made by encode_cursor, an empty cursor means the first page.
+
+    :param cursor: Cursor string.
+    :type cursor: str
+    :return: Sort key (lastname, name, id) of the last seen contact, or None.
+    :rtype: tuple[str, str, int] | None
+    :raises ValueError: If the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        lastname, name, contact_id = json.loads(raw)
+    except (ValueError, TypeError) as error:
+        raise ValueError('Invalid cursor') from error
+    if not isinstance(lastname, str) or not isinstance(name, str) or not isinstance(contact_id, int):
+        raise ValueError('Invalid cursor')
+    return lastname, name, contact_id
+
+
+async def get_contacts_after(after: Optional[tuple[str, str, int]], limit: int, user: Users, db: AsyncSession):
+    """
+    Display a page of contacts for a specific user ordered by (lastname, name, id), starting after the given key.
+
+    Unlike offset pagination the database seeks straight to the key using
+    the (user_id, lastname, name, id) index, so deep pages cost the same as the first one.
+
+    :param after: Sort key of the last contact of the previous page, None for the first page.
+    :type after: tuple[str, str, int] | None
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: A list of Contacts.
+    :rtype: List[Contacts]
+    """
+    stmt = select(Contacts).filter(Contacts.user_id == user.id)
+    if after is not None:
+        stmt = stmt.filter(tuple_(Contacts.lastname, Contacts.name, Contacts.id) > tuple_(*after))
+    stmt = stmt.order_by(Contacts.lastname, Contacts.name, Contacts.id).limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def get_contact(contact_id: int, user: Users, db: AsyncSession):
     """
     Display a single contact with the specified ID for a specific user.
 
@@ -34,14 +184,35 @@ async def get_contact(contact_id: int, user: Users, db: Session):
     :param user: The user to retrieve the contact for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Conatcts | None
     """
-    return db.query(Contacts).filter(and_(Contacts.id == contact_id, Contacts.user_id == user.id)).first()
+    stmt = select(Contacts).filter(and_(Contacts.id == contact_id, Contacts.user_id == user.id))
+    result = await db.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+async def get_contact_validator(contact_id: int, user: Users, db: AsyncSession):
+    """
+    Fetch only the version and updated_at of a single contact with the specified ID for a specific user.
+
+    :param contact_id: The ID of the contact.
+    :type contact_id: int
+    :param user: The user the contact belongs to.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Row with id, version and updated_at, or None if the contact does not exist.
+    :rtype: Row | None
+    """
+    stmt = select(Contacts.id, Contacts.version, Contacts.updated_at)\
+        .filter(and_(Contacts.id == contact_id, Contacts.user_id == user.id))
+    result = await db.execute(stmt)
+    return result.one_or_none()
 
 
-async def create_contact(body: ContactCreate, user: Users, db: Session):
+async def create_contact(body: ContactCreate, user: Users, db: AsyncSession):
     """
     Creates a new contact for a specific user.
 
@@ -50,19 +221,92 @@ async def create_contact(body: ContactCreate, user: Users, db: Session):
     :param user: The user to create the contact for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The newly created contact.
     :rtype: Contacts
     """
 
-    contact = Contacts(**body.dict(), user_id=user.id)
+    contact = Contacts(**body.model_dump(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
     return contact
 
 
-async def remove_contact(contact_id: int, user: Users, db: Session):
+async def create_contacts(bodies: list[ContactCreate], user: Users, db: AsyncSession) -> int:
+    """
+    Creates many contacts for a specific user with one executemany insert and one commit.
+
+    :param bodies: The data for the contacts to create.
+    :type bodies: list[ContactCreate]
+    :param user: The user to create the contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of created contacts.
+    :rtype: int
+    """
+    if not bodies:
+        return 0
+    rows = [dict(body.model_dump(), birthday_mmdd=birthday_key(body.birthday), user_id=user.id) for body in bodies]
+    await db.execute(insert(Contacts), rows)
+    await db.commit()
+    return len(rows)
+
+
+async def apply_operations(operations: list[ContactOperation], user: Users, db: AsyncSession) -> list[OperationResult]:
+    """
+    Applies a batch of create, update and delete operations for a specific user in one transaction.
+
+    All update and delete targets are loaded with a single IN query, the changes are flushed
+    together by the unit of work (batched INSERT, UPDATE and DELETE) and committed once.
+    Operations on contacts that do not exist, or were deleted earlier in the batch, fail with 404
+    without affecting the others.
+
+    :param operations: Operations in the order to apply them.
+    :type operations: list[ContactOperation]
+    :param user: The user to change the contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: One result per operation, in the same order.
+    :rtype: list[OperationResult]
+    """
+    ids = {operation.id for operation in operations if operation.op != 'create'}
+    contacts = {}
+    if ids:
+        stmt = select(Contacts).filter(and_(Contacts.user_id == user.id, Contacts.id.in_(ids)))
+        contacts = {contact.id: contact for contact in (await db.execute(stmt)).scalars()}
+
+    applied = []
+    results = []
+    for index, operation in enumerate(operations):
+        if operation.op == 'create':
+            contact = Contacts(**operation.data.model_dump(), user_id=user.id)
+            db.add(contact)
+            status_code = 201
+        else:
+            contact = contacts.get(operation.id)
+            if contact is None:
+                results.append(OperationResult(index=index, op=operation.op, status=404, detail='Contact not found'))
+                continue
+            if operation.op == 'update':
+                for field, value in operation.data.model_dump().items():
+                    setattr(contact, field, value)
+            else:
+                await db.delete(contact)
+                del contacts[operation.id]
+            status_code = 200
+        applied.append((index, operation.op, status_code, contact))
+        results.append(None)
+
+    await db.commit()
+    for index, op, status_code, contact in applied:
+        results[index] = OperationResult(index=index, op=op, status=status_code, contact=contact)
+    return results
+
+
+async def remove_contact(contact_id: int, user: Users, db: AsyncSession, versions: Optional[list[int]] = None):
     """
     Removes a single contact with the specified ID for a specific user.
 
@@ -71,19 +315,21 @@ async def remove_contact(contact_id: int, user: Users, db: Session):
     :param user: The user to remove the contact for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
-    :return: The removed contact, or None if it does not exist.
+    :type db: AsyncSession
+    :param versions: Remove the contact only if its version is one of these, None for any version.
+    :type versions: list[int] | None
+    :return: The removed contact, or None if it does not exist or its version does not match.
     :rtype: Contacts | None
     """
-    contact = db.query(Contacts).filter(and_(Contacts.id == contact_id, Contacts.user_id == user.id)).first()
-    if contact:
-
-        db.delete(contact)
-        db.commit()
+    stmt = delete(Contacts).where(contact_filter(contact_id, user, versions)).returning(Contacts)
+    result = await db.execute(stmt)
+    contact = result.scalar_one_or_none()
+    await db.commit()
     return contact
 
 
-async def update_contact(contact_id: int, body: ContactUpdate, user: Users, db: Session):
+async def update_contact(contact_id: int, body: ContactUpdate, user: Users, db: AsyncSession,
+                         versions: Optional[list[int]] = None):
     """
     Updates a single contact with the specified ID for a specific user.
 
@@ -94,59 +340,150 @@ async def update_contact(contact_id: int, body: ContactUpdate, user: Users, db:
     :param user: The user to update the contact for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
-    :return: The updated contact, or None if it does not exist.
+    :type db: AsyncSession
+    :param versions: Update the contact only if its version is one of these, None for any version.
+    :type versions: list[int] | None
+    :return: The updated contact, or None if it does not exist or its version does not match.
     :rtype: Contacts | None
     """
-    contact = db.query(Contacts).filter(and_(Contacts.id == contact_id, Contacts.user_id == user.id)).first()
-    if contact:
-        contact.name = body.name
-        contact.lastname = body.lastname
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.birthday = body.birthday
-        contact.additional = body.additional
-        db.commit()
+    return await write_contact(contact_id, body.model_dump(), user, db, versions)
+
+
+async def patch_contact(contact_id: int, body: ContactPatch, user: Users, db: AsyncSession,
+                        versions: Optional[list[int]] = None):
+    """
+    Updates only the fields sent in the request of a single contact with the specified ID for a specific user.
+
+    :param contact_id: The ID of the contact to update.
+    :type contact_id: int
+    :param body: The fields to change.
+    :type body: ContactPatch
+    :param user: The user to update the contact for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :param versions: Update the contact only if its version is one of these, None for any version.
+    :type versions: list[int] | None
+    :return: The updated contact, or None if it does not exist or its version does not match.
+    :rtype: Contacts | None
+    """
+    values = body.model_dump(exclude_unset=True)
+    if not values:
+        contact = await get_contact(contact_id, user, db)
+        if contact is not None and versions is not None and contact.version not in versions:
+            return None
+        return contact
+    return await write_contact(contact_id, values, user, db, versions)
+
+
+def contact_filter(contact_id: int, user: Users, versions: Optional[list[int]] = None):
+    """
+    WHERE clause selecting one contact of a specific user, optionally only at the given versions.
+
+    :param contact_id: The ID of the contact.
+    :type contact_id: int
+    :param user: The user the contact belongs to.
+    :type user: Users
+    :param versions: Allowed versions, None for any version.
+    :type versions: list[int] | None
+    :return: Filter expression.
+    :rtype: ColumnElement[bool]
+    """
+    clause = and_(Contacts.id == contact_id, Contacts.user_id == user.id)
+    if versions is not None:
+        clause = and_(clause, Contacts.version.in_(versions))
+    return clause
+
+
+async def write_contact(contact_id: int, values: dict, user: Users, db: AsyncSession,
+                        versions: Optional[list[int]] = None):
+    """
+    Writes the given columns of a contact with one UPDATE ... RETURNING, the row is not loaded first.
+
+    version and updated_at are bumped in the same statement by their columns' onupdate.
+
+    :param contact_id: The ID of the contact to update.
+    :type contact_id: int
+    :param values: Column values to set.
+    :type values: dict
+    :param user: The user to update the contact for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :param versions: Update the contact only if its version is one of these, None for any version.
+    :type versions: list[int] | None
+    :return: The updated contact, or None if it does not exist or its version does not match.
+    :rtype: Contacts | None
+    """
+    if 'birthday' in values:
+        values['birthday_mmdd'] = birthday_key(values['birthday'])
+    stmt = (update(Contacts).where(contact_filter(contact_id, user, versions))
+            .values(**values).returning(Contacts))
+    result = await db.execute(stmt)
+    contact = result.scalar_one_or_none()
+    await db.commit()
     return contact
 
 
-async def get_birthdays(user: Users, db: Session):
+def birthday_window(today: date, days: int):
+    """
+    Build the filter for birthdays from today to today + days inclusive on the MMDD column.
+
+    A window that crosses Dec 31 wraps to the start of the year. In a non leap year
+    February 29 birthdays are celebrated on February 28.
+
+    :param today: First day of the window.
+    :type today: date
+    :param days: Window length in days after today.
+    :type days: int
+    :return: SQL filter expression.
+    :rtype: ColumnElement[bool]
     """
-    Display a list of contacts that have a birthday in 7 days period for a specific user.
+    if days >= 365:
+        return Contacts.birthday_mmdd.is_not(None)
+    last = today + timedelta(days=days)
+    start, end = birthday_key(today), birthday_key(last)
+    if end == 228 and not calendar.isleap(last.year):
+        end = 229
+    if start <= end:
+        return Contacts.birthday_mmdd.between(start, end)
+    return or_(Contacts.birthday_mmdd >= start, Contacts.birthday_mmdd <= end)
+
+
+async def get_birthdays(user: Users, db: AsyncSession, days: int = 7):
+    """
+    Display a list of contacts that have a birthday in the next days for a specific user.
 
     :param user: The user to find the contacts birthday for.
     :type user: Users
     :param db: The database session.
-    :type db: Session
-    :return: A list of contacts that have a birthday in 7 days period.
+    :type db: AsyncSession
+    :param days: Window length in days after today, default = 7.
+    :type days: int
+    :return: A list of contacts that have a birthday in the given period.
     :rtype: List[Contacts]
     """
     today = datetime.today().date()
-    offset = today + timedelta(days=7)
-    result = db.query(Contacts).filter(and_(Contacts.user_id == user.id, Contacts.birthday.between(today, offset))).all()
-    return result
+    stmt = select(Contacts).filter(and_(Contacts.user_id == user.id, birthday_window(today, days)))
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 
-async def search_contacts(query: str, user: Users, db: Session):
+async def search_contacts(query: str, user: Users, db: AsyncSession, limit: int = 50):
     """
-    Display a list of contacts for a specific user with specific sql query.
+    Display a list of contacts for a specific user matching the search string, best matches first.
+
+    Name, lastname, email and phone are searched by the backend picked by get_search_backend.
 
-    :param query: Sql query string.
+    :param query: Search string.
     :type query: str
     :param user: The user to find the contacts.
     :type user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param limit: The maximum number of contacts to return, default = 50.
+    :type limit: int
     :return: A list of contacts.
     :rtype: List[Contacts]
     """
-    result = db.query(Contacts).filter(and_(
-            Contacts.user_id == user.id,
-            or_(
-                (Contacts.name.ilike(f"%{query}%")),
-                (Contacts.lastname.ilike(f"%{query}%")),
-                (Contacts.email.ilike(f"%{query}%"))
-            ))).all()
-    return result
-
-
+    return await get_search_backend(db).search(query, user, db, limit)
@@ -0,0 +1,144 @@
+import re
+from abc import ABC, abstractmethod
+
+from sqlalchemy import and_, or_, select, func, case, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import table, column
+
+from src.config.config import settings1
+from src.database.models import Contacts, Users
+
+contacts_fts = table('contacts_fts', column('rowid'))
+LIKE_ESCAPE = '!'
+
+
+def escape_like(query: str) -> str:
+    """
+    Escape LIKE wildcards in the user's query.
+
+    :param query: Search string.
+    :type query: str
+    :return: Escaped search string, LIKE_ESCAPE is the escape character.
+    :rtype: str
+    """
+    return query.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace('%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_')
+
+
+class SearchBackend(ABC):
+    """
+    Contact search for a specific user, returns the best matches first.
+    """
+
+    @abstractmethod
+    async def search(self, query: str, user: Users, db: AsyncSession, limit: int):
+        """
+        Find the user's contacts matching the query.
+
+        :param query: Search string.
+        :type query: str
+        :param user: The user to search the contacts of.
+        :type user: Users
+        :param db: The database session.
+        :type db: AsyncSession
+        :param limit: Maximal number of contacts.
+        :type limit: int
+        :return: Matching contacts, best first.
+        :rtype: List[Contacts]
+        """
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Portable fallback: substring match on name, lastname, email and phone, prefix matches ranked first.
+    """
+
+    async def search(self, query: str, user: Users, db: AsyncSession, limit: int):
+        contains = f"%{escape_like(query)}%"
+        prefix = f"{escape_like(query)}%"
+        fields = (Contacts.name, Contacts.lastname, Contacts.email, Contacts.phone)
+        rank = case((or_(*(field.ilike(prefix, escape=LIKE_ESCAPE) for field in fields)), 1), else_=0)
+        stmt = select(Contacts).filter(and_(
+            Contacts.user_id == user.id,
+            or_(*(field.ilike(contains, escape=LIKE_ESCAPE) for field in fields))
+        )).order_by(rank.desc(), Contacts.lastname, Contacts.name, Contacts.id).limit(limit)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 index over name, lastname, email and phone, every word is matched as a prefix and ranked by bm25.
+    """
+
+    @staticmethod
+    def match_query(query: str) -> str:
+        """
+        Turn the user's query into an FTS5 expression of quoted prefix terms.
+
+        :param query: Search string.
+        :type query: str
+        :return: FTS5 MATCH expression, empty if the query has no words.
+        :rtype: str
+        """
+        return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', query))
+
+    async def search(self, query: str, user: Users, db: AsyncSession, limit: int):
+        match = self.match_query(query)
+        if not match:
+            return []
+        fts = literal_column('contacts_fts')
+        stmt = select(Contacts).join(contacts_fts, contacts_fts.c.rowid == Contacts.id).filter(and_(
+            fts.op('MATCH')(match),
+            Contacts.user_id == user.id
+        )).order_by(func.bm25(fts), Contacts.id).limit(limit)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+
+class PostgresTrigramSearchBackend(SearchBackend):
+    """
+    pg_trgm GIN index over the lowercased name, lastname, email and phone.
+
+    Substring and fuzzy (trigram similarity) matches are both served by the index,
+    prefix matches on a single field are ranked first, then by similarity.
+    """
+
+    async def search(self, query: str, user: Users, db: AsyncSession, limit: int):
+        term = query.lower()
+        space = literal_column("' '")
+        document = func.lower(Contacts.name + space + Contacts.lastname + space + Contacts.email + space + Contacts.phone)
+        prefix = f"{escape_like(term)}%"
+        fields = (Contacts.name, Contacts.lastname, Contacts.email, Contacts.phone)
+        rank = case((or_(*(func.lower(field).like(prefix, escape=LIKE_ESCAPE) for field in fields)), 1), else_=0)
+        stmt = select(Contacts).filter(and_(
+            Contacts.user_id == user.id,
+            or_(document.like(f"%{escape_like(term)}%", escape=LIKE_ESCAPE), document.op('%')(term))
+        )).order_by(rank.desc(), func.similarity(document, term).desc(), Contacts.id).limit(limit)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+
+SEARCH_BACKENDS = {
+    'like': LikeSearchBackend(),
+    'fts5': SQLiteFTSSearchBackend(),
+    'postgres': PostgresTrigramSearchBackend(),
+}
+DIALECT_BACKENDS = {
+    'sqlite': 'fts5',
+    'postgresql': 'postgres',
+}
+
+
+def get_search_backend(db: AsyncSession) -> SearchBackend:
+    """
+    Pick the search backend from settings, 'auto' picks it by the database dialect.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Search backend.
+    :rtype: SearchBackend
+    """
+    name = settings1.search_backend
+    if name == 'auto':
+        name = DIALECT_BACKENDS.get(db.get_bind().dialect.name, 'like')
+    return SEARCH_BACKENDS[name]
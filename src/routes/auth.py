@@ -1,11 +1,14 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
 from libgravatar import Gravatar
 
 from src.database.db import get_db
+from src.database.redis_db import get_redis
+from src.database.replicas import replicas
 from src.database.models import Users
 from src.schemas import User, UserBase, CreateUser, RequestEmail
 from src.repository import auth as repository_auth
@@ -17,24 +20,26 @@ security = HTTPBearer()
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 
+MAIL_UNAVAILABLE = 'Could not queue the confirmation email, try again later'
+
 
 @router.post('/signup', status_code=status.HTTP_201_CREATED)
 async def signup(body: CreateUser,
-                 backround_tasks: BackgroundTasks,
                  request: Request,
-                 db: Session = Depends(get_db)):
+                 db: AsyncSession = Depends(get_db),
+                 cache: redis.Redis = Depends(get_redis)):
     
     """
-    Create new user, sent the confirmation email.
+    Create new user, queue the confirmation email.
 
     :param body: The data for the user to create.
     :type body: CreateUser
-    :param backround_tasks: Tasks that will be called after a response has been sent to the client.
-    :type backround_tasks: BackgroundTasks
     :param request: parameter for making HTTP requests.
     :type request: Request
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client holding the mail queue.
+    :type cache: redis.Redis
     :return: Registered user, registration cinfirmation string.
     :rtype: dict
     """
@@ -49,23 +54,31 @@ async def signup(body: CreateUser,
     exist_user = await repository_auth.get_user_by_email(body.username, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Account already exist')
-    new_user = Users(username=body.username, password=hash_handler.get_password_hash(body.password), avatar=avatar)
+    password = await hash_handler.hash(body.password)
+    new_user = Users(username=body.username, password=password, avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    backround_tasks.add_task(send_email, new_user.username, request.base_url)
+    await db.flush()
+    # the user is only kept once the confirmation email is queued, so a retry can sign up again
+    try:
+        await send_email(new_user.username, request.base_url, cache)
+    except redis.RedisError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=MAIL_UNAVAILABLE)
+    await db.commit()
+    await replicas.mark_write(new_user.username, cache)
+    await db.refresh(new_user)
     return {'user': new_user, 'detail': 'User successfully created. Check your email for confirmation.'} 
 
 
 @router.post('/login')
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     Function to user login, with user's username, email confirmed and password verifycation.
 
     :param body: Data for user's login.
     :type body: OAuth2PasswordRequestForm
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Access token, refresh token and token type.
     :rtype: dict
     """
@@ -74,52 +87,57 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid username')
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Email not confirmed')
-    if not hash_handler.verify_password(body.password, user.password):
+    verified, new_hash = await hash_handler.verify_and_update(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid password')
-    
+    if new_hash:
+        user.password = new_hash
+
     access_token = await repository_auth.create_access_token(data={'sub': user.username})
     refresh_token = await repository_auth.create_refresh_token(data={'sub': user.username})
     user.refresh_token = refresh_token
-    db.commit()
+    await db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token')
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     Update refresh token for user.
 
     :param credentials: HTTP authorization credentials.
     :type credentials: HTTPAuthorizationCredentials
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Access token, refresh token and token type.
     :rtype: dict
     """
     token = credentials.credentials
     username = await repository_auth.get_username_from_refresh_token(token)
-    user = db.query(Users).filter(Users.username == username).first()
+    user = await repository_auth.get_user_by_email(username, db)
     if user.refresh_token != token:
         user.refresh_token = None
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
     access_token = await repository_auth.create_access_token(data={"sub": username})
     refresh_token = await repository_auth.create_refresh_token(data={"sub": username})
     user.refresh_token = refresh_token
-    db.commit()
+    await db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db), cache: redis.Redis = Depends(get_redis)):
     """
     Check the email confirmation for user.
 
     :param token: Token.
     :type token: str
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :return: Email confirmation.
     :rtype: dict
     """
@@ -130,23 +148,27 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     await repository_auth.confirmed_email(email, db)
+    # pin the reads first, so the reload after the invalidation does not see an unconfirmed replica
+    await replicas.mark_write(email, cache)
+    await repository_auth.invalidate_cached_user(email, cache)
     return {"message": "Email confirmed"}
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request,
+                        db: AsyncSession = Depends(get_db),
+                        cache: redis.Redis = Depends(get_redis)):
     """
-    Check the email confirmation for user, if user is not confirmed send the email confirmation to users email.
+    Check the email confirmation for user, if user is not confirmed queue the email confirmation to users email.
 
     :param body: User's email.
     :type body: RequestEmail
-    :param backround_tasks: Tasks that will be called after a response has been sent to the client.
-    :type backround_tasks: BackgroundTasks
     :param request: parameter for making HTTP requests.
     :type request: Request
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client holding the mail queue.
+    :type cache: redis.Redis
     :return: Email confirmation.
     :rtype: dict
     """
@@ -155,5 +177,8 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.username, request.base_url)
+        try:
+            await send_email(user.username, request.base_url, cache)
+        except redis.RedisError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=MAIL_UNAVAILABLE)
     return {"message": "Check your email for confirmation."}
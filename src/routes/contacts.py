@@ -1,16 +1,73 @@
-from typing import List
+from datetime import date
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
 from fastapi_limiter.depends import RateLimiter
 
 from src.database.db import get_db
+from src.database.redis_db import get_redis
+from src.database.replicas import replicas
+from src.config.config import settings1
 from src.database.models import Users
-from src.schemas import Contact, ContactCreate, ContactUpdate
+from src.schemas import Contact, ContactCreate, ContactUpdate, ContactPatch, BulkImportResult, ContactBatch, OperationResult
 from src.repository import contacts as repository_contacts
 from src.repository import auth as repository_auth
+from src.servises import contacts_io, conditional
+from src.servises.response_cache import contacts_cache
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
+contact_list = TypeAdapter(List[Contact])
+
+
+def contacts_response(contacts) -> Response:
+    """
+    Serialize a list of contacts into a JSON response that can be stored in the response cache.
+
+    :param contacts: Contacts to serialize.
+    :type contacts: List[Contacts]
+    :return: JSON response.
+    :rtype: Response
+    """
+    return Response(content=contact_list.dump_json(contact_list.validate_python(contacts, from_attributes=True)),
+                    media_type="application/json")
+
+
+async def contacts_changed(user: Users, cache: redis.Redis) -> None:
+    """
+    Called after a write: send the user's reads to the primary for a while and drop their cached responses.
+
+    The reads are pinned first. A read that sees the new generation must not come from a replica
+    that lags behind the write, or its stale page would be cached under that generation.
+
+    :param user: The user whose contacts changed.
+    :type user: Users
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: None.
+    :rtype: None
+    """
+    await replicas.mark_write(user.username, cache)
+    await contacts_cache.invalidate(cache, user.id)
+
+
+def rows_response(rows) -> Response:
+    """
+    Encode rows from get_contacts_rows straight to a JSON response, without building Contact models.
+
+    The output is the same as contacts_response, but the rows are not validated against Contact.
+
+    :param rows: Rows with the CONTACT_FIELDS columns first.
+    :type rows: List[Row]
+    :return: JSON response.
+    :rtype: Response
+    """
+    fields = repository_contacts.CONTACT_FIELDS
+    return Response(content=to_json([dict(zip(fields, row)) for row in rows]), media_type="application/json")
 
 
 @router.post("/", response_model=Contact, 
@@ -18,7 +75,8 @@ router = APIRouter(prefix='/contacts', tags=["contacts"])
              description='No more than 10 requests per minute',
              dependencies=[Depends(RateLimiter(times=10, seconds=60))])
 async def create_contact(body: ContactCreate, 
-                         db: Session = Depends(get_db),
+                         db: AsyncSession = Depends(get_db),
+                         cache: redis.Redis = Depends(get_redis),
                          current_user: Users = Depends(repository_auth.get_current_user)):
     """
     Creates a new contact for a specific user.
@@ -26,150 +84,426 @@ async def create_contact(body: ContactCreate,
     :param body: The data for the contact to create.
     :type body: ContactCreate
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :param current_user: The user to create the contact for.
     :type current_user: Users
     :return: The newly created contact.
     :rtype: Contacts
     """
-    return await repository_contacts.create_contact(body, current_user, db)
+    contact = await repository_contacts.create_contact(body, current_user, db)
+    await contacts_changed(current_user, cache)
+    return contact
+
+
+@router.post("/bulk", response_model=BulkImportResult,
+             description='Body is text/csv with a header row or application/x-ndjson. '
+                         'No more than 5 requests per minute',
+             dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+async def import_contacts(request: Request,
+                          db: AsyncSession = Depends(get_db),
+                          cache: redis.Redis = Depends(get_redis),
+                          current_user: Users = Depends(repository_auth.get_current_user)):
+    """
+    Creates contacts for a specific user from a streamed CSV or NDJSON body.
+
+    Rows are validated as ContactCreate and inserted in chunks, one transaction per chunk,
+    invalid rows are skipped and reported.
+
+    :param request: The incoming request, its body is read as a stream.
+    :type request: Request
+    :param db: The database session.
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :param current_user: The user to create the contacts for.
+    :type current_user: Users
+    :return: Inserted and failed counts with per-row errors.
+    :rtype: BulkImportResult
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        records = contacts_io.iter_csv_records(request.stream())
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        records = contacts_io.iter_ndjson_records(request.stream())
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Use text/csv or application/x-ndjson")
+    result = await contacts_io.import_contacts(records, current_user, db)
+    await contacts_changed(current_user, cache)
+    return result
+
+
+@router.post("/batch", response_model=List[OperationResult],
+             description='Up to 500 operations per request. No more than 10 requests per minute',
+             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def batch_contacts(body: ContactBatch,
+                         db: AsyncSession = Depends(get_db),
+                         cache: redis.Redis = Depends(get_redis),
+                         current_user: Users = Depends(repository_auth.get_current_user)):
+    """
+    Applies a list of create, update and delete operations for a specific user in one transaction.
+
+    :param body: The operations to apply, in order.
+    :type body: ContactBatch
+    :param db: The database session.
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :param current_user: The user to change the contacts for.
+    :type current_user: Users
+    :return: One result per operation with its status code and the affected contact.
+    :rtype: List[OperationResult]
+    """
+    results = await repository_contacts.apply_operations(body.operations, current_user, db)
+    await contacts_changed(current_user, cache)
+    return results
 
 
 @router.get("/", response_model=List[Contact], 
             description='No more than 10 requests per minute', 
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_contacts(skip: int = 0, 
-                        limit: int = 100, 
+async def read_contacts(request: Request,
+                        skip: int = Query(0, ge=0, le=10000),
+                        limit: int = Query(100, ge=1, le=500),
+                        cursor: Optional[str] = None,
                         current_user: Users = Depends(repository_auth.get_current_user),
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(repository_auth.get_read_db),
+                        cache: redis.Redis = Depends(get_redis)):
     """
     Display a list of contacts for a specific user with specified pagination parameters.
 
-    :param skip: The number of contacts to skip.
+    Passing cursor (empty for the first page) switches to keyset pagination ordered by
+    lastname, name and id, skip is ignored then. The cursor of the next page is returned
+    in the X-Next-Cursor header, it is missing on the last page.
+
+    The page carries ETag and Last-Modified, a request with a matching If-None-Match
+    is answered with 304 after reading only the ids and versions of the page.
+    Pages are kept in the response cache until the user's contacts change. With the
+    fast_json_responses setting only the needed columns are selected and encoded straight to JSON.
+
+    :param request: The incoming request.
+    :type request: Request
+    :param skip: The number of contacts to skip, up to 10000; use the cursor to page further.
     :type skip: int
-    :param limit: The maximum number of contacts to return.
+    :param limit: The maximum number of contacts to return, up to 500.
     :type limit: int
+    :param cursor: Cursor from X-Next-Cursor of the previous page.
+    :type cursor: str | None
     :param current_user: The user to retrieve contacts for.
     :type current_user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :return: A list of Conatcts.
     :rtype: List[Conatcts]
     """
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    return contacts
+    after = None
+    if cursor is not None:
+        try:
+            after = repository_contacts.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    key = await contacts_cache.key(cache, current_user.id, "list", {"skip": skip, "limit": limit, "cursor": cursor})
+    entry = await contacts_cache.get(cache, key)
+    if entry is not None:
+        return contacts_cache.respond(request, *entry)
+
+    if conditional.is_conditional(request):
+        rows = await repository_contacts.get_contacts_validators(skip, after, limit, current_user, db,
+                                                                 keyset=cursor is not None)
+        etag = conditional.collection_etag(rows)
+        modified = conditional.last_modified(rows)
+        if conditional.is_not_modified(request, etag, modified):
+            cached = conditional.not_modified(etag, modified)
+            if cursor is not None and rows and len(rows) == limit:
+                cached.headers["X-Next-Cursor"] = repository_contacts.encode_cursor(rows[-1])
+            return cached
+
+    if settings1.fast_json_responses:
+        contacts = await repository_contacts.get_contacts_rows(skip, after, limit, current_user, db,
+                                                               keyset=cursor is not None)
+        response = rows_response(contacts)
+    else:
+        if cursor is None:
+            contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
+        else:
+            contacts = await repository_contacts.get_contacts_after(after, limit, current_user, db)
+        response = contacts_response(contacts)
+    if cursor is not None and contacts and len(contacts) == limit:
+        response.headers["X-Next-Cursor"] = repository_contacts.encode_cursor(contacts[-1])
+    conditional.set_validators(response, conditional.collection_etag(contacts), conditional.last_modified(contacts))
+    return await contacts_cache.store(cache, key, response)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(format: str = Query("csv", pattern="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(repository_auth.get_read_db),
+                          current_user: Users = Depends(repository_auth.get_current_user)):
+    """
+    Export all contacts of a specific user as a streamed CSV or NDJSON file.
+
+    :param format: Output format, csv or ndjson.
+    :type format: str
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The user to export the contacts of.
+    :type current_user: Users
+    :return: Streamed export.
+    :rtype: StreamingResponse
+    """
+    return StreamingResponse(contacts_io.export_contacts(format, current_user, db.bind),
+                             media_type=contacts_io.EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'})
+
+
+async def contact_conflict(contact_id: int, versions: Optional[List[int]], user: Users, db: AsyncSession):
+    """
+    Explain why a conditional write matched no row: 412 if the contact exists at another version, else 404.
+
+    :param contact_id: The ID of the contact.
+    :type contact_id: int
+    :param versions: Versions allowed by If-Match, None if there was no precondition.
+    :type versions: List[int] | None
+    :param user: The user the contact belongs to.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: HTTP error to raise.
+    :rtype: HTTPException
+    """
+    if versions is not None and await repository_contacts.get_contact_validator(contact_id, user, db) is not None:
+        return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Contact was modified")
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
 
 
 @router.get("/{contact_id}", response_model=Contact)
 async def read_contact(contact_id: int, 
-                       db: Session = Depends(get_db),
+                       request: Request,
+                       response: Response,
+                       db: AsyncSession = Depends(repository_auth.get_read_db),
                        current_user: Users = Depends(repository_auth.get_current_user)):
     
     """
     Display a single contact with the specified ID for a specific user.
 
+    The response carries ETag and Last-Modified. A request with a matching If-None-Match
+    (or If-Modified-Since) is answered with 304 after reading only the contact's version.
+
     :param contact_id: The ID of the contact to retrieve.
     :type contact_id: int
+    :param request: The incoming request.
+    :type request: Request
+    :param response: The outgoing response.
+    :type response: Response
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :param current_user: The user to retrieve the contact for.
     :type current_user: Users
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Conatcts | None
     """
 
+    if conditional.is_conditional(request):
+        validator = await repository_contacts.get_contact_validator(contact_id, current_user, db)
+        if validator is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        etag = conditional.make_etag(validator.id, validator.version)
+        if conditional.is_not_modified(request, etag, validator.updated_at):
+            return conditional.not_modified(etag, validator.updated_at)
+
     contact = await repository_contacts.get_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+    conditional.set_validators(response, conditional.make_etag(contact.id, contact.version), contact.updated_at)
     return contact
 
 
 @router.put("/{contact_id}", response_model=Contact)
 async def update_contact(contact_id: int, 
                          body: ContactUpdate, 
-                         db: Session = Depends(get_db),
+                         request: Request,
+                         response: Response,
+                         db: AsyncSession = Depends(get_db),
+                         cache: redis.Redis = Depends(get_redis),
                          current_user: Users = Depends(repository_auth.get_current_user)):
     
     """
     Updates a single contact with the specified ID for a specific user.
 
+    With If-Match the contact is only updated if its ETag matches, otherwise 412 is returned.
+
     :param contact_id: The ID of the contact to update.
     :type contact_id: int
     :param body: The updated data for the contact.
     :type body: ContactUpdate
+    :param request: The incoming request.
+    :type request: Request
+    :param response: The outgoing response.
+    :type response: Response
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :param current_user: The user to update the contact for.
     :type current_user: Users
     :return: The updated contact, or None if it does not exist.
     :rtype: Contacts | None
     """
         
-    contact = await repository_contacts.update_contact(contact_id, body, current_user, db)
+    versions = conditional.match_versions(request, contact_id)
+    contact = await repository_contacts.update_contact(contact_id, body, current_user, db, versions)
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        raise await contact_conflict(contact_id, versions, current_user, db)
+    await contacts_changed(current_user, cache)
+    conditional.set_validators(response, conditional.make_etag(contact.id, contact.version), contact.updated_at)
+    return contact
+
+
+@router.patch("/{contact_id}", response_model=Contact)
+async def patch_contact(contact_id: int, 
+                        body: ContactPatch, 
+                        request: Request,
+                        response: Response,
+                        db: AsyncSession = Depends(get_db),
+                        cache: redis.Redis = Depends(get_redis),
+                        current_user: Users = Depends(repository_auth.get_current_user)):
+    
+    """
+    Updates only the fields sent in the request of a single contact with the specified ID for a specific user.
+
+    With If-Match the contact is only updated if its ETag matches, otherwise 412 is returned.
+
+    :param contact_id: The ID of the contact to update.
+    :type contact_id: int
+    :param body: The fields to change.
+    :type body: ContactPatch
+    :param request: The incoming request.
+    :type request: Request
+    :param response: The outgoing response.
+    :type response: Response
+    :param db: The database session.
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :param current_user: The user to update the contact for.
+    :type current_user: Users
+    :return: The updated contact, or None if it does not exist.
+    :rtype: Contacts | None
+    """
+        
+    versions = conditional.match_versions(request, contact_id)
+    contact = await repository_contacts.patch_contact(contact_id, body, current_user, db, versions)
+    if contact is None:
+        raise await contact_conflict(contact_id, versions, current_user, db)
+    await contacts_changed(current_user, cache)
+    conditional.set_validators(response, conditional.make_etag(contact.id, contact.version), contact.updated_at)
     return contact
 
 
 @router.delete("/{contact_id}", response_model=Contact)
 async def remove_contact(contact_id: int, 
-                         db: Session = Depends(get_db),
+                         request: Request,
+                         db: AsyncSession = Depends(get_db),
+                         cache: redis.Redis = Depends(get_redis),
                          current_user: Users = Depends(repository_auth.get_current_user)):
     
     """
     Removes a single contact with the specified ID for a specific user.
 
+    With If-Match the contact is only removed if its ETag matches, otherwise 412 is returned.
+
     :param contact_id: The ID of the contact to remove.
     :type contact_id: int
+    :param request: The incoming request.
+    :type request: Request
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :param current_user: The user to remove the contact for.
     :type current_user: Users
     :return: The removed contact, or None if it does not exist.
     :rtype: Contacts | None
     """
         
-    contact = await repository_contacts.remove_contact(contact_id, current_user, db)
+    versions = conditional.match_versions(request, contact_id)
+    contact = await repository_contacts.remove_contact(contact_id, current_user, db, versions)
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        raise await contact_conflict(contact_id, versions, current_user, db)
+    await contacts_changed(current_user, cache)
     return contact
 
 
 @router.get("/birthdays/", response_model=List[Contact])
-async def get_birthdays(db: Session = Depends(get_db),
+async def get_birthdays(request: Request,
+                        days: int = Query(7, ge=1, le=366),
+                        db: AsyncSession = Depends(repository_auth.get_read_db),
+                        cache: redis.Redis = Depends(get_redis),
                         current_user: Users = Depends(repository_auth.get_current_user)):
     """
-    Display a list of contacts that have a birthday in 7 days period for a specific user.
+    Display a list of contacts that have a birthday in the next days for a specific user.
+
+    The result is kept in the response cache until the user's contacts change or the day ends.
 
+    :param request: The incoming request.
+    :type request: Request
+    :param days: Window length in days after today, default = 7.
+    :type days: int
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :param current_user: The user to find the contacts birthday for.
     :type current_user: Users
-    :return: A list of contacts that have a birthday in 7 days period.
+    :return: A list of contacts that have a birthday in the given period.
     :rtype: List[Contacts]
     """
-    return await repository_contacts.get_birthdays(current_user, db)
+    key = await contacts_cache.key(cache, current_user.id, "birthdays", {"days": days, "today": date.today()})
+    entry = await contacts_cache.get(cache, key)
+    if entry is not None:
+        return contacts_cache.respond(request, *entry)
+    contacts = await repository_contacts.get_birthdays(current_user, db, days)
+    return await contacts_cache.store(cache, key, contacts_response(contacts))
 
 
 @router.get("/search/", response_model=List[Contact])
-async def search_contatcs(query,
+async def search_contatcs(request: Request,
+                          query: str,
+                          limit: int = Query(50, ge=1, le=500),
                           current_user: Users = Depends(repository_auth.get_current_user),
-                          db: Session = Depends(get_db)):
+                          db: AsyncSession = Depends(repository_auth.get_read_db),
+                          cache: redis.Redis = Depends(get_redis)):
     
     """
-    Display a list of contacts for a specific user with specific sql query.
+    Display a list of contacts for a specific user matching the search string, best matches first.
+
+    The result is kept in the response cache until the user's contacts change.
 
-    :param query: Sql query string.
+    :param request: The incoming request.
+    :type request: Request
+    :param query: Search string, matched against name, lastname, email and phone.
     :type query: str
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
     :param current_user: The user to find the contacts.
     :type current_user: Users
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
     :return: A list of contacts.
     :rtype: List[Contacts]
     """
         
-    contact = await repository_contacts.search_contacts(query, current_user, db)
+    key = await contacts_cache.key(cache, current_user.id, "search", {"query": query, "limit": limit})
+    entry = await contacts_cache.get(cache, key)
+    if entry is not None:
+        return contacts_cache.respond(request, *entry)
+    contact = await repository_contacts.search_contacts(query, current_user, db, limit)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact not found"')
-    return contact
\ No newline at end of file
+    return await contacts_cache.store(cache, key, contacts_response(contact))
\ No newline at end of file
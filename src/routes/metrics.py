@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """
+    Expose the collected metrics in the Prometheus text format.
+
+    :return: Metrics of this process.
+    :rtype: Response
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,14 +1,13 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, status, UploadFile, File, Request, Response, HTTPException
+import redis.asyncio as redis
 from fastapi_limiter.depends import RateLimiter
 
-from src.database.db import get_db
-from src.database.models import Users
+from src.database.redis_db import get_redis
 from src.repository import auth as repository_auth
 from src.config.config import settings1
-from src.schemas import User
+from src.schemas import User, AvatarJob
+from src.servises import conditional
+from src.servises.avatars import avatar_uploader
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -17,47 +16,93 @@ router = APIRouter(prefix="/users", tags=["users"])
             response_model=User, 
             description="No more than 10 requests per minute",
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_users_me(current_user: User = Depends(repository_auth.get_current_user)):
+async def read_users_me(request: Request,
+                        response: Response,
+                        current_user: User = Depends(repository_auth.get_current_user)):
     """
     Display the user.
 
+    The ETag comes from the cached user's version, so a matching If-None-Match
+    is answered with 304 without touching the database.
+
+    :param request: The incoming request.
+    :type request: Request
+    :param response: The outgoing response.
+    :type response: Response
     :param current_user: User to display.
     :type current_user: User
     :return: User.
     :rtype: User
     """
+    etag = conditional.make_etag('u', current_user.id, current_user.version)
+    if conditional.is_not_modified(request, etag, current_user.updated_at):
+        return conditional.not_modified(etag, current_user.updated_at)
+    conditional.set_validators(response, etag, current_user.updated_at)
     return current_user
 
 
-@router.patch('/avatar', 
-              response_model=User, 
+@router.patch('/avatar',
+              response_model=AvatarJob,
+              status_code=status.HTTP_202_ACCEPTED,
               description="No more than 10 requests per minute",
               dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(repository_auth.get_current_user),
-                             db: Session = Depends(get_db)):
-    
+async def update_avatar_user(request: Request,
+                             response: Response,
+                             file: UploadFile = File(),
+                             current_user: User = Depends(repository_auth.get_current_user),
+                             cache: redis.Redis = Depends(get_redis)):
     """
-    Update avatar for specific user.
+    Start updating the avatar for specific user.
+
+    The file is uploaded to Cloudinary in the background, the response carries the job id
+    and its Location is polled for the new avatar.
 
+    :param request: The incoming request.
+    :type request: Request
+    :param response: The outgoing response.
+    :type response: Response
     :param file: File to set as avatar for user.
     :type file: UploadFile
     :param current_user: The user to avatar's update contacts for.
     :type current_user: User
-    :param db: The database session.
-    :type db: Session
-    :return: User with updated avatar.
-    :rtype: User
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: The pending upload job.
+    :rtype: AvatarJob
+    """
+    content = await file.read(settings1.avatar_max_bytes + 1)
+    if len(content) > settings1.avatar_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Avatar is larger than {settings1.avatar_max_bytes} bytes")
+    try:
+        job = await avatar_uploader.submit(cache, current_user.username, content)
+    except redis.RedisError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Could not start the upload, try again later")
+    response.headers["Location"] = str(request.url_for("get_avatar_job", job_id=job.id))
+    return job
+
+
+@router.get('/avatar/jobs/{job_id}', response_model=AvatarJob)
+async def get_avatar_job(job_id: str,
+                         current_user: User = Depends(repository_auth.get_current_user),
+                         cache: redis.Redis = Depends(get_redis)):
+    """
+    Display the status of an avatar upload of the user.
+
+    :param job_id: Id returned by the upload.
+    :type job_id: str
+    :param current_user: The user who started the upload.
+    :type current_user: User
+    :param cache: The shared Redis client.
+    :type cache: redis.Redis
+    :return: The upload job, with the avatar URL once it is done.
+    :rtype: AvatarJob
     """
-        
-    cloudinary.config(
-        cloud_name=settings1.cloudinary_name,
-        api_key=settings1.cloudinary_api_key,
-        api_secret=settings1.cloudinary_api_secret,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'api/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'api/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-    user = await repository_auth.update_avatar(current_user.username, src_url, db)
-    return user
+    try:
+        job = await avatar_uploader.job(cache, job_id, current_user.username)
+    except redis.RedisError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Upload status not available")
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return job
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
-from datetime import date
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Optional, Literal, Union, Annotated
+from datetime import date, datetime
+from uuid import uuid4
 
 
 class ContactBase(BaseModel):
@@ -20,6 +21,23 @@ class ContactUpdate(ContactBase):
     pass
 
 
+class ContactPatch(BaseModel):
+    name: Optional[str] = Field(None, max_length=50, description='Contacts name')
+    lastname: Optional[str] = Field(None, max_length=50, description='Contacts lastname')
+    email: Optional[EmailStr] = Field(None, max_length=50, description='Contacts email')
+    phone: Optional[str] = Field(None, max_length=50, description='Contacts phone number')
+    birthday: Optional[date] = Field(None, description='Contacts birthday')
+    additional: Optional[str] = Field(None, max_length=150, description='Additional information')
+
+    @field_validator('name', 'lastname', 'email', 'phone', 'birthday')
+    @classmethod
+    def not_null(cls, value):
+        # omitted fields are left as they are, only additional can be cleared with null
+        if value is None:
+            raise ValueError('may be omitted but not null')
+        return value
+
+
 class Contact(ContactBase):
     id: int
 
@@ -27,6 +45,49 @@ class Contact(ContactBase):
         from_attributes = True
 
 
+class CreateOperation(BaseModel):
+    op: Literal['create']
+    data: ContactCreate
+
+
+class UpdateOperation(BaseModel):
+    op: Literal['update']
+    id: int
+    data: ContactUpdate
+
+
+class DeleteOperation(BaseModel):
+    op: Literal['delete']
+    id: int
+
+
+ContactOperation = Annotated[Union[CreateOperation, UpdateOperation, DeleteOperation], Field(discriminator='op')]
+
+
+class ContactBatch(BaseModel):
+    operations: list[ContactOperation] = Field(min_length=1, max_length=500)
+
+
+class OperationResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    contact: Optional[Contact] = None
+    detail: Optional[str] = None
+
+
+class RowError(BaseModel):
+    row: int
+    errors: list[str]
+
+
+class BulkImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: list[RowError] = []
+    errors_truncated: bool = False
+
+
 class UserBase(BaseModel):
     username: str
 
@@ -44,6 +105,35 @@ class User(UserBase):
         from_attributes = True
 
 
+class UserCache(BaseModel):
+    id: int
+    username: str
+    confirmed: Optional[bool] = False
+    avatar: Optional[str] = None
+    version: int = 1
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class RequestEmail(BaseModel):
     email: EmailStr
 
+
+class AvatarJob(BaseModel):
+    id: str
+    status: str = Field(description='pending, done or failed')
+    avatar: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class EmailJob(BaseModel):
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    recipient: str
+    subject: str
+    template: str
+    body: dict = {}
+    attempts: int = 0
+    last_error: Optional[str] = None
+
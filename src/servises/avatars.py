@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from typing import Optional
+
+import cloudinary
+import httpx
+import redis.asyncio as redis
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config.config import settings1
+from ..database.db import SessionLocal
+from ..database.replicas import replicas
+from ..repository import auth as repository_auth
+from ..schemas import AvatarJob
+
+logger = logging.getLogger(__name__)
+
+
+class AvatarUploader:
+    """
+    Uploads avatars to Cloudinary in the background, through the upload API and an async HTTP client.
+
+    The route hands over the file and answers 202 with a job id right away. The job's status
+    is kept in a {prefix}:job:{id} hash in Redis for job_ttl seconds, so any worker can
+    answer for it. At most concurrency uploads run at once, the others wait their turn.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, upload_prefix: str, prefix: str,
+                 concurrency: int, job_ttl: int, timeout: float = 60,
+                 sessionmaker: async_sessionmaker[AsyncSession] = SessionLocal):
+        self.cloud_name = cloud_name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.upload_prefix = upload_prefix.rstrip('/')
+        self.prefix = prefix
+        self.job_ttl = job_ttl
+        self.timeout = timeout
+        self.sessionmaker = sessionmaker
+        self.client: Optional[httpx.AsyncClient] = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        """
+        Configure the Cloudinary SDK used for the avatar URLs and open the HTTP client, once at startup.
+
+        :param transport: HTTP transport, e.g. a stub of the upload endpoint in tests.
+        :type transport: httpx.AsyncBaseTransport | None
+        :return: None.
+        :rtype: None
+        """
+        if self.client is None:
+            cloudinary.config(cloud_name=self.cloud_name, api_key=self.api_key, api_secret=self.api_secret,
+                              secure=True)
+            self.client = httpx.AsyncClient(base_url=self.upload_prefix, timeout=self.timeout,
+                                            transport=transport)
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        Wait up to timeout for the running uploads, cancel the rest and close the HTTP client.
+
+        :param timeout: Seconds to wait for the uploads.
+        :type timeout: float
+        :return: None.
+        :rtype: None
+        """
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def job_key(self, job_id: str) -> str:
+        """
+        Key of the hash holding a job's status.
+
+        :param job_id: Job id.
+        :type job_id: str
+        :return: Redis key.
+        :rtype: str
+        """
+        return f"{self.prefix}:job:{job_id}"
+
+    def signature(self, params: dict) -> str:
+        """
+        Sign upload parameters the way the Cloudinary upload API checks them.
+
+        :param params: Parameters sent with the file, without file and api_key.
+        :type params: dict
+        :return: SHA-1 hex digest.
+        :rtype: str
+        """
+        to_sign = "&".join(f"{key}={value}" for key, value in sorted(params.items()) if value not in (None, ""))
+        return hashlib.sha1((to_sign + self.api_secret).encode()).hexdigest()
+
+    async def upload(self, content: bytes, public_id: str) -> dict:
+        """
+        Upload an image, overwriting the one with the same public id.
+
+        :param content: Image file.
+        :type content: bytes
+        :param public_id: Cloudinary public id.
+        :type public_id: str
+        :return: The upload API's answer, with the new version.
+        :rtype: dict
+        :raises httpx.HTTPError: The upload failed.
+        """
+        params = {"public_id": public_id, "overwrite": "true", "timestamp": int(time.time())}
+        data = dict(params, api_key=self.api_key, signature=self.signature(params))
+        response = await self.client.post(f"/v1_1/{self.cloud_name}/image/upload", data=data,
+                                          files={"file": ("avatar", content)})
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def avatar_url(public_id: str, version) -> str:
+        """
+        URL of the avatar cropped to 250x250.
+
+        :param public_id: Cloudinary public id.
+        :type public_id: str
+        :param version: Version returned by the upload.
+        :type version: int | str
+        :return: Image URL.
+        :rtype: str
+        """
+        return cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop='fill', version=version)
+
+    async def submit(self, cache: Optional[redis.Redis], username: str, content: bytes) -> AvatarJob:
+        """
+        Record a pending job and start the upload in the background.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param username: User's email.
+        :type username: str
+        :param content: Image file.
+        :type content: bytes
+        :return: The pending job.
+        :rtype: AvatarJob
+        :raises redis.RedisError: The job cannot be recorded.
+        """
+        if cache is None:
+            raise redis.ConnectionError("Redis is not available")
+        self.start()
+        job = AvatarJob(id=uuid.uuid4().hex, status="pending")
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.hset(self.job_key(job.id), mapping={"status": job.status, "username": username})
+            pipe.expire(self.job_key(job.id), self.job_ttl)
+            await pipe.execute()
+        task = asyncio.create_task(self.process(cache, job.id, username, content))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def process(self, cache: redis.Redis, job_id: str, username: str, content: bytes) -> None:
+        """
+        Upload the avatar, store its URL and record how the job ended.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param job_id: Job id.
+        :type job_id: str
+        :param username: User's email.
+        :type username: str
+        :param content: Image file.
+        :type content: bytes
+        :return: None.
+        :rtype: None
+        """
+        public_id = f'api/{username}'
+        async with self._slots:
+            try:
+                result = await self.upload(content, public_id)
+                url = self.avatar_url(public_id, result.get('version'))
+                async with self.sessionmaker() as db:
+                    user = await repository_auth.update_avatar(username, url, db)
+                if user is None:
+                    logger.warning("Avatar upload %s of %s dropped, the user no longer exists", job_id, username)
+                    await self.finish(cache, job_id, status="failed", detail="User not found")
+                    return
+                await repository_auth.invalidate_cached_user(username, cache)
+                await replicas.mark_write(username, cache)
+            except (httpx.HTTPError, ValueError, SQLAlchemyError, redis.RedisError) as error:
+                logger.warning("Avatar upload %s of %s failed: %r", job_id, username, error)
+                await self.finish(cache, job_id, status="failed", detail="Avatar upload failed")
+                return
+            except Exception:
+                # a job must not stay pending until its TTL, whatever went wrong
+                logger.exception("Avatar upload %s of %s failed", job_id, username)
+                await self.finish(cache, job_id, status="failed", detail="Avatar upload failed")
+                return
+        await self.finish(cache, job_id, status="done", avatar=url)
+
+    async def finish(self, cache: redis.Redis, job_id: str, **fields) -> None:
+        """
+        Record the outcome of a job.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param job_id: Job id.
+        :type job_id: str
+        :param fields: Status, avatar URL or error detail.
+        :type fields: str
+        :return: None.
+        :rtype: None
+        """
+        try:
+            await cache.hset(self.job_key(job_id), mapping=fields)
+        except redis.RedisError as error:
+            logger.warning("Could not record the end of avatar upload %s: %s", job_id, error)
+
+    async def job(self, cache: Optional[redis.Redis], job_id: str, username: str) -> Optional[AvatarJob]:
+        """
+        Status of a job of the user.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param job_id: Job id.
+        :type job_id: str
+        :param username: User's email.
+        :type username: str
+        :return: The job, None if it expired or belongs to another user.
+        :rtype: AvatarJob | None
+        :raises redis.RedisError: The job cannot be read.
+        """
+        if cache is None:
+            raise redis.ConnectionError("Redis is not available")
+        fields = {key.decode() if isinstance(key, bytes) else key: value.decode() if isinstance(value, bytes)
+                  else value for key, value in (await cache.hgetall(self.job_key(job_id))).items()}
+        if fields.pop("username", None) != username:
+            return None
+        return AvatarJob(id=job_id, **fields)
+
+
+avatar_uploader = AvatarUploader(settings1.cloudinary_name, settings1.cloudinary_api_key,
+                                 settings1.cloudinary_api_secret,
+                                 upload_prefix=settings1.cloudinary_upload_prefix,
+                                 prefix="avatar",
+                                 concurrency=settings1.avatar_upload_concurrency,
+                                 job_ttl=settings1.avatar_job_ttl)
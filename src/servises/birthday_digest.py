@@ -0,0 +1,369 @@
+"""
+Daily birthday reminders: one digest per user with the contacts whose birthday is coming up.
+
+It runs inside the app after BIRTHDAY_DIGEST_HOUR unless BIRTHDAY_DIGEST_IN_APP is off, or once
+from cron:
+
+    python -m src.servises.birthday_digest
+"""
+import asyncio
+import calendar
+import logging
+import os
+import socket
+from datetime import date, datetime
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from ..config.config import settings1
+from ..database import redis_db
+from ..database.db import engine
+from ..database.models import Contacts, Users
+from ..database.replicas import replicas
+from ..repository.contacts import birthday_window
+from ..schemas import EmailJob
+from . import metrics
+from .mail_queue import MailQueue, mail_queue
+
+logger = logging.getLogger(__name__)
+
+DIGEST_TEMPLATE = 'birthday_digest.html'
+DIGEST_MAX_CONTACTS = 50
+FETCH_SIZE = 1000
+
+
+def next_birthday(birthday: date, today: date) -> date:
+    """
+    The first birthday on or after today, February 29 falls on February 28 in a non leap year.
+
+    :param birthday: Date of birth.
+    :type birthday: date
+    :param today: Current date.
+    :type today: date
+    :return: Date of the next birthday.
+    :rtype: date
+    """
+    for year in (today.year, today.year + 1):
+        day = 28 if (birthday.month, birthday.day) == (2, 29) and not calendar.isleap(year) else birthday.day
+        upcoming = date(year, birthday.month, day)
+        if upcoming >= today:
+            return upcoming
+    raise ValueError(birthday)
+
+
+class Digest:
+    """
+    Upcoming birthdays of one user, at most limit of them are kept, the nearest ones.
+    """
+
+    def __init__(self, user_id: int, username: str, limit: int = DIGEST_MAX_CONTACTS):
+        self.user_id = user_id
+        self.username = username
+        self.limit = limit
+        self.total = 0
+        self.contacts: list[dict] = []
+
+    def add(self, name: str, lastname: str, birthday: date, today: date) -> None:
+        """
+        Count a contact in, the list is trimmed to the nearest birthdays once it is twice the limit.
+
+        :param name: Contact's name.
+        :type name: str
+        :param lastname: Contact's last name.
+        :type lastname: str
+        :param birthday: Contact's date of birth.
+        :type birthday: date
+        :param today: Day of the digest.
+        :type today: date
+        :return: None.
+        :rtype: None
+        """
+        upcoming = next_birthday(birthday, today)
+        self.total += 1
+        self.contacts.append({"name": name, "lastname": lastname,
+                              "birthday": upcoming.strftime("%B %d"), "days_left": (upcoming - today).days})
+        if len(self.contacts) >= 2 * self.limit:
+            self.trim()
+
+    def trim(self) -> None:
+        """
+        Keep the nearest limit birthdays, in date order.
+
+        :return: None.
+        :rtype: None
+        """
+        self.contacts.sort(key=lambda contact: (contact["days_left"], contact["lastname"], contact["name"]))
+        del self.contacts[self.limit:]
+
+    def job(self, today: date, days: int) -> EmailJob:
+        """
+        Message for the mail queue, its id is the same for a user and day however often it is built.
+
+        :param today: Day of the digest.
+        :type today: date
+        :param days: Window length in days after today.
+        :type days: int
+        :return: Message to queue.
+        :rtype: EmailJob
+        """
+        self.trim()
+        return EmailJob(id=f"birthdays-{today:%Y%m%d}-{self.user_id}",
+                        recipient=self.username,
+                        subject="Upcoming birthdays",
+                        template=DIGEST_TEMPLATE,
+                        body={"username": self.username, "days": days, "contacts": self.contacts,
+                              "more": self.total - len(self.contacts)})
+
+
+class BirthdayDigest:
+    """
+    Builds the digests of all users from one streamed query and queues them in batches.
+
+    Rows come ordered by user from a server-side cursor, so only the current user's digest and
+    the pending batch are in memory. Every batch is pushed to the mail queue in the same Redis
+    transaction that moves the {prefix}:checkpoint past its last user. A run that crashed is
+    resumed after that user and no digest is queued twice. A {prefix}:lock key keeps two
+    processes from running at once.
+    """
+
+    def __init__(self, queue: MailQueue, prefix: str, days: int, batch_size: int, owner: str,
+                 lock_ttl: float = 600):
+        self.queue = queue
+        self.days = days
+        self.batch_size = batch_size
+        self.owner = owner
+        self.lock_ttl = lock_ttl
+        self.checkpoint = f"{prefix}:checkpoint"
+        self.lock = f"{prefix}:lock"
+        self._task: Optional[asyncio.Task] = None
+
+    def query(self, today: date, after: int):
+        """
+        Contacts with a birthday in the window of all confirmed users after the given one, ordered by user.
+
+        :param today: Day of the digest.
+        :type today: date
+        :param after: Last user already queued, 0 for none.
+        :type after: int
+        :return: Select statement.
+        :rtype: Select
+        """
+        return (select(Users.id, Users.username, Contacts.name, Contacts.lastname, Contacts.birthday)
+                .join(Contacts, Contacts.user_id == Users.id)
+                .where(Users.confirmed.is_(True), Users.id > after, birthday_window(today, self.days))
+                .order_by(Users.id))
+
+    async def digests(self, bind: AsyncEngine, today: date, after: int = 0) -> AsyncIterator[Digest]:
+        """
+        Stream the digests, one per user with upcoming birthdays.
+
+        :param bind: The engine to read from.
+        :type bind: AsyncEngine
+        :param today: Day of the digest.
+        :type today: date
+        :param after: Last user already queued, 0 for none.
+        :type after: int
+        :return: Digests in user order.
+        :rtype: AsyncIterator[Digest]
+        """
+        digest = None
+        async with AsyncSession(bind) as session:
+            result = await session.stream(self.query(today, after).execution_options(yield_per=FETCH_SIZE))
+            async for rows in result.partitions():
+                for user_id, username, name, lastname, birthday in rows:
+                    if digest is None or digest.user_id != user_id:
+                        if digest is not None:
+                            yield digest
+                        digest = Digest(user_id, username)
+                    digest.add(name, lastname, birthday, today)
+        if digest is not None:
+            yield digest
+
+    async def resume_point(self, cache: redis.Redis, today: date) -> Optional[int]:
+        """
+        Last user queued today, 0 if today's run did not start and None if it finished.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param today: Day of the digest.
+        :type today: date
+        :return: User id or None.
+        :rtype: int | None
+        """
+        checkpoint = {key.decode() if isinstance(key, bytes) else key: value.decode() if isinstance(value, bytes)
+                      else value for key, value in (await cache.hgetall(self.checkpoint)).items()}
+        if checkpoint.get("day") != today.isoformat():
+            return 0
+        if checkpoint.get("done") == "1":
+            return None
+        return int(checkpoint.get("user_id", 0))
+
+    async def commit(self, cache: redis.Redis, today: date, jobs: list[EmailJob], last_user: int,
+                     done: bool = False) -> None:
+        """
+        Queue a batch and move the checkpoint past its last user in one transaction, extending the lock.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param today: Day of the digest.
+        :type today: date
+        :param jobs: Digests of the batch.
+        :type jobs: list[EmailJob]
+        :param last_user: Id of the batch's last user.
+        :type last_user: int
+        :param done: True for the last batch of the run.
+        :type done: bool
+        :return: None.
+        :rtype: None
+        """
+        async with cache.pipeline(transaction=True) as pipe:
+            self.queue.enqueue_many(pipe, jobs)
+            pipe.hset(self.checkpoint, mapping={"day": today.isoformat(), "user_id": last_user,
+                                                "done": int(done)})
+            pipe.pexpire(self.lock, int(self.lock_ttl * 1000))
+            await pipe.execute()
+        metrics.BIRTHDAY_DIGESTS.inc(len(jobs))
+
+    async def run(self, cache: redis.Redis, bind: AsyncEngine, today: date) -> int:
+        """
+        Queue today's digests, resuming after the checkpoint, unless another process is at it.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param bind: The engine to read from.
+        :type bind: AsyncEngine
+        :param today: Day of the digest.
+        :type today: date
+        :return: Number of digests queued by this call.
+        :rtype: int
+        """
+        if not await cache.set(self.lock, self.owner, nx=True, px=int(self.lock_ttl * 1000)):
+            return 0
+        try:
+            after = await self.resume_point(cache, today)
+            if after is None:
+                return 0
+            queued = 0
+            batch = []
+            async for digest in self.digests(bind, today, after):
+                batch.append(digest.job(today, self.days))
+                after = digest.user_id
+                if len(batch) >= self.batch_size:
+                    await self.commit(cache, today, batch, after)
+                    queued += len(batch)
+                    batch = []
+            await self.commit(cache, today, batch, after, done=True)
+            return queued + len(batch)
+        finally:
+            await self.unlock(cache)
+
+    async def unlock(self, cache: redis.Redis) -> None:
+        """
+        Delete the lock if this process still holds it.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        async with cache.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.lock)
+                owner = await pipe.get(self.lock)
+                if (owner.decode() if isinstance(owner, bytes) else owner) != self.owner:
+                    return
+                pipe.multi()
+                pipe.delete(self.lock)
+                await pipe.execute()
+            except redis.WatchError:
+                pass
+
+    async def schedule(self, cache: redis.Redis, hour: int, interval: float) -> None:
+        """
+        Run once a day after hour, checking every interval seconds, so a failed run is resumed.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param hour: Local hour to send the digests from.
+        :type hour: int
+        :param interval: Seconds between checks.
+        :type interval: float
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            now = datetime.now()
+            if now.hour >= hour:
+                try:
+                    queued = await self.run(cache, read_engine(), now.date())
+                    if queued:
+                        logger.info("Queued %s birthday digests", queued)
+                except (redis.RedisError, SQLAlchemyError) as error:
+                    logger.warning("Birthday digests stopped, resumed at the next check: %s", error)
+            await asyncio.sleep(interval)
+
+    def start(self, cache: redis.Redis, hour: int, interval: float) -> None:
+        """
+        Run the schedule in the background.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param hour: Local hour to send the digests from.
+        :type hour: int
+        :param interval: Seconds between checks.
+        :type interval: float
+        :return: None.
+        :rtype: None
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.schedule(cache, hour, interval))
+
+    async def stop(self) -> None:
+        """
+        Stop the schedule, a run cut short is resumed from its checkpoint.
+
+        :return: None.
+        :rtype: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def read_engine() -> AsyncEngine:
+    """
+    A healthy read replica, the digests can lag a little behind, else the primary.
+
+    :return: Engine to read from.
+    :rtype: AsyncEngine
+    """
+    index = replicas.pick()
+    return engine if index is None else replicas.engines[index]
+
+
+birthday_digest = BirthdayDigest(mail_queue, "birthdays",
+                                 days=settings1.birthday_digest_days,
+                                 batch_size=settings1.birthday_digest_batch,
+                                 owner=f"{socket.gethostname()}:{os.getpid()}")
+
+
+async def main():
+    cache = await redis_db.init_redis()
+    try:
+        queued = await birthday_digest.run(cache, read_engine(), date.today())
+        logger.info("Queued %s birthday digests", queued)
+    finally:
+        await redis_db.close_redis()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
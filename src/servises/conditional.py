@@ -0,0 +1,184 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response, status
+
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag from the parts that identify a representation, e.g. the contact id and its version.
+
+    :param parts: Identifying parts.
+    :type parts: Any
+    :return: Quoted ETag, e.g. "12.3".
+    :rtype: str
+    """
+    return '"' + '.'.join(str(part) for part in parts) + '"'
+
+
+def collection_etag(rows: Iterable) -> str:
+    """
+    Strong ETag of a list of rows, it changes when a row is added, removed or updated.
+
+    :param rows: Rows or models with id and version.
+    :type rows: Iterable
+    :return: Quoted ETag.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for row_id, version in sorted((row.id, row.version) for row in rows):
+        digest.update(f"{row_id}.{version};".encode())
+    return '"' + digest.hexdigest() + '"'
+
+
+def last_modified(rows: Iterable) -> Optional[datetime]:
+    """
+    Latest updated_at of the rows.
+
+    :param rows: Rows or models with updated_at.
+    :type rows: Iterable
+    :return: Latest modification time or None for no rows.
+    :rtype: datetime | None
+    """
+    return max((row.updated_at for row in rows if row.updated_at is not None), default=None)
+
+
+def http_date(value: datetime) -> str:
+    """
+    Format a naive UTC time as an HTTP date.
+
+    :param value: Naive UTC time.
+    :type value: datetime
+    :return: HTTP date, e.g. "Sat, 17 Oct 2026 15:42:18 GMT".
+    :rtype: str
+    """
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an HTTP date into naive UTC time.
+
+    :param value: HTTP date or None.
+    :type value: str | None
+    :return: Naive UTC time, None if missing or invalid.
+    :rtype: datetime | None
+    """
+    if value is None:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_etags(header: str) -> list[str]:
+    """
+    Split an If-Match or If-None-Match header into ETags.
+
+    :param header: Header value.
+    :type header: str
+    :return: ETags, weak ones keep their W/ prefix.
+    :rtype: list[str]
+    """
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def is_conditional(request: Request) -> bool:
+    """
+    Check if the request carries a validator that a 304 could be answered to.
+
+    :param request: The incoming request.
+    :type request: Request
+    :return: True if If-None-Match or If-Modified-Since is present.
+    :rtype: bool
+    """
+    return any(header in request.headers for header in CONDITIONAL_HEADERS)
+
+
+def is_not_modified(request: Request, etag: str, modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-None-Match (weak comparison), or If-Modified-Since when there is no If-None-Match.
+
+    :param request: The incoming request.
+    :type request: Request
+    :param etag: Current ETag of the representation.
+    :type etag: str
+    :param modified: Current modification time, naive UTC.
+    :type modified: datetime | None
+    :return: True if the client's copy is current.
+    :rtype: bool
+    """
+    none_match = request.headers.get('if-none-match')
+    if none_match is not None:
+        tags = parse_etags(none_match)
+        return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+    since = parse_http_date(request.headers.get('if-modified-since'))
+    if since is None or modified is None:
+        return False
+    return modified.replace(microsecond=0) <= since
+
+
+def match_versions(request: Request, *parts) -> Optional[list[int]]:
+    """
+    Versions allowed by If-Match for the resource identified by parts, strong comparison.
+
+    ETags minted with make_etag(*parts, version) are accepted, any other ETag never matches.
+
+    :param request: The incoming request.
+    :type request: Request
+    :param parts: Identifying parts without the version.
+    :type parts: Any
+    :return: None if there is no precondition (no header or "*"), else the allowed versions, possibly empty.
+    :rtype: list[int] | None
+    """
+    header = request.headers.get('if-match')
+    if header is None:
+        return None
+    tags = parse_etags(header)
+    if '*' in tags:
+        return None
+    prefix = make_etag(*parts)[:-1] + '.'
+    return [int(tag[len(prefix):-1]) for tag in tags
+            if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix):-1].isdigit()]
+
+
+def set_validators(response: Response, etag: str, modified: Optional[datetime]) -> None:
+    """
+    Add ETag and Last-Modified headers to the response.
+
+    :param response: The outgoing response.
+    :type response: Response
+    :param etag: ETag of the representation.
+    :type etag: str
+    :param modified: Modification time, naive UTC.
+    :type modified: datetime | None
+    :return: None.
+    :rtype: None
+    """
+    response.headers['ETag'] = etag
+    if modified is not None:
+        response.headers['Last-Modified'] = http_date(modified)
+
+
+def not_modified(etag: str, modified: Optional[datetime]) -> Response:
+    """
+    Empty 304 response carrying the current validators.
+
+    :param etag: ETag of the representation.
+    :type etag: str
+    :param modified: Modification time, naive UTC.
+    :type modified: datetime | None
+    :return: 304 Not Modified.
+    :rtype: Response
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, modified)
+    return response
@@ -0,0 +1,323 @@
+import codecs
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator, Iterable
+
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+
+from src.database.models import Contacts, Users
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactCreate, BulkImportResult, RowError
+
+CSV_FIELDS = ('name', 'lastname', 'email', 'phone', 'birthday', 'additional')
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+MAX_CSV_RECORD_CHARS = 4096
+EXPORT_FIELDS = ('id',) + CSV_FIELDS
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Split a byte stream into UTF-8 text lines without reading it whole.
+
+    :param chunks: Request body chunks.
+    :type chunks: AsyncIterator[bytes]
+    :return: Lines without the line terminator.
+    :rtype: AsyncIterator[str]
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail.rstrip('\r')
+
+
+def ends_in_quotes(line: str, in_quotes: bool) -> bool:
+    """
+    Tell whether a CSV record is still inside a quoted field at the end of the line.
+
+    Follows the csv module's default dialect: a quote opens a quoted field only at the start
+    of a field, elsewhere it is a literal character; inside a quoted field "" is an escaped quote.
+
+    :param line: Line without the line terminator.
+    :type line: str
+    :param in_quotes: Whether the line starts inside a quoted field.
+    :type in_quotes: bool
+    :return: Whether the record continues on the next line.
+    :rtype: bool
+    """
+    position = 0
+    while True:
+        position = line.find('"', position)
+        if position < 0:
+            return in_quotes
+        if in_quotes:
+            if line.startswith('"', position + 1):
+                position += 2
+                continue
+            in_quotes = False
+        elif position == 0 or line[position - 1] == ',':
+            in_quotes = True
+        position += 1
+
+
+class LineFeed:
+    """
+    Input of csv.reader, filled with the lines of one complete record before each read.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """
+    Parse a CSV stream with a header row into dicts, quoted fields may span lines.
+
+    The lines go through one csv.reader as they arrive, a record is read once its last line
+    is in. A record longer than MAX_CSV_RECORD_CHARS, e.g. after a quote that is never closed,
+    or one the csv module rejects yields an error marker, and parsing goes on with the next line.
+
+    :param chunks: Request body chunks.
+    :type chunks: AsyncIterator[bytes]
+    :return: Records keyed by the header columns.
+    :rtype: AsyncIterator[dict]
+    """
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    in_quotes = False
+    size = 0
+    async for line in iter_lines(chunks):
+        if not in_quotes and not line.strip():
+            continue
+        feed.lines.append(line + '\n')
+        size += len(line) + 1
+        in_quotes = ends_in_quotes(line, in_quotes)
+        if size > MAX_CSV_RECORD_CHARS:
+            feed.lines.clear()
+            in_quotes = False
+            size = 0
+            yield {'__error__': f'Record is longer than {MAX_CSV_RECORD_CHARS} characters'}
+            continue
+        if in_quotes:
+            continue
+        size = 0
+        try:
+            values = next(reader)
+        except csv.Error as error:
+            feed.lines.clear()
+            yield {'__error__': f'Malformed CSV: {error}'}
+            continue
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            continue
+        yield dict(zip(header, values))
+    if in_quotes:
+        yield {'__error__': 'Quoted field is not closed at the end of the file'}
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """
+    Parse a newline delimited JSON stream, a line that is not a JSON object yields an error marker.
+
+    :param chunks: Request body chunks.
+    :type chunks: AsyncIterator[bytes]
+    :return: Records.
+    :rtype: AsyncIterator[dict]
+    """
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            record = {'__error__': 'Line is not a JSON object'}
+        yield record
+
+
+def validate_record(record: dict) -> ContactCreate:
+    """
+    Validate one imported record against ContactCreate, empty CSV cells count as missing.
+
+    :param record: Parsed record.
+    :type record: dict
+    :return: Validated contact data.
+    :rtype: ContactCreate
+    :raises ValueError: If the record is not a valid contact.
+    """
+    if '__error__' in record:
+        raise ValueError(record['__error__'])
+    return ContactCreate.model_validate({key: value for key, value in record.items() if value not in ('', None)})
+
+
+def error_messages(error: Exception) -> list[str]:
+    """
+    Flatten a validation error into readable messages.
+
+    :param error: Validation error.
+    :type error: Exception
+    :return: Messages like "email: value is not a valid email address".
+    :rtype: list[str]
+    """
+    if isinstance(error, ValidationError):
+        return [f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}" for item in error.errors()]
+    return [str(error)]
+
+
+async def save_chunk(chunk: list[tuple[int, ContactCreate]], result: BulkImportResult, user: Users, db: AsyncSession):
+    """
+    Insert one chunk of validated rows, on a database error the chunk is rolled back and reported as failed.
+
+    :param chunk: Row numbers with validated contact data.
+    :type chunk: list[tuple[int, ContactCreate]]
+    :param result: Import result to update.
+    :type result: BulkImportResult
+    :param user: The user to create the contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: None.
+    :rtype: None
+    """
+    try:
+        result.inserted += await repository_contacts.create_contacts([body for _, body in chunk], user, db)
+    except SQLAlchemyError as error:
+        await db.rollback()
+        add_errors(result, ((row, [f"Database error: {error.__class__.__name__}"]) for row, _ in chunk))
+
+
+def add_errors(result: BulkImportResult, errors: Iterable[tuple[int, list[str]]]):
+    """
+    Count failed rows, only the first MAX_REPORTED_ERRORS are reported in detail.
+
+    :param result: Import result to update.
+    :type result: BulkImportResult
+    :param errors: Row numbers with error messages.
+    :type errors: Iterable[tuple[int, list[str]]]
+    :return: None.
+    :rtype: None
+    """
+    for row, messages in errors:
+        result.failed += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(RowError(row=row, errors=messages))
+        else:
+            result.errors_truncated = True
+
+
+async def import_contacts(records: AsyncIterator[dict], user: Users, db: AsyncSession,
+                          chunk_size: int = IMPORT_CHUNK_SIZE) -> BulkImportResult:
+    """
+    Validate streamed records and insert the valid ones in chunks, one transaction per chunk.
+
+    Only one chunk is held in memory. Rows are numbered from 1 in the order they
+    were read, the CSV header is not counted.
+
+    :param records: Parsed records, from iter_csv_records or iter_ndjson_records.
+    :type records: AsyncIterator[dict]
+    :param user: The user to create the contacts for.
+    :type user: Users
+    :param db: The database session.
+    :type db: AsyncSession
+    :param chunk_size: The number of rows per insert and commit.
+    :type chunk_size: int
+    :return: Inserted and failed counts with per-row errors.
+    :rtype: BulkImportResult
+    """
+    result = BulkImportResult()
+    chunk = []
+    row = 0
+    async for record in records:
+        row += 1
+        try:
+            chunk.append((row, validate_record(record)))
+        except ValueError as error:
+            add_errors(result, [(row, error_messages(error))])
+        if len(chunk) >= chunk_size:
+            await save_chunk(chunk, result, user, db)
+            chunk = []
+    if chunk:
+        await save_chunk(chunk, result, user, db)
+    return result
+
+
+def format_csv(rows: Iterable[tuple]) -> bytes:
+    """
+    Render rows as CSV lines.
+
+    :param rows: Rows in EXPORT_FIELDS order.
+    :type rows: Iterable[tuple]
+    :return: Encoded CSV lines.
+    :rtype: bytes
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def format_ndjson(rows: Iterable[tuple]) -> bytes:
+    """
+    Render rows as newline delimited JSON objects.
+
+    :param rows: Rows in EXPORT_FIELDS order.
+    :type rows: Iterable[tuple]
+    :return: Encoded NDJSON lines.
+    :rtype: bytes
+    """
+    return b''.join(to_json(dict(zip(EXPORT_FIELDS, row))) + b'\n' for row in rows)
+
+
+async def export_contacts(fmt: str, user: Users, bind: AsyncEngine) -> AsyncIterator[bytes]:
+    """
+    Stream all contacts of a specific user as CSV or NDJSON.
+
+    Rows come from a server-side cursor in batches of EXPORT_BATCH_SIZE and every batch
+    is encoded and yielded at once, so memory use does not depend on the number of contacts.
+    The generator opens its own session, it outlives the request's one while the response is streamed.
+
+    :param fmt: Output format, csv or ndjson.
+    :type fmt: str
+    :param user: The user to export the contacts of.
+    :type user: Users
+    :param bind: The engine to read from.
+    :type bind: AsyncEngine
+    :return: Encoded chunks of the export.
+    :rtype: AsyncIterator[bytes]
+    """
+    formatter = format_csv if fmt == 'csv' else format_ndjson
+    if fmt == 'csv':
+        yield format_csv([EXPORT_FIELDS])
+    columns = [getattr(Contacts, field) for field in EXPORT_FIELDS]
+    stmt = select(*columns).filter(Contacts.user_id == user.id).order_by(Contacts.id)
+    async with AsyncSession(bind) as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield formatter(rows)
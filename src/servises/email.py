@@ -1,48 +1,101 @@
+import logging
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
 from pathlib import Path
+from typing import Optional, Union
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import redis.asyncio as redis
+from jinja2 import TemplateError
 
 from src.repository import auth
+from src.schemas import EmailJob
+from .mail_queue import mail_queue
+from .mail_templates import TemplateRegistry
 from ..config.config import settings1
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings1.m_username,
-    MAIL_PASSWORD=settings1.m_password,
-    MAIL_FROM=settings1.m_from,
-    MAIL_PORT=587,
-    MAIL_SERVER='smtp.gmail.com',
-    MAIL_FROM_NAME="Your assistant",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).resolve().parent / 'templates',
-)
+logger = logging.getLogger(__name__)
 
+TEMPLATE_FOLDER = Path(__file__).resolve().parent / 'templates'
+CONFIRMATION_TEMPLATE = 'email_template.html'
+templates = TemplateRegistry(TEMPLATE_FOLDER)
+templates.precompile(CONFIRMATION_TEMPLATE, ('host', 'username', 'token'))
 
-async def send_email(email: str, host: str):
+
+def confirmation_job(email: str, host: str) -> EmailJob:
     """
-    Function to send a message with email verofycation to user.
+    Build the email verification message for a user.
 
     :param email: User's email.
     :type email: str
     :param host: Host where our app is running.
     :type host: str
+    :return: Message to queue.
+    :rtype: EmailJob
+    """
+    token_verification = auth.create_email_token(data={"sub": email})
+    return EmailJob(recipient=email,
+                    subject="Confirm your email ",
+                    template=CONFIRMATION_TEMPLATE,
+                    body={"host": str(host), "username": email, "token": token_verification})
+
+
+def build_message(job: EmailJob, content: str) -> EmailMessage:
+    """
+    Wrap the job's rendered template into a MIME message.
+
+    The Message-ID is derived from the job id, so a message sent again after a retry keeps it.
+
+    :param job: Queued message.
+    :type job: EmailJob
+    :param content: The rendered template.
+    :type content: str
+    :return: Message ready for SMTP.
+    :rtype: EmailMessage
+    """
+    message = EmailMessage()
+    message["From"] = formataddr((settings1.m_from_name, settings1.m_from))
+    message["To"] = job.recipient
+    message["Subject"] = job.subject
+    message["Message-ID"] = make_msgid(idstring=job.id, domain=settings1.m_from.rpartition("@")[2] or None)
+    message.set_content(content, subtype="html")
+    return message
+
+
+async def build_messages(jobs: list[EmailJob]) -> list[Union[EmailMessage, TemplateError]]:
+    """
+    Render a batch of jobs off the event loop.
+
+    :param jobs: Queued messages.
+    :type jobs: list[EmailJob]
+    :return: Messages, or the error for a job whose template failed, in order.
+    :rtype: list[EmailMessage | TemplateError]
+    """
+    rendered = await templates.render_batch([(job.template, job.body) for job in jobs])
+    return [content if isinstance(content, TemplateError) else build_message(job, content)
+            for job, content in zip(jobs, rendered)]
+
+
+async def send_email(email: str, host: str, cache: Optional[redis.Redis]):
+    """
+    Queue a message with email verification to user, the mail worker sends it.
+
+    Without Redis the message cannot be queued, redis.ConnectionError is raised like for an
+    unreachable server, so the caller can roll back instead of losing the email.
+
+    :param email: User's email.
+    :type email: str
+    :param host: Host where our app is running.
+    :type host: str
+    :param cache: The shared Redis client holding the queue.
+    :type cache: redis.Redis | None
     :return: None.
     :rtype: None
+    :raises redis.RedisError: The queue is not available.
     """
+    if cache is None:
+        raise redis.ConnectionError("Redis is not available")
     try:
-        token_verification = auth.create_email_token(data={"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": email, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
-
+        await mail_queue.enqueue(cache, confirmation_job(email, host))
+    except redis.RedisError as error:
+        logger.error("Could not queue the confirmation email to %s: %s", email, error)
+        raise
@@ -0,0 +1,310 @@
+import random
+import time
+from typing import Optional
+
+import redis.asyncio as redis
+
+from ..config.config import settings1
+from ..schemas import EmailJob
+
+
+class MailQueue:
+    """
+    Durable outbound mail queue kept in Redis lists.
+
+    Producers push jobs onto {prefix}:ready. A worker moves a batch of them into its own
+    {prefix}:processing:{worker} list with LMOVE, so every job is in exactly one list. Live
+    workers keep a {prefix}:lease:{worker} key alive, the processing lists of workers whose
+    lease expired are handed back by recover_orphans(). Failed jobs wait in the
+    {prefix}:retry sorted set scored by the time they are due, jobs out of attempts end up
+    in {prefix}:dead.
+    """
+
+    def __init__(self, prefix: str, max_attempts: int, retry_base: float, retry_max: float):
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.ready = f"{prefix}:ready"
+        self.retry = f"{prefix}:retry"
+        self.dead = f"{prefix}:dead"
+        self.workers = f"{prefix}:workers"
+
+    def processing(self, worker: str) -> str:
+        """
+        Key of the list holding the jobs a worker is sending.
+
+        :param worker: Worker name.
+        :type worker: str
+        :return: Redis key.
+        :rtype: str
+        """
+        return f"{self.prefix}:processing:{worker}"
+
+    async def enqueue(self, cache: redis.Redis, job: EmailJob) -> None:
+        """
+        Queue a message.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param job: Message to send.
+        :type job: EmailJob
+        :return: None.
+        :rtype: None
+        """
+        await cache.lpush(self.ready, job.model_dump_json())
+
+    def enqueue_many(self, pipe: redis.client.Pipeline, jobs: list[EmailJob]) -> None:
+        """
+        Queue messages as part of the caller's pipeline, so they can be committed together with other writes.
+
+        :param pipe: Pipeline, usually a transaction, executed by the caller.
+        :type pipe: redis.client.Pipeline
+        :param jobs: Messages to send.
+        :type jobs: list[EmailJob]
+        :return: None.
+        :rtype: None
+        """
+        if jobs:
+            pipe.lpush(self.ready, *(job.model_dump_json() for job in jobs))
+
+    async def claim(self, cache: redis.Redis, worker: str, batch_size: int, timeout: float) -> list[bytes]:
+        """
+        Move up to batch_size jobs into the worker's processing list, waiting up to timeout for the first one.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :param batch_size: Maximal number of jobs.
+        :type batch_size: int
+        :param timeout: Seconds to wait for a job.
+        :type timeout: float
+        :return: Raw jobs, oldest first, to be passed back to ack() or fail().
+        :rtype: list[bytes]
+        """
+        processing = self.processing(worker)
+        first = await cache.blmove(self.ready, processing, timeout, "RIGHT", "LEFT")
+        if first is None:
+            return []
+        jobs = [first]
+        while len(jobs) < batch_size:
+            raw = await cache.lmove(self.ready, processing, "RIGHT", "LEFT")
+            if raw is None:
+                break
+            jobs.append(raw)
+        return jobs
+
+    async def ack(self, cache: redis.Redis, worker: str, raw: bytes) -> None:
+        """
+        Drop a sent job.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :param raw: Job as returned by claim().
+        :type raw: bytes
+        :return: None.
+        :rtype: None
+        """
+        await cache.lrem(self.processing(worker), 1, raw)
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Seconds to wait before the next attempt, doubled with every attempt up to retry_max, with 10 % jitter.
+
+        :param attempts: Attempts made so far.
+        :type attempts: int
+        :return: Delay in seconds.
+        :rtype: float
+        """
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay * random.uniform(1.0, 1.1)
+
+    async def fail(self, cache: redis.Redis, worker: str, raw: bytes, job: EmailJob, error: str,
+                   permanent: bool = False) -> str:
+        """
+        Schedule a failed job for another attempt, or move it to the dead list.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :param raw: Job as returned by claim().
+        :type raw: bytes
+        :param job: The decoded job.
+        :type job: EmailJob
+        :param error: Why it failed.
+        :type error: str
+        :param permanent: True if retrying cannot help, e.g. the recipient was refused.
+        :type permanent: bool
+        :return: retried or failed.
+        :rtype: str
+        """
+        job.attempts += 1
+        job.last_error = error
+        async with cache.pipeline(transaction=True) as pipe:
+            if permanent or job.attempts >= self.max_attempts:
+                pipe.lpush(self.dead, job.model_dump_json())
+                result = "failed"
+            else:
+                pipe.zadd(self.retry, {job.model_dump_json(): time.time() + self.backoff(job.attempts)})
+                result = "retried"
+            pipe.lrem(self.processing(worker), 1, raw)
+            await pipe.execute()
+        return result
+
+    async def bury(self, cache: redis.Redis, worker: str, raw: bytes) -> None:
+        """
+        Move a job that cannot be decoded straight to the dead list.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :param raw: Job as returned by claim().
+        :type raw: bytes
+        :return: None.
+        :rtype: None
+        """
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.dead, raw)
+            pipe.lrem(self.processing(worker), 1, raw)
+            await pipe.execute()
+
+    async def promote_due(self, cache: redis.Redis, now: Optional[float] = None, limit: int = 100) -> int:
+        """
+        Move retries that are due back onto the ready list.
+
+        The move is one transaction watching the retry set, if another worker changed it in
+        between nothing is moved and the next call tries again.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param now: Current time, defaults to time.time().
+        :type now: float | None
+        :param limit: Maximal number of jobs to move.
+        :type limit: int
+        :return: Number of jobs moved.
+        :rtype: int
+        """
+        now = time.time() if now is None else now
+        async with cache.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.retry)
+                due = await pipe.zrangebyscore(self.retry, "-inf", now, start=0, num=limit)
+                if not due:
+                    return 0
+                pipe.multi()
+                pipe.zrem(self.retry, *due)
+                pipe.lpush(self.ready, *due)
+                await pipe.execute()
+            except redis.WatchError:
+                return 0
+        return len(due)
+
+    def lease(self, worker: str) -> str:
+        """
+        Key that exists while the worker is alive.
+
+        :param worker: Worker name.
+        :type worker: str
+        :return: Redis key.
+        :rtype: str
+        """
+        return f"{self.prefix}:lease:{worker}"
+
+    async def heartbeat(self, cache: redis.Redis, worker: str, ttl: float) -> None:
+        """
+        Register the worker and extend its lease by ttl seconds.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :param ttl: Lease length in seconds.
+        :type ttl: float
+        :return: None.
+        :rtype: None
+        """
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.sadd(self.workers, worker)
+            pipe.set(self.lease(worker), 1, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def release(self, cache: redis.Redis, worker: str) -> None:
+        """
+        Hand back the worker's unfinished jobs and unregister it, on a clean shutdown.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :return: None.
+        :rtype: None
+        """
+        await self.recover(cache, worker)
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.delete(self.lease(worker))
+            pipe.srem(self.workers, worker)
+            await pipe.execute()
+
+    async def recover_orphans(self, cache: redis.Redis) -> int:
+        """
+        Hand the jobs of workers whose lease expired back to the ready list and forget those workers.
+
+        Jobs are moved one at a time with LMOVE, so two workers recovering the same orphan
+        cannot requeue a job twice.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: Number of jobs handed back.
+        :rtype: int
+        """
+        moved = 0
+        for member in await cache.smembers(self.workers):
+            worker = member.decode() if isinstance(member, bytes) else member
+            if await cache.exists(self.lease(worker)):
+                continue
+            moved += await self.recover(cache, worker)
+            await cache.srem(self.workers, worker)
+        return moved
+
+    async def recover(self, cache: redis.Redis, worker: str) -> int:
+        """
+        Hand the jobs left in a worker's processing list back to the ready list.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param worker: Worker name.
+        :type worker: str
+        :return: Number of jobs handed back.
+        :rtype: int
+        """
+        moved = 0
+        while await cache.lmove(self.processing(worker), self.ready, "LEFT", "RIGHT") is not None:
+            moved += 1
+        return moved
+
+    async def depth(self, cache: redis.Redis) -> dict[str, int]:
+        """
+        Number of jobs ready, waiting for a retry and dead.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: Lengths by queue.
+        :rtype: dict[str, int]
+        """
+        async with cache.pipeline(transaction=False) as pipe:
+            pipe.llen(self.ready)
+            pipe.zcard(self.retry)
+            pipe.llen(self.dead)
+            ready, retry, dead = await pipe.execute()
+        return {"ready": ready, "retry": retry, "dead": dead}
+
+
+mail_queue = MailQueue("mail",
+                       max_attempts=settings1.mail_max_attempts,
+                       retry_base=settings1.mail_retry_base,
+                       retry_max=settings1.mail_retry_max)
@@ -0,0 +1,198 @@
+import asyncio
+import uuid
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from jinja2 import Environment, FileSystemLoader, Template, TemplateError, select_autoescape
+from markupsafe import escape
+
+
+class Skeleton:
+    """
+    A template rendered once with placeholders, split into its static parts and the fields between them.
+
+    Rendering is then a join of the static parts with the escaped values, no Jinja code runs.
+    """
+
+    def __init__(self, parts: list[str], fields: list[str], autoescape: bool):
+        self.parts = parts
+        self.fields = fields
+        self.autoescape = autoescape
+
+    @classmethod
+    def build(cls, template: Template, fields: Iterable[str], autoescape: bool) -> Optional["Skeleton"]:
+        """
+        Split a template on its fields, if the fields are only substituted.
+
+        The template is rendered with two different sets of markers and with empty values, a
+        field used in a condition, a loop or a filter renders differently around them and the
+        template is left to Jinja.
+
+        :param template: Compiled template.
+        :type template: Template
+        :param fields: Names of the variables that change from message to message.
+        :type fields: Iterable[str]
+        :param autoescape: Whether the values are HTML escaped like Jinja does.
+        :type autoescape: bool
+        :return: Skeleton or None.
+        :rtype: Skeleton | None
+        """
+        fields = list(fields)
+        renders = []
+        for _ in range(2):
+            markers = {field: f"\x00{uuid.uuid4().hex}\x00" for field in fields}
+            rendered = template.render(**markers)
+            names = {marker: field for field, marker in markers.items()}
+            chunks = rendered.split("\x00")
+            # odd chunks are the markers, even ones the static text between them
+            if len(chunks) % 2 == 0 or any(f"\x00{chunk}\x00" not in names for chunk in chunks[1::2]):
+                return None
+            renders.append((chunks[0::2], [names[f"\x00{chunk}\x00"] for chunk in chunks[1::2]]))
+        if renders[0] != renders[1]:
+            return None
+        parts, order = renders[0]
+        skeleton = cls(parts, order, autoescape)
+        empty = dict.fromkeys(fields, "")
+        if skeleton.render(empty) != template.render(**empty):
+            return None
+        return skeleton
+
+    def render(self, context: dict) -> str:
+        """
+        Substitute the fields.
+
+        :param context: Values of the fields.
+        :type context: dict
+        :return: Rendered text.
+        :rtype: str
+        """
+        out = [self.parts[0]]
+        for field, part in zip(self.fields, self.parts[1:]):
+            value = context[field]
+            out.append(str(escape(value)) if self.autoescape else str(value))
+            out.append(part)
+        return "".join(out)
+
+
+class TemplateRegistry:
+    """
+    The mail templates of a folder, compiled once.
+
+    load() compiles every template and builds a Skeleton for the templates registered with
+    precompile(), whose output only differs by a few substituted fields. The environment does
+    not check the files for changes, a template edited on disk is picked up on restart.
+    """
+
+    def __init__(self, folder: Union[str, Path]):
+        self.folder = Path(folder)
+        self.environment = Environment(loader=FileSystemLoader(self.folder),
+                                       autoescape=select_autoescape(["html"]),
+                                       auto_reload=False)
+        self._templates: dict[str, Template] = {}
+        self._skeletons: dict[str, Optional[Skeleton]] = {}
+        self._fields: dict[str, tuple[str, ...]] = {}
+
+    def precompile(self, name: str, fields: Iterable[str]) -> None:
+        """
+        Register a template whose static parts are rendered ahead, only fields change per message.
+
+        :param name: Template file name.
+        :type name: str
+        :param fields: Names of the variables that change from message to message.
+        :type fields: Iterable[str]
+        :return: None.
+        :rtype: None
+        """
+        self._fields[name] = tuple(fields)
+        self._skeletons.pop(name, None)
+
+    def load(self) -> None:
+        """
+        Compile all templates of the folder and the registered skeletons.
+
+        :return: None.
+        :rtype: None
+        :raises TemplateError: A template does not compile.
+        """
+        for name in self.environment.list_templates():
+            self.get(name)
+        for name in self._fields:
+            self.skeleton(name)
+
+    def get(self, name: str) -> Template:
+        """
+        Compiled template, compiled on first use if load() did not run.
+
+        :param name: Template file name.
+        :type name: str
+        :return: Template.
+        :rtype: Template
+        :raises TemplateError: The template is missing or does not compile.
+        """
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = self.environment.get_template(name)
+        return template
+
+    def skeleton(self, name: str) -> Optional[Skeleton]:
+        """
+        Skeleton of a template registered with precompile().
+
+        :param name: Template file name.
+        :type name: str
+        :return: Skeleton or None if the template is not registered or not a plain substitution.
+        :rtype: Skeleton | None
+        """
+        if name not in self._fields:
+            return None
+        if name not in self._skeletons:
+            template = self.get(name)
+            self._skeletons[name] = Skeleton.build(template, self._fields[name],
+                                                   bool(self.environment.autoescape and
+                                                        self.environment.autoescape(name)))
+        return self._skeletons[name]
+
+    def render(self, name: str, context: dict) -> str:
+        """
+        Render a template, through its skeleton when the context holds exactly its fields.
+
+        :param name: Template file name.
+        :type name: str
+        :param context: Template variables.
+        :type context: dict
+        :return: Rendered text.
+        :rtype: str
+        :raises TemplateError: The template is missing or failed to render.
+        """
+        skeleton = self.skeleton(name)
+        if skeleton is not None and context.keys() == set(self._fields[name]):
+            return skeleton.render(context)
+        return self.get(name).render(**context)
+
+    def render_many(self, items: list[tuple[str, dict]]) -> list[Union[str, TemplateError]]:
+        """
+        Render several messages, a failure is returned in place of its text.
+
+        :param items: Template names with their variables.
+        :type items: list[tuple[str, dict]]
+        :return: Rendered texts or errors, in order.
+        :rtype: list[str | TemplateError]
+        """
+        rendered = []
+        for name, context in items:
+            try:
+                rendered.append(self.render(name, context))
+            except TemplateError as error:
+                rendered.append(error)
+        return rendered
+
+    async def render_batch(self, items: list[tuple[str, dict]]) -> list[Union[str, TemplateError]]:
+        """
+        render_many() in a worker thread, one hop per batch, so rendering does not block the event loop.
+
+        :param items: Template names with their variables.
+        :type items: list[tuple[str, dict]]
+        :return: Rendered texts or errors, in order.
+        :rtype: list[str | TemplateError]
+        """
+        return await asyncio.to_thread(self.render_many, items)
@@ -0,0 +1,359 @@
+"""
+Mail worker: drains the Redis mail queue over pooled, authenticated SMTP connections.
+
+It runs inside the app unless MAIL_WORKER_IN_APP is off, or on its own:
+
+    python -m src.servises.mail_worker
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiosmtplib
+import redis.asyncio as redis
+from jinja2 import TemplateError
+from pydantic import ValidationError
+
+from ..config.config import settings1
+from ..database import redis_db
+from ..schemas import EmailJob
+from . import metrics
+from .email import build_messages, templates
+from .mail_queue import MailQueue, mail_queue
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_ERRORS = (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError)
+
+
+class SMTPPool:
+    """
+    Up to size connected and logged-in SMTP sessions, reused from batch to batch.
+
+    A session idle for longer than idle_timeout is closed instead of reused, servers drop
+    them on their own after a while.
+    """
+
+    def __init__(self, hostname: str, port: int, username: Optional[str], password: Optional[str], size: int,
+                 use_tls: bool = False, start_tls: bool = True, validate_certs: bool = True,
+                 idle_timeout: float = 60, timeout: float = 30):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.size = size
+        self._slots = asyncio.Semaphore(size)
+        self._idle: list[tuple[aiosmtplib.SMTP, float]] = []
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        """
+        Open and authenticate a new session.
+
+        :return: Connected client.
+        :rtype: aiosmtplib.SMTP
+        """
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                               start_tls=self.start_tls, validate_certs=self.validate_certs, timeout=self.timeout)
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        metrics.SMTP_CONNECTIONS.inc()
+        return smtp
+
+    async def discard(self, smtp: aiosmtplib.SMTP) -> None:
+        """
+        Close a session, politely if it is still up.
+
+        :param smtp: Client to close.
+        :type smtp: aiosmtplib.SMTP
+        :return: None.
+        :rtype: None
+        """
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except CONNECTION_ERRORS:
+            smtp.close()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        """
+        Borrow a session, it goes back to the pool unless the block raised.
+
+        :return: Connected client.
+        :rtype: AsyncIterator[aiosmtplib.SMTP]
+        """
+        async with self._slots:
+            smtp = None
+            while self._idle and smtp is None:
+                candidate, since = self._idle.pop()
+                if candidate.is_connected and time.monotonic() - since < self.idle_timeout:
+                    smtp = candidate
+                else:
+                    await self.discard(candidate)
+            if smtp is None:
+                smtp = await self.connect()
+            try:
+                yield smtp
+            except BaseException:
+                await self.discard(smtp)
+                raise
+            if smtp.is_connected:
+                self._idle.append((smtp, time.monotonic()))
+
+    async def close(self) -> None:
+        """
+        Close the idle sessions.
+
+        :return: None.
+        :rtype: None
+        """
+        while self._idle:
+            smtp, _ = self._idle.pop()
+            await self.discard(smtp)
+
+
+class MailWorker:
+    """
+    Claims batches of queued messages and sends each batch over one pooled SMTP session.
+
+    Refused recipients and other 5xx replies fail the message for good, 4xx replies, timeouts
+    and dropped connections send it back to the queue with exponential backoff. As many batches
+    are sent at once as the pool has sessions.
+    """
+
+    def __init__(self, queue: MailQueue, pool: SMTPPool, name: str, batch_size: int, poll_timeout: float = 1.0,
+                 lease: float = 60):
+        self.queue = queue
+        self.pool = pool
+        self.name = name
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+        self._cache: Optional[redis.Redis] = None
+
+    async def failed(self, cache: redis.Redis, raw: bytes, job: EmailJob, error: str, permanent: bool = False):
+        result = await self.queue.fail(cache, self.name, raw, job, error, permanent)
+        metrics.EMAIL_MESSAGES.labels(result=result).inc()
+        logger.warning("Email %s to %s %s: %s", job.id, job.recipient, result, error)
+
+    async def process_batch(self, cache: redis.Redis, raws: list[bytes]) -> None:
+        """
+        Send claimed jobs over one session, every job is acknowledged or failed.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param raws: Jobs as returned by MailQueue.claim().
+        :type raws: list[bytes]
+        :return: None.
+        :rtype: None
+        """
+        metrics.EMAIL_BATCH_SIZE.observe(len(raws))
+        pending = []
+        for raw in raws:
+            try:
+                pending.append((raw, EmailJob.model_validate_json(raw)))
+            except ValidationError as error:
+                await self.queue.bury(cache, self.name, raw)
+                metrics.EMAIL_MESSAGES.labels(result="failed").inc()
+                logger.error("Malformed email job dropped: %s", error)
+
+        # the whole batch is rendered in one hop to a worker thread
+        messages = await build_messages([job for _, job in pending])
+        sendable = []
+        for (raw, job), message in zip(pending, messages):
+            if isinstance(message, TemplateError):
+                await self.failed(cache, raw, job, repr(message), permanent=True)
+            else:
+                sendable.append((raw, job, message))
+        pending = sendable
+        if not pending:
+            return
+
+        try:
+            async with self.pool.connection() as smtp:
+                while pending:
+                    raw, job, message = pending[0]
+                    start = time.perf_counter()
+                    try:
+                        await smtp.send_message(message)
+                    except aiosmtplib.SMTPRecipientsRefused as error:
+                        permanent = all(refused.code >= 500 for refused in error.recipients)
+                        await self.failed(cache, raw, job, str(error), permanent)
+                    except aiosmtplib.SMTPResponseException as error:
+                        await self.failed(cache, raw, job, f"{error.code} {error.message}", error.code >= 500)
+                    else:
+                        await self.queue.ack(cache, self.name, raw)
+                        metrics.EMAIL_MESSAGES.labels(result="sent").inc()
+                    metrics.EMAIL_SEND_DURATION.observe(time.perf_counter() - start)
+                    pending.pop(0)
+        except CONNECTION_ERRORS as error:
+            # no session or it dropped, the rest of the batch is tried again later
+            for raw, job, _ in pending:
+                await self.failed(cache, raw, job, repr(error))
+
+    async def consume(self, cache: redis.Redis) -> None:
+        """
+        Claim and send batches until cancelled.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            try:
+                await self.queue.promote_due(cache)
+                start = time.monotonic()
+                raws = await self.queue.claim(cache, self.name, self.batch_size, self.poll_timeout)
+                if raws:
+                    await self.process_batch(cache, raws)
+                else:
+                    # the blocking claim may return early, e.g. on a server that does not block
+                    await asyncio.sleep(max(0.0, self.poll_timeout - (time.monotonic() - start)))
+                for queue, depth in (await self.queue.depth(cache)).items():
+                    metrics.EMAIL_QUEUE_DEPTH.labels(queue=queue).set(depth)
+            except redis.RedisError as error:
+                logger.warning("Mail queue unavailable: %s", error)
+                await asyncio.sleep(self.poll_timeout)
+
+    async def keep_lease(self, cache: redis.Redis) -> None:
+        """
+        Renew the worker's lease three times per lease period and requeue the jobs of workers that died.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            try:
+                await self.queue.heartbeat(cache, self.name, self.lease)
+                recovered = await self.queue.recover_orphans(cache)
+                if recovered:
+                    logger.info("Requeued %s emails left by workers that stopped", recovered)
+            except redis.RedisError as error:
+                logger.warning("Could not renew the lease of %s: %s", self.name, error)
+            await asyncio.sleep(self.lease / 3)
+
+    async def take_lease(self, cache: redis.Redis) -> None:
+        """
+        Take the worker's first lease, retrying while Redis is unavailable.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            try:
+                await self.queue.heartbeat(cache, self.name, self.lease)
+                return
+            except redis.RedisError as error:
+                logger.warning("Could not take the lease of %s: %s", self.name, error)
+            await asyncio.sleep(self.lease / 3)
+
+    async def run(self, cache: redis.Redis) -> None:
+        """
+        Take a lease, then consume with one loop per pooled session.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        await self.take_lease(cache)
+        await asyncio.gather(self.keep_lease(cache), *(self.consume(cache) for _ in range(self.pool.size)))
+
+    def start(self, cache: redis.Redis) -> None:
+        """
+        Run the worker in the background.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :return: None.
+        :rtype: None
+        """
+        if self._task is None:
+            self._cache = cache
+            self._task = asyncio.create_task(self.run(cache))
+            self._task.add_done_callback(self.stopped)
+
+    def stopped(self, task: asyncio.Task) -> None:
+        """
+        Log why the worker's task ended, unless it was stopped.
+
+        :param task: The worker's task.
+        :type task: asyncio.Task
+        :return: None.
+        :rtype: None
+        """
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Mail worker %s stopped, no emails are sent", self.name, exc_info=task.exception())
+
+    async def stop(self) -> None:
+        """
+        Stop the worker, hand back its unfinished jobs and close its sessions.
+
+        :return: None.
+        :rtype: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            # a task that crashed was logged by stopped()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            try:
+                await self.queue.release(self._cache, self.name)
+            except redis.RedisError as error:
+                logger.warning("Could not release %s, its jobs are recovered when the lease expires: %s",
+                               self.name, error)
+        await self.pool.close()
+
+
+def create_worker() -> MailWorker:
+    """
+    Mail worker configured from settings.
+
+    :return: Worker.
+    :rtype: MailWorker
+    """
+    pool = SMTPPool(settings1.m_server, settings1.m_port, settings1.m_username, settings1.m_password,
+                    size=settings1.mail_smtp_connections,
+                    use_tls=settings1.m_ssl_tls,
+                    start_tls=settings1.m_starttls,
+                    validate_certs=settings1.m_validate_certs,
+                    idle_timeout=settings1.mail_idle_timeout)
+    # every process gets its own processing list, e.g. one per uvicorn worker
+    name = settings1.mail_worker_name or f"{socket.gethostname()}:{os.getpid()}"
+    return MailWorker(mail_queue, pool, name=name, batch_size=settings1.mail_batch_size,
+                      lease=settings1.mail_worker_lease)
+
+
+mail_worker = create_worker()
+
+
+async def main():
+    templates.load()
+    cache = await redis_db.init_redis()
+    mail_worker.start(cache)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mail_worker.stop()
+        await redis_db.close_redis()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SQL_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled')
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'Request latency by route template',
+                          ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'SQL statement execution time',
+                              ['pool', 'operation'], buckets=FAST_BUCKETS)
+REDIS_DURATION = Histogram('redis_command_duration_seconds', 'Redis command latency', ['command'],
+                           buckets=FAST_BUCKETS)
+HASH_QUEUE_DEPTH = Gauge('hash_jobs_queued', 'Password hash jobs waiting for a free worker')
+
+DB_POOL_SIZE = Gauge('db_pool_size', 'Configured number of persistent connections', ['pool'])
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections currently checked out of the pool', ['pool'])
+DB_POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond pool_size', ['pool'])
+DB_POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent checking out a connection', ['pool'],
+                         buckets=WAIT_BUCKETS)
+DB_POOL_TIMEOUTS = Counter('db_pool_timeouts', 'Checkouts that gave up after pool_timeout', ['pool'])
+EMAIL_MESSAGES = Counter('email_messages', 'Emails handled by the mail worker by result', ['result'])
+EMAIL_SEND_DURATION = Histogram('email_send_duration_seconds', 'Time to hand one message to the SMTP server',
+                                buckets=LATENCY_BUCKETS)
+EMAIL_BATCH_SIZE = Histogram('email_batch_size', 'Messages sent over one SMTP connection in a batch',
+                             buckets=(1, 2, 5, 10, 20, 50, 100))
+EMAIL_QUEUE_DEPTH = Gauge('email_queue_depth', 'Emails waiting in the queue', ['queue'])
+SMTP_CONNECTIONS = Counter('smtp_connections_opened', 'SMTP sessions opened and authenticated')
+BIRTHDAY_DIGESTS = Counter('birthday_digests_queued', 'Birthday reminder digests handed to the mail queue')
+DB_REPLICA_HEALTHY = Gauge('db_replica_healthy', '1 if the replica passed its last health check', ['pool'])
+
+
+def observe_pool(engine: AsyncEngine, name: str) -> None:
+    """
+    Export the size, checked-out and overflow gauges of an engine's queue pool, read when metrics are collected.
+
+    The pool is looked up on every read, so the gauges follow it when dispose() replaces it.
+
+    :param engine: Engine with a queue pool.
+    :type engine: AsyncEngine
+    :param name: Value of the pool label, e.g. primary.
+    :type name: str
+    :return: None.
+    :rtype: None
+    """
+    DB_POOL_SIZE.labels(pool=name).set_function(lambda: engine.pool.size())
+    DB_POOL_CHECKED_OUT.labels(pool=name).set_function(lambda: engine.pool.checkedout())
+    DB_POOL_OVERFLOW.labels(pool=name).set_function(lambda: max(engine.pool.overflow(), 0))
+
+
+def sql_operation(statement: str) -> str:
+    """
+    Statement type for the operation label, anything but SELECT, INSERT, UPDATE and DELETE is OTHER.
+
+    :param statement: SQL statement.
+    :type statement: str
+    :return: Operation.
+    :rtype: str
+    """
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else ''
+    return operation if operation in SQL_OPERATIONS else 'OTHER'
+
+
+def observe_queries(engine: AsyncEngine, name: str) -> None:
+    """
+    Time every statement run by the engine into db_query_duration_seconds.
+
+    :param engine: Engine to instrument.
+    :type engine: AsyncEngine
+    :param name: Value of the pool label, e.g. primary.
+    :type name: str
+    :return: None.
+    :rtype: None
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.labels(pool=name, operation=sql_operation(statement))\
+            .observe(time.perf_counter() - context.metrics_start)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class CacheStats:
+    """
+    Hit and miss counters of a cache that does not keep its own.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+class CacheCollector(Collector):
+    """
+    Export the hits and misses counted by in-process caches as cache_requests_total.
+    """
+
+    def __init__(self):
+        self.caches = {}
+
+    def add(self, name: str, cache) -> None:
+        """
+        Export the counters of a cache.
+
+        :param name: Value of the cache label.
+        :type name: str
+        :param cache: Object with hits and misses attributes.
+        :type cache: Any
+        :return: None.
+        :rtype: None
+        """
+        self.caches[name] = cache
+
+    def collect(self):
+        family = CounterMetricFamily('cache_requests', 'Cache lookups by result', labels=['cache', 'result'])
+        for name, cache in self.caches.items():
+            family.add_metric([name, 'hit'], cache.hits)
+            family.add_metric([name, 'miss'], cache.misses)
+        yield family
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+def route_template(scope: dict) -> str:
+    """
+    Path template of the route that handled the request, e.g. /api/contacts/{contact_id}.
+
+    Newer FastAPI versions leave the included router's own route in the scope and keep the
+    prefixed path in the effective route context, so that one is preferred when present.
+
+    :param scope: ASGI scope after the request was handled.
+    :type scope: dict
+    :return: Path template, unmatched if no route matched.
+    :rtype: str
+    """
+    context = scope.get('fastapi', {}).get('effective_route_context')
+    if context is not None:
+        return context.path
+    return getattr(scope.get('route'), 'path_format', 'unmatched')
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting in-flight requests and timing every request by its route template.
+
+    The route is the matched path template, e.g. /api/contacts/{contact_id}, so ids do not
+    become label values, requests that match no route are labelled unmatched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_DURATION.labels(method=scope['method'], route=route_template(scope), status=str(status_code))\
+                .observe(time.perf_counter() - start)
@@ -0,0 +1,152 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    """
+    Statements run while handling one request, or inside capture_queries().
+
+    A statement run again and again with different parameters, e.g. one lazy load per
+    row of a list, shows up as a repeated statement.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        """
+        Count a statement.
+
+        :param statement: SQL statement.
+        :type statement: str
+        :param duration: Seconds it took.
+        :type duration: float
+        :return: None.
+        :rtype: None
+        """
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Statements run at least threshold times, most repeated first.
+
+        :param threshold: Minimal number of runs.
+        :type threshold: int
+        :return: Statements with their number of runs.
+        :rtype: list[tuple[str, int]]
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+    def report(self) -> str:
+        """
+        Human readable summary for logs and failed assertions.
+
+        :return: Summary.
+        :rtype: str
+        """
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        lines += [f"  {count}x {statement}" for statement, count in self.statements.most_common()]
+        return "\n".join(lines)
+
+
+current_log: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+
+def watch(engine: AsyncEngine, slow_query_ms: int) -> None:
+    """
+    Record the engine's statements into the current request's QueryLog and log slow ones with their parameters.
+
+    :param engine: Engine to watch.
+    :type engine: AsyncEngine
+    :param slow_query_ms: Statements slower than this are logged, 0 disables it.
+    :type slow_query_ms: int
+    :return: None.
+    :rtype: None
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_log_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_log_start
+        log = current_log.get()
+        if log is not None:
+            log.record(statement, duration)
+        if slow_query_ms and duration * 1000 >= slow_query_ms:
+            logger.warning("Slow query (%.1f ms): %s %r", duration * 1000, statement, parameters)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+@contextmanager
+def capture_queries() -> Iterator[QueryLog]:
+    """
+    Record the statements of every engine in the process while the block runs.
+
+    Unlike the request log this does not depend on the context, so it also sees queries
+    run by a TestClient in its own thread.
+
+    :return: Log filled while the block runs.
+    :rtype: Iterator[QueryLog]
+    """
+    log = QueryLog()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.capture_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log.record(statement, time.perf_counter() - context.capture_start)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    try:
+        yield log
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+class QueryLogMiddleware:
+    """
+    ASGI middleware giving every request its own QueryLog.
+
+    A request running more than max_queries statements, or the same statement repeat_threshold
+    times or more, is logged as a warning with the statements it ran.
+    """
+
+    def __init__(self, app, max_queries: int, repeat_threshold: int):
+        self.app = app
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = current_log.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_log.reset(token)
+            repeated = log.repeated(self.repeat_threshold)
+            if repeated:
+                logger.warning("Possible N+1 in %s %s: %s", scope["method"], scope["path"],
+                               "; ".join(f"{count}x {statement}" for statement, count in repeated))
+            elif log.count > self.max_queries:
+                logger.warning("%s %s ran %s", scope["method"], scope["path"], log.report())
@@ -0,0 +1,283 @@
+import hashlib
+import logging
+import time
+from typing import Optional
+
+import redis.asyncio as redis
+from fastapi import Request, Response
+from pydantic_core import to_json, from_json
+
+from src.config.config import settings1
+from src.servises import conditional, metrics
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_VERSION = 1
+CACHED_HEADERS = ('etag', 'last-modified', 'x-next-cursor')
+
+
+class ResponseCache:
+    """
+    Redis cache of serialized per-user responses, invalidated at once by a per-user generation counter.
+
+    Entries are keyed by user id, generation, route and query parameters. A write bumps the
+    generation, so old entries are never read again and expire by their TTL. The generation is
+    read before the database is queried, a response that raced with a write is therefore stored
+    under the old generation and cannot hide the write.
+
+    With max_total_bytes set, the entries are also listed by store time in a sorted set with their
+    sizes in a hash and their total in a counter. A store that takes the total over the cap evicts
+    the expired entries first, then the oldest ones, until the cache fits again.
+    """
+
+    def __init__(self, prefix: str, ttl: int, max_bytes: int, max_total_bytes: int = 0, evict_batch: int = 32):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.evict_batch = evict_batch
+        self.index_key = f"{prefix}:index"
+        self.sizes_key = f"{prefix}:sizes"
+        self.total_key = f"{prefix}:bytes"
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+        self.evicted = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Share of lookups answered from the cache.
+
+        :return: Hits divided by lookups, 0 before the first lookup.
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def generation_key(self, user_id: int) -> str:
+        """
+        Build the Redis key of the user's generation counter.
+
+        :param user_id: The user's ID.
+        :type user_id: int
+        :return: Redis key.
+        :rtype: str
+        """
+        return f"{self.prefix}:gen:{user_id}"
+
+    async def key(self, cache: Optional[redis.Redis], user_id: int, route: str, params: dict) -> Optional[str]:
+        """
+        Build the entry key for the user's current generation.
+
+        :param cache: The shared Redis client, None disables the cache.
+        :type cache: redis.Redis | None
+        :param user_id: The user's ID.
+        :type user_id: int
+        :param route: Name of the cached route.
+        :type route: str
+        :param params: Query parameters the response depends on.
+        :type params: dict
+        :return: Redis key, None if the cache is disabled or unavailable.
+        :rtype: str | None
+        """
+        if cache is None or self.ttl <= 0:
+            return None
+        try:
+            generation = await cache.get(self.generation_key(user_id))
+        except redis.RedisError as error:
+            logger.warning("Response cache unavailable: %s", error)
+            return None
+        digest = hashlib.sha1(to_json(params)).hexdigest()
+        return f"{self.prefix}:v{RESPONSE_CACHE_VERSION}:{user_id}:{int(generation or 0)}:{route}:{digest}"
+
+    async def get(self, cache: Optional[redis.Redis], key: Optional[str]) -> Optional[tuple[dict, bytes]]:
+        """
+        Get a cached response and count the hit or miss.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param key: Entry key from key().
+        :type key: str | None
+        :return: Response headers and body, or None.
+        :rtype: tuple[dict, bytes] | None
+        """
+        if key is None:
+            return None
+        try:
+            data = await cache.get(key)
+        except redis.RedisError as error:
+            logger.warning("Response cache unavailable: %s", error)
+            data = None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        headers, _, body = data.partition(b'\n')
+        return from_json(headers), body
+
+    async def store(self, cache: Optional[redis.Redis], key: Optional[str], response: Response) -> Response:
+        """
+        Store a JSON response for the TTL with the headers worth replaying, bodies over max_bytes are not cached.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param key: Entry key from key().
+        :type key: str | None
+        :param response: Response to store.
+        :type response: Response
+        :return: The same response.
+        :rtype: Response
+        """
+        if key is None:
+            return response
+        if len(response.body) > self.max_bytes:
+            self.oversized += 1
+            return response
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        entry = to_json(headers) + b'\n' + response.body
+        try:
+            if self.max_total_bytes > 0:
+                await self.store_counted(cache, key, entry)
+            else:
+                await cache.set(key, entry, ex=self.ttl)
+        except redis.RedisError as error:
+            logger.warning("Response cache unavailable: %s", error)
+        return response
+
+    async def store_counted(self, cache: redis.Redis, key: str, entry: bytes) -> None:
+        """
+        Store an entry, add its size to the total and evict entries if the total went over max_total_bytes.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param key: Entry key from key().
+        :type key: str
+        :param entry: Serialized headers and body.
+        :type entry: bytes
+        :return: None.
+        :rtype: None
+        """
+        now = time.time()
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.set(key, entry, ex=self.ttl)
+            pipe.zadd(self.index_key, {key: now})
+            pipe.hsetnx(self.sizes_key, key, len(entry))
+            *_, added = await pipe.execute()
+        if not added:
+            return
+        total = await cache.incrby(self.total_key, len(entry))
+        if total > self.max_total_bytes:
+            await self.evict(cache, total, now)
+
+    async def evict(self, cache: redis.Redis, total: int, now: float) -> None:
+        """
+        Forget the entries that expired by TTL, then delete the oldest ones until the total fits the cap.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param total: Total size of the entries after the last store.
+        :type total: int
+        :param now: Time of the last store.
+        :type now: float
+        :return: None.
+        :rtype: None
+        """
+        expired = True
+        while total > self.max_total_bytes:
+            keys = []
+            if expired:
+                keys = await cache.zrangebyscore(self.index_key, '-inf', now - self.ttl, start=0, num=self.evict_batch)
+                expired = bool(keys)
+            if not keys:
+                keys = await cache.zrange(self.index_key, 0, self.evict_batch - 1)
+            if not keys:
+                return
+            freed, removed = await self.remove(cache, keys)
+            if not expired:
+                self.evicted += removed
+            total = await cache.decrby(self.total_key, freed)
+
+    async def remove(self, cache: redis.Redis, keys: list) -> tuple[int, int]:
+        """
+        Delete entries and their sizes in one transaction.
+
+        Only the sizes this call removed are reported, so entries evicted by two workers at once
+        are subtracted from the total once.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis
+        :param keys: Entry keys.
+        :type keys: list
+        :return: Bytes freed and the number of entries removed.
+        :rtype: tuple[int, int]
+        """
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.hmget(self.sizes_key, keys)
+            for key in keys:
+                pipe.hdel(self.sizes_key, key)
+            pipe.zrem(self.index_key, *keys)
+            pipe.delete(*keys)
+            sizes, *results = await pipe.execute()
+        removed = [int(size) for size, done in zip(sizes, results[:len(keys)]) if done]
+        return sum(removed), len(removed)
+
+    async def invalidate(self, cache: Optional[redis.Redis], user_id: int) -> None:
+        """
+        Bump the user's generation, so all of their cached responses become stale at once.
+
+        :param cache: The shared Redis client.
+        :type cache: redis.Redis | None
+        :param user_id: The user's ID.
+        :type user_id: int
+        :return: None.
+        :rtype: None
+        """
+        if cache is None:
+            return
+        try:
+            await cache.incr(self.generation_key(user_id))
+        except redis.RedisError as error:
+            logger.warning("Response cache invalidation failed for user %s: %s", user_id, error)
+
+    def respond(self, request: Request, headers: dict, body: bytes) -> Response:
+        """
+        Replay a cached response, or answer 304 if it matches the request's validators.
+
+        :param request: The incoming request.
+        :type request: Request
+        :param headers: Cached response headers.
+        :type headers: dict
+        :param body: Cached response body.
+        :type body: bytes
+        :return: The response.
+        :rtype: Response
+        """
+        etag = headers.get('etag')
+        if etag is not None and conditional.is_conditional(request):
+            modified = conditional.parse_http_date(headers.get('last-modified'))
+            if conditional.is_not_modified(request, etag, modified):
+                response = conditional.not_modified(etag, modified)
+                response.headers.update({name: value for name, value in headers.items()
+                                         if name not in ('etag', 'last-modified')})
+                return response
+        return Response(content=body, media_type='application/json', headers=headers)
+
+    def clear_stats(self) -> None:
+        """
+        Reset the counters.
+
+        :return: None.
+        :rtype: None
+        """
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+        self.evicted = 0
+
+
+contacts_cache = ResponseCache('contacts',
+                               ttl=settings1.response_cache_ttl,
+                               max_bytes=settings1.response_cache_max_bytes,
+                               max_total_bytes=settings1.response_cache_max_total_bytes)
+metrics.cache_collector.add('contacts_response', contacts_cache)
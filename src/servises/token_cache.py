@@ -0,0 +1,84 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    """
+    In-process LRU of verified JWT claims, keyed by the token digest and kept until the token's exp.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """
+        Key the entry by the token digest, so the cache does not hold raw tokens.
+
+        :param token: JWT string.
+        :type token: str
+        :return: SHA-256 digest of the token.
+        :rtype: bytes
+        """
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """
+        Get decoded claims of a token verified before, expired entries are dropped.
+
+        :param token: JWT string.
+        :type token: str
+        :return: Decoded claims or None.
+        :rtype: dict | None
+        """
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expire, claims = entry
+        if expire <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def set(self, token: str, claims: dict) -> None:
+        """
+        Store decoded claims until the token's exp, evicting the least recently used entry when full.
+
+        :param token: JWT string.
+        :type token: str
+        :param claims: Decoded and verified claims.
+        :type claims: dict
+        :return: None.
+        :rtype: None
+        """
+        if self.maxsize <= 0 or 'exp' not in claims:
+            return
+        key = self.digest(token)
+        self._entries[key] = (float(claims['exp']), claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all entries and reset the counters.
+
+        :return: None.
+        :rtype: None
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -1,24 +1,32 @@
 import sys
 import os
 import pytest
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
 from main import app
 from src.database.models import Base
 from src.database.db import get_db
+from src.routes import auth, contacts, users
+from src.servises.query_log import capture_queries
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -38,13 +46,19 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    async def no_limit():
+        return None
 
     app.dependency_overrides[get_db] = override_get_db
+    # the RateLimiter instances need FastAPILimiter.init with a Redis server, the tests run without one
+    for router in (contacts.router, auth.router, users.router):
+        for route in router.routes:
+            for dependency in route.dependencies:
+                app.dependency_overrides[dependency.dependency] = no_limit
 
     yield TestClient(app)
 
@@ -52,3 +66,17 @@ def client(session):
 @pytest.fixture(scope="module")
 def user():
     return {"username": "smith@gmail.com", "password": "123456789"}
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Fail the test if the block runs more statements than allowed, e.g. ``with max_queries(1): client.get(...)``.
+    """
+    @contextmanager
+    def check(limit):
+        with capture_queries() as log:
+            yield log
+        assert log.count <= limit, log.report()
+
+    return check
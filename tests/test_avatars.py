@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+
+import fakeredis
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from main import app
+from src.database.models import Base, Users
+from src.database.redis_db import get_redis
+from src.repository.auth import get_current_user
+from src.schemas import UserCache
+from src.servises.avatars import AvatarUploader, avatar_uploader
+
+
+class UploadStub:
+    """
+    Stand-in for the Cloudinary upload endpoint that checks the signature like the real one.
+    """
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        self.requests.append((request.url.path, body))
+        fields = dict(part.split(b"\r\n\r\n", 1) for part in body.split(b"--" + boundary(request))[1:-1])
+        form = {header.split(b'name="')[1].split(b'"')[0].decode(): value.rstrip(b"\r\n")
+                for header, value in fields.items()}
+        params = {key: form[key].decode() for key in ("overwrite", "public_id", "timestamp")}
+        expected = hashlib.sha1(("&".join(f"{key}={params[key]}" for key in sorted(params)) + "secret").encode())
+        if form["signature"].decode() != expected.hexdigest() or form["api_key"] != b"key":
+            return httpx.Response(401, json={"error": {"message": "Invalid Signature"}})
+        return httpx.Response(self.status_code, json={"public_id": params["public_id"], "version": 1700000000})
+
+
+def boundary(request: httpx.Request) -> bytes:
+    return request.headers["content-type"].split("boundary=")[1].encode()
+
+
+class TestAvatarUploader(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'avatars.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.sessionmaker() as session:
+            session.add(Users(username="smith@gmail.com", password="x", avatar="old"))
+            await session.commit()
+        self.cache = fakeredis.FakeAsyncRedis()
+        self.stub = UploadStub()
+        self.uploader = AvatarUploader("demo", "key", "secret", "http://upload.test", prefix="avatar",
+                                       concurrency=2, job_ttl=60, sessionmaker=self.sessionmaker)
+        self.uploader.start(transport=httpx.MockTransport(self.stub))
+
+    async def asyncTearDown(self):
+        await self.uploader.stop()
+        await self.cache.aclose()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def avatar(self):
+        async with self.sessionmaker() as session:
+            return await session.scalar(select(Users.avatar).where(Users.username == "smith@gmail.com"))
+
+    async def test_upload_finishes_in_the_background(self):
+        job = await self.uploader.submit(self.cache, "smith@gmail.com", b"\x89PNG")
+        self.assertEqual(job.status, "pending")
+        self.assertEqual(await self.cache.ttl(self.uploader.job_key(job.id)), 60)
+
+        await self.uploader.stop()
+        done = await self.uploader.job(self.cache, job.id, "smith@gmail.com")
+        self.assertEqual(done.status, "done")
+        self.assertEqual(done.avatar, await self.avatar())
+        self.assertNotEqual(done.avatar, "old")
+        [(path, body)] = self.stub.requests
+        self.assertEqual(path, "/v1_1/demo/image/upload")
+        self.assertIn(b"\x89PNG", body)
+        # the job is only visible to its user
+        self.assertIsNone(await self.uploader.job(self.cache, job.id, "other@gmail.com"))
+
+    async def test_rejected_upload_fails_the_job(self):
+        self.stub.status_code = 500
+        job = await self.uploader.submit(self.cache, "smith@gmail.com", b"\x89PNG")
+        await self.uploader.stop()
+
+        failed = await self.uploader.job(self.cache, job.id, "smith@gmail.com")
+        self.assertEqual((failed.status, failed.avatar), ("failed", None))
+        self.assertEqual(await self.avatar(), "old")
+
+    async def test_deleted_user_fails_the_job(self):
+        job = await self.uploader.submit(self.cache, "gone@gmail.com", b"\x89PNG")
+        await self.uploader.stop()
+
+        failed = await self.uploader.job(self.cache, job.id, "gone@gmail.com")
+        self.assertEqual((failed.status, failed.detail), ("failed", "User not found"))
+
+    async def test_unexpected_error_fails_the_job(self):
+        def broken_url(public_id, version):
+            raise RuntimeError("no cloud name")
+
+        self.uploader.avatar_url = broken_url
+        with self.assertLogs("src.servises.avatars", "ERROR"):
+            job = await self.uploader.submit(self.cache, "smith@gmail.com", b"\x89PNG")
+            await self.uploader.stop()
+
+        failed = await self.uploader.job(self.cache, job.id, "smith@gmail.com")
+        self.assertEqual((failed.status, failed.detail), ("failed", "Avatar upload failed"))
+        self.assertEqual(await self.avatar(), "old")
+
+    async def test_uploads_are_bounded(self):
+        running = []
+        peak = []
+        upload = self.uploader.upload
+
+        async def slow_upload(content, public_id):
+            running.append(public_id)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(public_id)
+            return await upload(content, public_id)
+
+        self.uploader.upload = slow_upload
+        for _ in range(5):
+            await self.uploader.submit(self.cache, "smith@gmail.com", b"\x89PNG")
+        await self.uploader.stop()
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(len(self.stub.requests), 5)
+
+    def test_signature(self):
+        # example from the Cloudinary docs on signed uploads
+        uploader = AvatarUploader("demo", "key", "abcd", "http://upload.test", prefix="avatar",
+                                  concurrency=1, job_ttl=60)
+        params = {"eager": "w_400,h_300,c_pad|w_260,h_200,c_crop", "public_id": "sample_image",
+                  "timestamp": 1315060510}
+        self.assertEqual(uploader.signature(params), "bfd09f95f331f558cbd1320e67aa8d488770583e")
+
+
+@pytest.fixture
+def avatar_client(client, monkeypatch):
+    cache = fakeredis.FakeAsyncRedis()
+    process = AsyncMock()
+    monkeypatch.setattr(avatar_uploader, "process", process)
+    app.dependency_overrides[get_current_user] = lambda: UserCache(id=1, username="avatar@gmail.com")
+    app.dependency_overrides[get_redis] = lambda: cache
+    yield client, process
+    del app.dependency_overrides[get_current_user]
+    del app.dependency_overrides[get_redis]
+
+
+def test_avatar_upload_is_accepted(avatar_client):
+    client, process = avatar_client
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", b"\x89PNG", "image/png")})
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert job["status"] == "pending"
+    assert process.await_args.args[1:] == (job["id"], "avatar@gmail.com", b"\x89PNG")
+
+    status = client.get(response.headers["location"])
+    assert status.status_code == 200, status.text
+    assert status.json() == {"id": job["id"], "status": "pending", "avatar": None, "detail": None}
+    assert client.get("/api/users/avatar/jobs/unknown").status_code == 404
+
+
+def test_avatar_too_large(avatar_client, monkeypatch):
+    client, process = avatar_client
+    monkeypatch.setattr("src.routes.users.settings1.avatar_max_bytes", 3)
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", b"\x89PNG", "image/png")})
+    assert response.status_code == 413, response.text
+    process.assert_not_awaited()
+
+
+def test_avatar_upload_without_redis(avatar_client):
+    client, process = avatar_client
+    app.dependency_overrides[get_redis] = lambda: None
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", b"\x89PNG", "image/png")})
+    assert response.status_code == 503, response.text
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+import fakeredis
+import redis.asyncio as redis
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contacts, Users
+from src.schemas import EmailJob
+from src.servises.birthday_digest import BirthdayDigest, Digest, next_birthday
+from src.servises.email import templates
+from src.servises.mail_queue import MailQueue
+
+TODAY = date(2025, 12, 30)
+
+
+def contact(name, birthday, user_id):
+    return Contacts(name=name, lastname="Smith", email="smith@gmail.com", phone="9876543210",
+                    birthday=birthday, user_id=user_id)
+
+
+class TestBirthdayDigest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'digest.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(self.engine)() as session:
+            session.add_all([Users(id=user_id, username=f"user{user_id}@gmail.com", password="x", confirmed=True)
+                             for user_id in (1, 2, 3)]
+                            + [Users(id=4, username="new@gmail.com", password="x", confirmed=False)])
+            session.add_all([contact("Jan", date(1990, 1, 2), 1), contact("Dec", date(1985, 12, 31), 1),
+                             contact("Far", date(1990, 6, 1), 1),
+                             contact("Eve", date(2000, 12, 30), 2),
+                             contact("Late", date(2000, 1, 7), 3),
+                             contact("Hidden", date(2000, 12, 31), 4)])
+            await session.commit()
+        self.cache = fakeredis.FakeAsyncRedis()
+        self.queue = MailQueue("mail", max_attempts=3, retry_base=5, retry_max=60)
+        self.digest = BirthdayDigest(self.queue, "birthdays", days=7, batch_size=1, owner="test")
+
+    async def asyncTearDown(self):
+        await self.cache.aclose()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def queued(self):
+        return [EmailJob.model_validate_json(raw) for raw in reversed(await self.cache.lrange(self.queue.ready, 0, -1))]
+
+    async def test_one_digest_per_user_with_upcoming_birthdays(self):
+        self.assertEqual(await self.digest.run(self.cache, self.engine, TODAY), 2)
+
+        jobs = await self.queued()
+        self.assertEqual([job.recipient for job in jobs], ["user1@gmail.com", "user2@gmail.com"])
+        self.assertEqual([(item["name"], item["days_left"]) for item in jobs[0].body["contacts"]],
+                         [("Dec", 1), ("Jan", 3)])
+        self.assertEqual(jobs[0].id, "birthdays-20251230-1")
+        self.assertIn("Dec Smith &mdash; December 31 (tomorrow)",
+                      templates.render(jobs[0].template, jobs[0].body))
+        # done for today, the lock is given back
+        self.assertEqual(await self.digest.run(self.cache, self.engine, TODAY), 0)
+        self.assertFalse(await self.cache.exists(self.digest.lock))
+        self.assertEqual(len(await self.queued()), 2)
+
+    async def test_crashed_run_resumes_after_the_checkpoint(self):
+        commit = self.digest.commit
+        calls = []
+
+        async def crash_on_second_batch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise redis.ConnectionError("connection lost")
+            await commit(*args, **kwargs)
+
+        with patch.object(self.digest, "commit", crash_on_second_batch):
+            with self.assertRaises(redis.ConnectionError):
+                await self.digest.run(self.cache, self.engine, TODAY)
+        self.assertEqual(await self.digest.resume_point(self.cache, TODAY), 1)
+
+        self.assertEqual(await self.digest.run(self.cache, self.engine, TODAY), 1)
+        self.assertEqual([job.recipient for job in await self.queued()], ["user1@gmail.com", "user2@gmail.com"])
+        self.assertIsNone(await self.digest.resume_point(self.cache, TODAY))
+        # the next day starts over
+        self.assertEqual(await self.digest.resume_point(self.cache, date(2025, 12, 31)), 0)
+
+    async def test_run_held_by_another_process_is_skipped(self):
+        await self.cache.set(self.digest.lock, "other", px=60000)
+        self.assertEqual(await self.digest.run(self.cache, self.engine, TODAY), 0)
+        self.assertEqual(await self.cache.get(self.digest.lock), b"other")
+        self.assertEqual(await self.queued(), [])
+
+
+class TestDigest(unittest.TestCase):
+
+    def test_keeps_the_nearest_birthdays(self):
+        digest = Digest(1, "user1@gmail.com", limit=2)
+        for day in (9, 3, 7, 1, 5):
+            digest.add(f"C{day}", "Smith", date(1990, 3, day), date(2025, 3, 1))
+        job = digest.job(date(2025, 3, 1), days=10)
+
+        self.assertEqual([item["name"] for item in job.body["contacts"]], ["C1", "C3"])
+        self.assertEqual(job.body["more"], 3)
+
+    def test_next_birthday(self):
+        self.assertEqual(next_birthday(date(2000, 2, 29), date(2025, 2, 1)), date(2025, 2, 28))
+        self.assertEqual(next_birthday(date(2000, 2, 29), date(2027, 12, 1)), date(2028, 2, 29))
+        self.assertEqual(next_birthday(date(1990, 1, 2), TODAY), date(2026, 1, 2))
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.models import Base, Contacts, Users
+from src.servises.contacts_io import export_contacts
+
+ROWS = 200_000
+PEAK_LIMIT = 8 * 1024 * 1024
+
+
+class TestExportMemory(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, "export.db")
+        engine = create_engine(f"sqlite:///{cls.path}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(Users), [{"id": 1, "username": "smith@gmail.com", "password": "x"}])
+            conn.execute(insert(Contacts), [
+                {"name": f"name{i}", "lastname": f"lastname{i}", "email": f"contact{i}@gmail.com",
+                 "phone": f"380{i:09d}", "birthday": date(2000, 2, 3), "additional": "Just friend", "user_id": 1}
+                for i in range(ROWS)
+            ])
+        engine.dispose()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+        self.user = Users(id=1)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def export(self, fmt):
+        lines = 0
+        size = 0
+        tracemalloc.start()
+        try:
+            async for chunk in export_contacts(fmt, self.user, self.engine):
+                lines += chunk.count(b"\n")
+                size += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return lines, size, peak
+
+    async def test_export_csv_bounded_memory(self):
+        lines, size, peak = await self.export("csv")
+        self.assertEqual(lines, ROWS + 1)
+        self.assertLess(peak, PEAK_LIMIT)
+        self.assertLess(peak, size / 4)
+
+    async def test_export_ndjson_bounded_memory(self):
+        lines, size, peak = await self.export("ndjson")
+        self.assertEqual(lines, ROWS)
+        self.assertLess(peak, PEAK_LIMIT)
+        self.assertLess(peak, size / 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
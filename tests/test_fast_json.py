@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contacts, Users
+from src.repository import contacts as repository_contacts
+from src.routes.contacts import contacts_response, rows_response
+
+
+class TestFastJson(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'json.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.session.add(Users(id=1, username="a@gmail.com", password="x"))
+        self.session.add_all([Contacts(name=f"John{i}", lastname=f"Smith{i % 3}", email=f"c{i}@gmail.com",
+                                       phone=str(i), birthday=date(2000, 2, i + 1),
+                                       additional="Best \"friend\"" if i % 2 else None, user_id=1)
+                              for i in range(10)])
+        await self.session.commit()
+        self.user = Users(id=1)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def test_offset_page(self):
+        contacts = await repository_contacts.get_contacts(2, 5, self.user, self.session)
+        rows = await repository_contacts.get_contacts_rows(2, None, 5, self.user, self.session)
+        self.assertEqual(rows_response(rows).body, contacts_response(contacts).body)
+
+    async def test_keyset_page(self):
+        after = ("Smith1", "John1", 2)
+        contacts = await repository_contacts.get_contacts_after(after, 4, self.user, self.session)
+        rows = await repository_contacts.get_contacts_rows(0, after, 4, self.user, self.session, keyset=True)
+        self.assertEqual(rows_response(rows).body, contacts_response(contacts).body)
+        self.assertEqual(repository_contacts.encode_cursor(rows[-1]), repository_contacts.encode_cursor(contacts[-1]))
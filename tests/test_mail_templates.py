@@ -0,0 +1,71 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, TemplateError, select_autoescape
+
+from src.servises.email import TEMPLATE_FOLDER, CONFIRMATION_TEMPLATE, templates
+from src.servises.mail_templates import TemplateRegistry
+
+
+class TestTemplateRegistry(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+        (self.path / "plain.html").write_text("<p>Hi {{ username }}</p><a href=\"{{ host }}t/{{ token }}\">go</a>")
+        (self.path / "logic.html").write_text("{% if username %}Hi {{ username }}{% else %}Hi there{% endif %}")
+        (self.path / "filter.html").write_text("Hi {{ username|upper }}")
+        self.registry = TemplateRegistry(self.path)
+        for name in ("plain.html", "logic.html", "filter.html"):
+            self.registry.precompile(name, ("host", "username", "token") if name == "plain.html" else ("username",))
+        self.registry.load()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_confirmation_skeleton_matches_jinja(self):
+        jinja = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]))
+        context = {"host": "http://testserver/", "username": "<b>o'neil</b>&co@example.com", "token": "a.b.c"}
+
+        self.assertIsNotNone(templates.skeleton(CONFIRMATION_TEMPLATE))
+        rendered = templates.render(CONFIRMATION_TEMPLATE, context)
+        self.assertEqual(rendered, jinja.get_template(CONFIRMATION_TEMPLATE).render(**context))
+        self.assertIn("&lt;b&gt;o&#39;neil&lt;/b&gt;&amp;co@example.com", rendered)
+
+    def test_only_plain_substitutions_get_a_skeleton(self):
+        self.assertEqual(self.registry.skeleton("plain.html").fields, ["username", "host", "token"])
+        self.assertIsNone(self.registry.skeleton("logic.html"))
+        self.assertIsNone(self.registry.skeleton("filter.html"))
+        self.assertEqual(self.registry.render("logic.html", {"username": ""}), "Hi there")
+        self.assertEqual(self.registry.render("filter.html", {"username": "bob"}), "Hi BOB")
+        # a context with other variables goes through Jinja
+        self.assertEqual(self.registry.render("plain.html", {"username": "a", "host": "h/", "token": "t", "x": 1}),
+                         "<p>Hi a</p><a href=\"h/t/t\">go</a>")
+
+    def test_templates_are_compiled_once(self):
+        (self.path / "plain.html").write_text("changed {{ username }}")
+        (self.path / "logic.html").unlink()
+
+        self.assertEqual(self.registry.render("plain.html", {"username": "a", "host": "h/", "token": "t"}),
+                         "<p>Hi a</p><a href=\"h/t/t\">go</a>")
+        self.assertEqual(self.registry.render("logic.html", {"username": "a"}), "Hi a")
+
+    async def test_batch_is_rendered_in_a_thread(self):
+        threads = []
+        render_many = self.registry.render_many
+
+        def record(items):
+            threads.append(threading.get_ident())
+            return render_many(items)
+
+        self.registry.render_many = record
+        rendered = await self.registry.render_batch([("filter.html", {"username": "a"}),
+                                                     ("missing.html", {}),
+                                                     ("filter.html", {"username": "b"})])
+
+        self.assertEqual(rendered[0::2], ["Hi A", "Hi B"])
+        self.assertIsInstance(rendered[1], TemplateError)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
@@ -0,0 +1,227 @@
+import asyncio
+import socket
+import time
+import unittest
+from unittest.mock import patch
+
+import fakeredis
+import redis.asyncio as redis
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from prometheus_client import REGISTRY
+
+from src.schemas import EmailJob
+from src.servises.email import confirmation_job, send_email
+from src.servises.mail_queue import MailQueue
+from src.servises.mail_worker import MailWorker, SMTPPool
+
+WORKER = "test"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Handler:
+    def __init__(self):
+        self.sessions = 0
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refused"):
+            return "550 no such user"
+        if address.startswith("later"):
+            return "451 try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content.decode()))
+        return "250 Message accepted"
+
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == b"user" and auth_data.password == b"secret")
+
+
+def job(recipient):
+    return EmailJob(recipient=recipient, subject="Confirm your email ", template="email_template.html",
+                    body={"host": "http://testserver/", "username": recipient, "token": "t"})
+
+
+class TestMailWorker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.handler = Handler()
+        self.port = free_port()
+        self.server = Controller(self.handler, hostname="127.0.0.1", port=self.port,
+                                 authenticator=authenticate, auth_require_tls=False)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    async def asyncSetUp(self):
+        self.cache = fakeredis.FakeAsyncRedis()
+        self.queue = MailQueue("mail", max_attempts=3, retry_base=5, retry_max=60)
+        self.pool = SMTPPool("127.0.0.1", self.port, "user", "secret", size=1, start_tls=False)
+        self.worker = MailWorker(self.queue, self.pool, WORKER, batch_size=10, poll_timeout=0.1)
+
+    async def asyncTearDown(self):
+        await self.worker.stop()
+        await self.cache.aclose()
+
+    async def drain(self):
+        while raws := await self.queue.claim(self.cache, WORKER, self.worker.batch_size, timeout=0.1):
+            await self.worker.process_batch(self.cache, raws)
+
+    async def test_batches_reuse_one_authenticated_session(self):
+        opened = REGISTRY.get_sample_value("smtp_connections_opened_total") or 0
+        for i in range(15):
+            await self.queue.enqueue(self.cache, job(f"user{i}@example.com"))
+        await self.drain()
+
+        self.assertEqual([recipient for recipient, _ in self.handler.messages],
+                         [f"user{i}@example.com" for i in range(15)])
+        self.assertEqual(self.handler.sessions, 1)
+        self.assertEqual(REGISTRY.get_sample_value("smtp_connections_opened_total"), opened + 1)
+        self.assertIn("http://testserver/api/auth/confirmed_email/t", self.handler.messages[0][1])
+        self.assertEqual(await self.queue.depth(self.cache), {"ready": 0, "retry": 0, "dead": 0})
+        self.assertEqual(await self.cache.llen(self.queue.processing(WORKER)), 0)
+
+    async def test_refused_recipient_fails_for_good_and_4xx_is_retried(self):
+        for recipient in ("refused@example.com", "later@example.com", "ok@example.com"):
+            await self.queue.enqueue(self.cache, job(recipient))
+        await self.drain()
+
+        self.assertEqual([recipient for recipient, _ in self.handler.messages], ["ok@example.com"])
+        dead = [EmailJob.model_validate_json(raw) for raw in await self.cache.lrange(self.queue.dead, 0, -1)]
+        self.assertEqual([(item.recipient, item.attempts) for item in dead], [("refused@example.com", 1)])
+        [(raw, due)] = await self.cache.zrange(self.queue.retry, 0, -1, withscores=True)
+        retried = EmailJob.model_validate_json(raw)
+        self.assertEqual((retried.recipient, retried.attempts), ("later@example.com", 1))
+        self.assertIn("451", retried.last_error)
+        self.assertGreaterEqual(due, time.time() + 4)
+
+        self.assertEqual(await self.queue.promote_due(self.cache), 0)
+        self.assertEqual(await self.queue.promote_due(self.cache, now=due), 1)
+        self.assertEqual(await self.queue.depth(self.cache), {"ready": 1, "retry": 0, "dead": 1})
+
+    async def test_unreachable_server_retries_with_backoff_until_dead(self):
+        self.worker.pool = SMTPPool("127.0.0.1", free_port(), "user", "secret", size=1, start_tls=False)
+        await self.queue.enqueue(self.cache, job("user@example.com"))
+        delays = []
+        for _ in range(3):
+            await self.drain()
+            scores = await self.cache.zrange(self.queue.retry, 0, -1, withscores=True)
+            if scores:
+                delays.append(scores[0][1] - time.time())
+                await self.queue.promote_due(self.cache, now=scores[0][1])
+
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(4.5 < delays[0] < 5.6 and 9.5 < delays[1] < 11.1, delays)
+        [raw] = await self.cache.lrange(self.queue.dead, 0, -1)
+        self.assertEqual(EmailJob.model_validate_json(raw).attempts, 3)
+        self.assertEqual(self.handler.messages, [])
+
+    async def test_jobs_of_a_dead_worker_are_recovered(self):
+        for i in range(3):
+            await self.queue.enqueue(self.cache, job(f"user{i}@example.com"))
+        await self.queue.heartbeat(self.cache, "dead", ttl=60)
+        await self.queue.claim(self.cache, "dead", 10, timeout=0.1)
+        self.assertEqual(await self.queue.depth(self.cache), {"ready": 0, "retry": 0, "dead": 0})
+
+        # the lease is alive, the jobs stay with their worker
+        self.assertEqual(await self.queue.recover_orphans(self.cache), 0)
+        await self.cache.delete(self.queue.lease("dead"))
+        self.assertEqual(await self.queue.recover_orphans(self.cache), 3)
+        self.assertEqual(await self.cache.smembers(self.queue.workers), set())
+        await self.drain()
+        self.assertEqual([recipient for recipient, _ in self.handler.messages],
+                         [f"user{i}@example.com" for i in range(3)])
+
+    async def test_malformed_job_is_buried(self):
+        await self.cache.lpush(self.queue.ready, b"{not json")
+        await self.queue.enqueue(self.cache, job("ok@example.com"))
+        await self.drain()
+        self.assertEqual(await self.cache.lrange(self.queue.dead, 0, -1), [b"{not json"])
+        self.assertEqual(len(self.handler.messages), 1)
+
+    async def test_unknown_template_fails_for_good_without_a_session(self):
+        broken = job("user@example.com")
+        broken.template = "missing.html"
+        await self.queue.enqueue(self.cache, broken)
+        await self.drain()
+
+        [raw] = await self.cache.lrange(self.queue.dead, 0, -1)
+        self.assertIn("missing.html", EmailJob.model_validate_json(raw).last_error)
+        self.assertEqual(self.handler.sessions, 0)
+
+    async def test_send_email_queues_the_confirmation(self):
+        await send_email("new@example.com", "http://testserver/", self.cache)
+        [raw] = await self.cache.lrange("mail:ready", 0, -1)
+        queued = EmailJob.model_validate_json(raw)
+        self.assertEqual((queued.recipient, queued.template), ("new@example.com", "email_template.html"))
+        self.assertEqual(queued.body.keys(), confirmation_job("new@example.com", "http://testserver/").body.keys())
+
+    async def test_background_worker_sends_queued_mail(self):
+        self.worker.start(self.cache)
+        await self.queue.enqueue(self.cache, job("user@example.com"))
+        for _ in range(50):
+            if self.handler.messages:
+                break
+            await asyncio.sleep(0.05)
+        await self.worker.stop()
+
+        self.assertEqual([recipient for recipient, _ in self.handler.messages], ["user@example.com"])
+        self.assertEqual(REGISTRY.get_sample_value("email_queue_depth", {"queue": "ready"}), 0)
+        # a clean stop gives up the lease right away
+        self.assertFalse(await self.cache.exists(self.queue.lease(WORKER)))
+
+    async def test_worker_waits_for_redis_at_startup(self):
+        self.worker.lease = 0.3
+        heartbeat = self.queue.heartbeat
+        outage = [redis.ConnectionError("Connection refused")] * 2
+
+        async def flaky_heartbeat(*args, **kwargs):
+            if outage:
+                raise outage.pop()
+            await heartbeat(*args, **kwargs)
+
+        await self.queue.enqueue(self.cache, job("late@example.com"))
+        with patch.object(self.queue, "heartbeat", flaky_heartbeat), \
+                self.assertLogs("src.servises.mail_worker", "WARNING") as logs:
+            self.worker.start(self.cache)
+            for _ in range(50):
+                if self.handler.messages:
+                    break
+                await asyncio.sleep(0.05)
+        self.assertEqual([recipient for recipient, _ in self.handler.messages], ["late@example.com"])
+        self.assertEqual(len([line for line in logs.output if "Could not take the lease" in line]), 2)
+
+    async def test_crashed_worker_is_logged(self):
+        with patch.object(self.worker, "take_lease", side_effect=RuntimeError("boom")), \
+                self.assertLogs("src.servises.mail_worker", "ERROR") as logs:
+            self.worker.start(self.cache)
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        self.assertIn("Mail worker test stopped", logs.output[0])
+
+    async def test_starting_worker_leaves_live_siblings_alone(self):
+        await self.queue.enqueue(self.cache, job("sibling@example.com"))
+        await self.queue.heartbeat(self.cache, "sibling", ttl=60)
+        await self.queue.claim(self.cache, "sibling", 10, timeout=0.1)
+
+        self.worker.start(self.cache)
+        await asyncio.sleep(0.3)
+        await self.worker.stop()
+
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual(await self.cache.llen(self.queue.processing("sibling")), 1)
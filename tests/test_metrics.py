@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from main import app
+from src.database.db import create_engine_from_settings
+from src.servises.metrics import sql_operation
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class TestQueryMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine_from_settings(f"sqlite:///{os.path.join(self.tmp.name, 'metrics.db')}",
+                                                  "metrics")
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def test_statements_are_timed_by_operation(self):
+        async with self.engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            await conn.execute(text("INSERT INTO t VALUES (1)"))
+            await conn.execute(text("SELECT x FROM t"))
+            await conn.execute(text("SELECT x FROM t"))
+
+        for operation, count in (("SELECT", 2), ("INSERT", 1), ("OTHER", 1), ("UPDATE", 0)):
+            labels = {"pool": "metrics", "operation": operation}
+            self.assertEqual(sample("db_query_duration_seconds_count", labels), count, operation)
+
+    def test_sql_operation(self):
+        self.assertEqual(sql_operation("  select 1"), "SELECT")
+        self.assertEqual(sql_operation("WITH x AS (SELECT 1) SELECT * FROM x"), "OTHER")
+        self.assertEqual(sql_operation(""), "OTHER")
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(app)
+    labels = {"method": "GET", "route": "/api/contacts/{contact_id}", "status": "401"}
+    before = sample("http_request_duration_seconds_count", labels)
+
+    for contact_id in (1, 2):
+        assert client.get(f"/api/contacts/{contact_id}").status_code == 401
+    assert client.get("/no/such/route").status_code == 404
+
+    assert sample("http_request_duration_seconds_count", labels) == before + 2
+    assert sample("http_request_duration_seconds_count",
+                  {"method": "GET", "route": "unmatched", "status": "404"}) >= 1
+    assert sample("http_requests_in_flight") == 0
+
+
+def test_metrics_endpoint():
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    for name in ("http_requests_in_flight", "db_query_duration_seconds", "redis_command_duration_seconds",
+                 "cache_requests_total", "hash_jobs_queued"):
+        assert name in response.text
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import date
+
+import pytest
+from sqlalchemy import event, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from src.database.db import create_engine_from_settings
+from src.database.models import Base, Contacts, Users
+from src.repository.auth import get_current_user
+from src.schemas import User, UserCache
+from src.servises import query_log
+from src.servises.query_log import QueryLogMiddleware, capture_queries, current_log
+
+
+@pytest.fixture(scope="module")
+def owner(client, session):
+    owner = Users(username="queries@gmail.com", password="x", avatar="a")
+    session.add(owner)
+    session.commit()
+    session.add_all([Contacts(name=f"John{i}", lastname="Smith", email=f"smith{i}@gmail.com", phone="9876543210",
+                              birthday=date(2000, 2, 3), user_id=owner.id) for i in range(5)])
+    session.commit()
+    current_user = UserCache.model_validate(owner)
+    app.dependency_overrides[get_current_user] = lambda: current_user
+    yield current_user
+    del app.dependency_overrides[get_current_user]
+
+
+def test_list_contacts_runs_one_query(client, owner, max_queries):
+    with max_queries(1):
+        response = client.get("/api/contacts/", params={"limit": 5})
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 5
+
+
+def test_read_contact_runs_one_query(client, owner, max_queries):
+    contact_id = client.get("/api/contacts/", params={"limit": 1}).json()[0]["id"]
+    with max_queries(1):
+        assert client.get(f"/api/contacts/{contact_id}").status_code == 200
+
+
+def test_max_queries_fails_when_exceeded(client, owner, max_queries):
+    with pytest.raises(AssertionError, match="2 queries"):
+        with max_queries(1):
+            client.get("/api/contacts/", params={"limit": 1})
+            client.get("/api/contacts/", params={"limit": 2})
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+class TestQueryLog(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # slow query logging is off here, a busy machine must not add records to the N+1 checks
+        self.engine = await self.create_engine("queries", slow_query_ms=0)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def create_engine(self, name, slow_query_ms):
+        engine = create_engine_from_settings(f"sqlite:///{os.path.join(self.tmp.name, name + '.db')}", name)
+        event.listen(engine.sync_engine, "connect",
+                     lambda dbapi_connection, record: dbapi_connection.create_function("sleep_ms", 1, sleep_ms))
+        query_log.watch(engine, slow_query_ms=slow_query_ms)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(Users), [{"username": "a@gmail.com", "password": "x", "avatar": "a"}])
+        return engine
+
+    async def test_slow_query_is_logged_with_parameters(self):
+        engine = await self.create_engine("slow", slow_query_ms=200)
+        try:
+            async with engine.connect() as conn:
+                with self.assertLogs(query_log.logger, "WARNING") as logs:
+                    await conn.execute(text("SELECT sleep_ms(:ms)"), {"ms": 400})
+                    await conn.execute(text("SELECT sleep_ms(:ms)"), {"ms": 0})
+        finally:
+            await engine.dispose()
+        self.assertTrue(any("SELECT sleep_ms(?) (400,)" in line for line in logs.output), logs.output)
+        self.assertFalse(any("(0,)" in line for line in logs.output), logs.output)
+
+    async def test_repeated_statement_is_flagged(self):
+        async def endpoint(scope, receive, send):
+            async with self.engine.connect() as conn:
+                for user_id in range(3):
+                    await conn.execute(select(Users.username).where(Users.id == user_id))
+                await conn.execute(select(Users.id))
+
+        middleware = QueryLogMiddleware(endpoint, max_queries=10, repeat_threshold=3)
+        with self.assertLogs(query_log.logger, "WARNING") as logs:
+            await middleware({"type": "http", "method": "GET", "path": "/users"}, None, None)
+        self.assertTrue(any("Possible N+1 in GET /users: 3x SELECT users.username" in line
+                            for line in logs.output), logs.output)
+        self.assertFalse(any("SELECT users.id" in line for line in logs.output), logs.output)
+        self.assertIsNone(current_log.get())
+
+    async def test_too_many_queries_are_reported(self):
+        async def endpoint(scope, receive, send):
+            async with self.engine.connect() as conn:
+                await conn.execute(select(Users.id))
+                await conn.execute(select(Users.username))
+
+        middleware = QueryLogMiddleware(endpoint, max_queries=1, repeat_threshold=3)
+        with self.assertLogs(query_log.logger, "WARNING") as logs:
+            await middleware({"type": "http", "method": "GET", "path": "/users"}, None, None)
+        self.assertTrue(any("GET /users ran 2 queries" in line for line in logs.output), logs.output)
+
+    async def test_serializing_a_user_does_not_load_contacts(self):
+        async with async_sessionmaker(self.engine)() as db:
+            db_user = await db.scalar(select(Users))
+        with capture_queries() as log:
+            user = User.model_validate(db_user)
+        self.assertEqual((log.count, user.contacts), (0, []))
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Users
+from src.repository import contacts as repository_contacts
+
+
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+    """
+    Run repository queries on SQLite and check with EXPLAIN QUERY PLAN that they are answered from an index.
+    """
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'plans.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = Users(id=1)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self.capture)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("EXPLAIN"):
+            self.statements.append((statement, parameters))
+
+    async def query_plan(self) -> str:
+        statement, parameters = self.statements[-1]
+        async with self.engine.connect() as conn:
+            result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return "\n".join(row[-1] for row in result)
+
+    async def assert_uses(self, expected: str):
+        plan = await self.query_plan()
+        self.assertIn(expected, plan)
+        self.assertNotRegex(plan, r"SCAN contacts\b(?! USING)")
+
+    async def test_get_contacts(self):
+        await repository_contacts.get_contacts(skip=0, limit=10, user=self.user, db=self.session)
+        await self.assert_uses("USING INDEX ix_contacts_user_id_")
+
+    async def test_get_contacts_after(self):
+        await repository_contacts.get_contacts_after(("Smith", "John", 1), limit=10, user=self.user, db=self.session)
+        await self.assert_uses("USING INDEX ix_contacts_user_id_lastname_name_id (user_id=? AND")
+
+    async def test_get_contact(self):
+        await repository_contacts.get_contact(contact_id=1, user=self.user, db=self.session)
+        await self.assert_uses("USING INTEGER PRIMARY KEY")
+
+    async def test_get_birthdays(self):
+        await repository_contacts.get_birthdays(user=self.user, db=self.session)
+        await self.assert_uses("USING INDEX ix_contacts_user_id_birthday_mmdd (user_id=? AND birthday_mmdd")
+
+    async def test_search_contacts(self):
+        await repository_contacts.search_contacts(query="Smith", user=self.user, db=self.session)
+        await self.assert_uses("SCAN contacts_fts VIRTUAL TABLE INDEX")
+        await self.assert_uses("SEARCH contacts USING INTEGER PRIMARY KEY")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.database.db import create_engine_from_settings
+from src.database.models import Base, Users
+from src.database.replicas import ReplicaSet
+from src.routes.contacts import contacts_changed
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def seed(path, marker):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Users), [{"username": "a@gmail.com", "password": "x", "avatar": marker}])
+    engine.dispose()
+
+
+class TestReplicaSet(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        paths = {name: os.path.join(self.tmp.name, f"{name}.db") for name in ("primary", "replica0", "replica1")}
+        for name, path in paths.items():
+            seed(path, name)
+        self.primary_engine = create_engine_from_settings(f"sqlite:///{paths['primary']}", "test_primary")
+        self.primary = async_sessionmaker(self.primary_engine, expire_on_commit=False)()
+        self.replicas = ReplicaSet([f"sqlite:///{paths['replica0']}", f"sqlite:///{paths['replica1']}"],
+                                   sticky_seconds=10)
+        self.cache = FakeRedis()
+
+    async def asyncTearDown(self):
+        await self.primary.close()
+        await self.primary_engine.dispose()
+        await self.replicas.stop()
+        self.tmp.cleanup()
+
+    async def read_source(self, username="a@gmail.com"):
+        async with self.replicas.session(username, self.cache, self.primary) as db:
+            return (await db.execute(select(Users.avatar))).scalar_one()
+
+    async def test_round_robin(self):
+        self.assertEqual([await self.read_source() for _ in range(4)], ["replica0", "replica1"] * 2)
+
+    async def test_unhealthy_replica_is_skipped(self):
+        self.replicas.engines[1] = create_engine_from_settings("sqlite:////nonexistent/dir/replica.db", "broken")
+        self.assertEqual(await self.replicas.check(), [True, False])
+        self.assertEqual({await self.read_source() for _ in range(4)}, {"replica0"})
+
+        self.replicas.healthy = [False, False]
+        self.assertEqual(await self.read_source(), "primary")
+
+    async def test_read_your_writes(self):
+        await self.replicas.mark_write("a@gmail.com", self.cache)
+        self.assertEqual(await self.read_source(), "primary")
+        self.assertIn(await self.read_source("b@gmail.com"), ("replica0", "replica1"))
+
+        self.cache.data.clear()
+        self.assertIn(await self.read_source(), ("replica0", "replica1"))
+
+    async def test_stop_waits_for_the_health_checks(self):
+        self.replicas.start(interval=60)
+        task = self.replicas._task
+        await asyncio.sleep(0)
+        await self.replicas.stop()
+        self.assertTrue(task.cancelled())
+        self.assertIsNone(self.replicas._task)
+
+    async def test_without_redis_reads_stay_on_primary(self):
+        async with self.replicas.session("a@gmail.com", None, self.primary) as db:
+            self.assertIs(db, self.primary)
+
+    async def test_without_replicas(self):
+        replicas = ReplicaSet([], sticky_seconds=10)
+        await replicas.mark_write("a@gmail.com", self.cache)
+        self.assertEqual(self.cache.data, {})
+        async with replicas.session("a@gmail.com", self.cache, self.primary) as db:
+            self.assertIs(db, self.primary)
+
+
+class TestContactsChanged(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reads_are_pinned_before_the_cache_is_invalidated(self):
+        calls = []
+        mark_write = AsyncMock(side_effect=lambda *args: calls.append("mark_write"))
+        invalidate = AsyncMock(side_effect=lambda *args: calls.append("invalidate"))
+        with patch("src.routes.contacts.replicas.mark_write", mark_write), \
+                patch("src.routes.contacts.contacts_cache.invalidate", invalidate):
+            await contacts_changed(Users(id=1, username="a@gmail.com"), FakeRedis())
+        self.assertEqual(calls, ["mark_write", "invalidate"])
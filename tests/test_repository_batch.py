@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contacts, Users
+from src.repository.contacts import apply_operations
+from src.schemas import ContactBatch
+
+
+def contact_data(name):
+    return {"name": name, "lastname": "Smith", "email": "smith@gmail.com", "phone": "9876543210",
+            "birthday": date(2000, 2, 3), "additional": None}
+
+
+class TestApplyOperations(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'batch.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.session.add_all([Users(id=1, username="a@gmail.com", password="x"),
+                              Users(id=2, username="b@gmail.com", password="x")])
+        self.session.add_all([Contacts(id=i, **contact_data(f"John{i}"), user_id=1) for i in range(1, 11)]
+                             + [Contacts(id=11, **contact_data("Other"), user_id=2)])
+        await self.session.commit()
+        self.user = Users(id=1)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    def batch(self, operations):
+        return ContactBatch.model_validate({"operations": operations}).operations
+
+    async def test_apply_operations(self):
+        operations = self.batch(
+            [{"op": "create", "data": contact_data(f"New{i}")} for i in range(5)]
+            + [{"op": "update", "id": i, "data": contact_data(f"Updated{i}")} for i in range(1, 6)]
+            + [{"op": "delete", "id": i} for i in range(6, 11)]
+        )
+        results = await apply_operations(operations, self.user, self.session)
+
+        self.assertEqual([result.status for result in results], [201] * 5 + [200] * 10)
+        self.assertEqual(results[5].contact.name, "Updated1")
+        # one SELECT ... IN, one executemany UPDATE and DELETE; SQLite cannot batch INSERT ... RETURNING
+        # in parameter order, so the inserts are checked apart
+        self.assertEqual(len([statement for statement in self.statements if not statement.startswith("INSERT")]), 3)
+        names = (await self.session.execute(select(Contacts.name).filter(Contacts.user_id == 1))).scalars().all()
+        self.assertEqual(sorted(names), sorted([f"New{i}" for i in range(5)] + [f"Updated{i}" for i in range(1, 6)]))
+
+    async def test_missing_and_foreign_contacts(self):
+        operations = self.batch([
+            {"op": "delete", "id": 1},
+            {"op": "update", "id": 1, "data": contact_data("Gone")},
+            {"op": "delete", "id": 11},
+            {"op": "delete", "id": 99},
+        ])
+        results = await apply_operations(operations, self.user, self.session)
+        self.assertEqual([result.status for result in results], [200, 404, 404, 404])
+        self.assertIsNotNone(await self.session.get(Contacts, 11))
+
+    def test_validate_operations(self):
+        with self.assertRaises(ValueError):
+            self.batch([{"op": "update", "data": contact_data("NoId")}])
+        with self.assertRaises(ValueError):
+            self.batch([])
+
+
+if __name__ == "__main__":
+    unittest.main()
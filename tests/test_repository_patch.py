@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from pydantic import ValidationError
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Contacts, Users
+from src.repository.contacts import patch_contact, update_contact, remove_contact
+from src.schemas import ContactPatch, ContactUpdate
+
+
+def contact_data(name):
+    return {"name": name, "lastname": "Smith", "email": "smith@gmail.com", "phone": "9876543210",
+            "birthday": date(2000, 2, 3), "additional": "Best friend"}
+
+
+class TestSingleStatementWrites(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'patch.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.session.add_all([Users(id=1, username="a@gmail.com", password="x"),
+                              Users(id=2, username="b@gmail.com", password="x")])
+        self.session.add_all([Contacts(id=1, **contact_data("John"), user_id=1),
+                              Contacts(id=2, **contact_data("Other"), user_id=2)])
+        await self.session.commit()
+        self.session.expunge_all()
+        self.user = Users(id=1)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def test_patch_contact(self):
+        body = ContactPatch(phone="1234567890", birthday=date(1990, 12, 31))
+        contact = await patch_contact(1, body, self.user, self.session)
+
+        self.assertEqual((contact.name, contact.phone, contact.birthday_mmdd), ("John", "1234567890", 1231))
+        self.assertEqual(len(self.statements), 1)
+        set_clause = self.statements[0].split(" WHERE ")[0]
+        self.assertTrue(set_clause.startswith("UPDATE contacts SET"))
+        self.assertEqual(sorted(part.split("=")[0].strip() for part in set_clause[len("UPDATE contacts SET"):].split(",")),
+                         ["birthday", "birthday_mmdd", "phone", "updated_at", "version"])
+        self.assertIn("RETURNING", self.statements[0])
+
+    async def test_patch_clears_additional(self):
+        contact = await patch_contact(1, ContactPatch(additional=None), self.user, self.session)
+        self.assertIsNone(contact.additional)
+        self.assertEqual(contact.email, "smith@gmail.com")
+
+    def test_patch_rejects_null_required_fields(self):
+        for field in ("name", "lastname", "email", "phone", "birthday"):
+            with self.assertRaises(ValidationError, msg=field):
+                ContactPatch(**{field: None})
+        self.assertEqual(ContactPatch(additional=None).model_dump(exclude_unset=True), {"additional": None})
+
+    async def test_patch_other_users_contact(self):
+        self.assertIsNone(await patch_contact(2, ContactPatch(phone="0"), self.user, self.session))
+        self.assertIsNone(await update_contact(2, ContactUpdate(**contact_data("Gone")), self.user, self.session))
+        name = (await self.session.execute(select(Contacts.name).filter(Contacts.id == 2))).scalar_one()
+        self.assertEqual(name, "Other")
+
+    async def test_update_contact(self):
+        contact = await update_contact(1, ContactUpdate(**contact_data("Jack")), self.user, self.session)
+        self.assertEqual(contact.name, "Jack")
+        self.assertEqual(len(self.statements), 1)
+
+    async def test_remove_contact(self):
+        contact = await remove_contact(1, self.user, self.session)
+        self.assertEqual(contact.name, "John")
+        self.assertEqual(len(self.statements), 1)
+        self.assertTrue(self.statements[0].startswith("DELETE FROM contacts"))
+        self.assertIsNone(await remove_contact(2, self.user, self.session))
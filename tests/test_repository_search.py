@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.config.config import Settings
+from src.database.models import Base, Contacts, Users
+from src.repository.search import LikeSearchBackend, SQLiteFTSSearchBackend, SearchBackend
+
+
+class TestSearchBackends(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'search.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user, self.other = Users(id=1, username="a@gmail.com", password="x"), Users(id=2, username="b@gmail.com", password="x")
+        self.session.add_all([self.user, self.other])
+        self.session.add_all([
+            Contacts(name="John", lastname="Smith", email="smith@gmail.com", phone="380671234567",
+                     birthday=date(2000, 2, 3), user_id=1),
+            Contacts(name="Anna", lastname="Blacksmith", email="anna@ukr.net", phone="380501112233",
+                     birthday=date(1995, 5, 1), user_id=1),
+            Contacts(name="Smithy", lastname="Jones", email="jones@gmail.com", phone="380931112233",
+                     birthday=date(1990, 7, 9), user_id=2),
+        ])
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def search(self, backend, query, limit=10):
+        return [contact.name for contact in await backend.search(query, self.user, self.session, limit)]
+
+    async def test_fts_prefix(self):
+        self.assertEqual(await self.search(SQLiteFTSSearchBackend(), "smi"), ["John"])
+
+    async def test_fts_email_and_phone(self):
+        self.assertEqual(await self.search(SQLiteFTSSearchBackend(), "anna@ukr"), ["Anna"])
+        self.assertEqual(await self.search(SQLiteFTSSearchBackend(), "38067"), ["John"])
+
+    async def test_fts_follows_updates(self):
+        contact = await self.session.get(Contacts, 2)
+        contact.lastname = "Smithson"
+        await self.session.commit()
+        self.assertEqual(sorted(await self.search(SQLiteFTSSearchBackend(), "smith")), ["Anna", "John"])
+
+    async def test_fts_empty_query(self):
+        self.assertEqual(await self.search(SQLiteFTSSearchBackend(), "%"), [])
+
+    async def test_like_ranks_prefix_first(self):
+        self.assertEqual(await self.search(LikeSearchBackend(), "smith"), ["John", "Anna"])
+
+    async def test_like_limit(self):
+        self.assertEqual(await self.search(LikeSearchBackend(), "smith", limit=1), ["John"])
+
+    async def test_like_escapes_wildcards(self):
+        self.assertEqual(await self.search(LikeSearchBackend(), "%"), [])
+
+
+class TestSearchSettings(unittest.TestCase):
+
+    def test_backend_must_implement_search(self):
+        with self.assertRaises(TypeError):
+            SearchBackend()
+
+    def test_unknown_backend_fails_at_startup(self):
+        with self.assertRaises(ValidationError) as raised:
+            Settings(search_backend="elastic")
+        self.assertIn("'auto', 'like', 'fts5' or 'postgres'", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
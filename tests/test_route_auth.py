@@ -1,12 +1,18 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
 
+from passlib.context import CryptContext
+
+from src.config.config import settings1
 from src.database.models import Users
+from src.repository.auth import create_email_token, pwd_context
 
 
 def test_signup(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.servises.email.send_email", mock_send_email)
+    mock_send_email = AsyncMock()
+    mock_mark_write = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    monkeypatch.setattr("src.routes.auth.replicas.mark_write", mock_mark_write)
     response = client.post(
         "api/auth/signup",
         json=user,
@@ -15,6 +21,15 @@ def test_signup(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["username"] == user.get("username")
     assert "id" in data["user"]
+    assert mock_send_email.await_args.args[0] == user.get("username")
+    assert mock_mark_write.await_args.args[0] == user.get("username")
+
+
+def test_signup_without_mail_queue_is_rolled_back(client, session):
+    body = {"username": "noqueue@gmail.com", "password": "123456789"}
+    response = client.post("api/auth/signup", json=body)
+    assert response.status_code == 503, response.text
+    assert session.query(Users).filter(Users.username == body["username"]).first() is None
 
 
 def test_login_user_not_confirmed(client, user):
@@ -57,4 +72,35 @@ def test_login_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data["detail"] == "Invalid username"
\ No newline at end of file
+    assert data["detail"] == "Invalid username"
+
+def test_login_rehashes_outdated_password(client, session):
+    outdated = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("123456789")
+    session.add(Users(username="rehash@gmail.com", password=outdated, confirmed=True))
+    session.commit()
+
+    response = client.post("/api/auth/login", data={"username": "rehash@gmail.com", "password": "123456789"})
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    stored = session.query(Users).filter(Users.username == "rehash@gmail.com").first().password
+    assert stored != outdated
+    assert stored.startswith(f"$2b${settings1.bcrypt_rounds:02d}$")
+    assert pwd_context.verify("123456789", stored)
+
+
+def test_confirmed_email_reads_from_the_primary(client, session, monkeypatch):
+    mock_mark_write = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.replicas.mark_write", mock_mark_write)
+    mock_invalidate = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.repository_auth.invalidate_cached_user", mock_invalidate)
+    session.add(Users(username="confirm@gmail.com", password="x"))
+    session.commit()
+
+    response = client.get(f"/api/auth/confirmed_email/{create_email_token({'sub': 'confirm@gmail.com'})}")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"message": "Email confirmed"}
+    assert mock_mark_write.await_args.args[0] == "confirm@gmail.com"
+    # the cached user still says unconfirmed
+    assert mock_invalidate.await_args.args[0] == "confirm@gmail.com"
+    session.expire_all()
+    assert session.query(Users).filter(Users.username == "confirm@gmail.com").first().confirmed
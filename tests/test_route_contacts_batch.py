@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from main import app
+from src.database.models import Users
+from src.repository.auth import get_current_user
+from src.schemas import UserCache
+
+
+def contact_data(name, email="smith@gmail.com"):
+    return {"name": name, "lastname": "Smith", "email": email, "phone": "9876543210",
+            "birthday": "2000-02-03", "additional": None}
+
+
+@pytest.fixture(scope="module")
+def owner(client, session):
+    owner = Users(username="batch@gmail.com", password="x")
+    session.add(owner)
+    session.commit()
+    current_user = UserCache.model_validate(owner)
+    app.dependency_overrides[get_current_user] = lambda: current_user
+    yield current_user
+    del app.dependency_overrides[get_current_user]
+
+
+def test_batch_reports_each_operation(client, owner):
+    created = client.post("/api/contacts/batch", json={"operations": [
+        {"op": "create", "data": contact_data("John")},
+        {"op": "create", "data": contact_data("Jane")},
+    ]})
+    assert created.status_code == 200, created.text
+    john, jane = [result["contact"]["id"] for result in created.json()]
+
+    response = client.post("/api/contacts/batch", json={"operations": [
+        {"op": "update", "id": john, "data": contact_data("Johnny")},
+        {"op": "delete", "id": jane},
+        {"op": "delete", "id": jane},
+        {"op": "update", "id": 999999, "data": contact_data("Ghost")},
+        {"op": "create", "data": contact_data("Jack")},
+    ]})
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [(result["index"], result["op"], result["status"]) for result in results] == [
+        (0, "update", 200), (1, "delete", 200), (2, "delete", 404), (3, "update", 404), (4, "create", 201)]
+    assert results[0]["contact"]["name"] == "Johnny"
+    assert (results[2]["contact"], results[2]["detail"]) == (None, "Contact not found")
+    assert results[4]["contact"]["name"] == "Jack"
+    # the failed operations did not roll back the others
+    assert client.get(f"/api/contacts/{jane}").status_code == 404
+    assert client.get(f"/api/contacts/{john}").json()["name"] == "Johnny"
+
+
+@pytest.mark.parametrize("body", [
+    {"operations": []},
+    {"operations": [{"op": "rename", "id": 1}]},
+    {"operations": [{"op": "create", "data": contact_data("John", email="not an email")}]},
+    {"operations": [{"op": "delete", "id": 1}] * 501},
+])
+def test_batch_rejects_invalid_body(client, owner, body):
+    response = client.post("/api/contacts/batch", json=body)
+    assert response.status_code == 422, response.text
+
+
+def test_bulk_csv_reports_bad_rows(client, owner):
+    lines = ["name,lastname,email,phone,birthday,additional",
+             "Ann,Smith,ann@gmail.com,9876543210,2000-02-03,",
+             "Bob,Smith,not an email,9876543210,2000-02-03,",
+             "Cid,Smith,cid@gmail.com,9876543210,2000-02-03,Best friend"]
+    response = client.post("/api/contacts/bulk", content="\n".join(lines) + "\n",
+                           headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["inserted"], result["failed"], result["errors_truncated"]) == (2, 1, False)
+    [error] = result["errors"]
+    assert error["row"] == 2 and error["errors"]
+
+
+def test_bulk_csv_unclosed_quote_is_a_row_error(client, owner):
+    body = ("name,lastname,email,phone,birthday,additional\n"
+            "Dan,O\"Neil,dan@gmail.com,9876543210,2000-02-03,\n"
+            "Eve,Smith,eve@gmail.com,9876543210,2000-02-03,\"never closed\n")
+    response = client.post("/api/contacts/bulk", content=body, headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["inserted"], result["failed"]) == (1, 1)
+    assert result["errors"][0]["row"] == 2
+
+
+def test_bulk_ndjson(client, owner):
+    rows = [contact_data("Dan", "dan@gmail.com"), {"name": "Eve"}]
+    response = client.post("/api/contacts/bulk", content="\n".join(json.dumps(row) for row in rows),
+                           headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["inserted"], result["failed"]) == (1, 1)
+    assert result["errors"][0]["row"] == 2
+
+
+def test_bulk_unsupported_media_type(client, owner):
+    response = client.post("/api/contacts/bulk", json=[contact_data("John")])
+    assert response.status_code == 415, response.text
@@ -0,0 +1,62 @@
+import base64
+from datetime import date
+
+import pytest
+
+from main import app
+from src.database.models import Contacts, Users
+from src.repository.auth import get_current_user
+from src.schemas import UserCache
+
+LASTNAMES = ["Adams", "Brown", "Brown", "Clark", "Davis"]
+
+
+@pytest.fixture(scope="module")
+def owner(client, session):
+    owner = Users(username="cursor@gmail.com", password="x")
+    session.add(owner)
+    session.commit()
+    session.add_all([Contacts(name=f"John{i}", lastname=lastname, email="smith@gmail.com", phone="9876543210",
+                              birthday=date(2000, 2, 3), user_id=owner.id)
+                     for i, lastname in reversed(list(enumerate(LASTNAMES)))])
+    session.commit()
+    current_user = UserCache.model_validate(owner)
+    app.dependency_overrides[get_current_user] = lambda: current_user
+    yield current_user
+    del app.dependency_overrides[get_current_user]
+
+
+def test_cursor_pages_through_all_contacts(client, owner):
+    seen = []
+    cursor = ""
+    for _ in range(len(LASTNAMES)):
+        response = client.get("/api/contacts/", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        seen += [(contact["lastname"], contact["name"]) for contact in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert seen == sorted((lastname, f"John{i}") for i, lastname in enumerate(LASTNAMES))
+
+
+def test_last_page_has_no_next_cursor(client, owner):
+    response = client.get("/api/contacts/", params={"limit": 10, "cursor": ""})
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == len(LASTNAMES)
+    assert "x-next-cursor" not in response.headers
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b'{"lastname": "Adams"}').decode(),
+    base64.urlsafe_b64encode(b'["Adams", "John0", "1"]').decode(),
+])
+def test_invalid_cursor(client, owner, cursor):
+    response = client.get("/api/contacts/", params={"cursor": cursor})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": 501}, {"skip": -1}, {"skip": 10001}])
+def test_page_bounds(client, owner, params):
+    assert client.get("/api/contacts/", params=params).status_code == 422
@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from main import app
+from src.database.models import Contacts, Users
+from src.repository.auth import get_current_user
+from src.schemas import UserCache
+
+
+@pytest.fixture(scope="module")
+def contact_id(client, session):
+    owner = Users(username="etag@gmail.com", password="x")
+    session.add(owner)
+    session.commit()
+    contact = Contacts(name="John", lastname="Smith", email="smith@gmail.com", phone="9876543210",
+                       birthday=date(2000, 2, 3), user_id=owner.id)
+    session.add(contact)
+    session.commit()
+    app.dependency_overrides[get_current_user] = lambda: UserCache.model_validate(owner)
+    yield contact.id
+    del app.dependency_overrides[get_current_user]
+
+
+@pytest.fixture
+def statements():
+    captured = []
+
+    def capture(conn, cursor, statement, *args):
+        captured.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    yield captured
+    event.remove(Engine, "before_cursor_execute", capture)
+
+
+def test_read_contact_validators(client, contact_id):
+    response = client.get(f"/api/contacts/{contact_id}")
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] == f'"{contact_id}.1"'
+    assert response.headers["last-modified"].endswith("GMT")
+
+
+def test_read_contact_not_modified(client, contact_id, statements):
+    response = client.get(f"/api/contacts/{contact_id}", headers={"If-None-Match": f'W/"{contact_id}.1"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{contact_id}.1"'
+    # only the version is read, not the full row
+    assert len(statements) == 1 and "contacts.name" not in statements[0]
+
+
+def test_update_bumps_version(client, contact_id):
+    response = client.patch(f"/api/contacts/{contact_id}", json={"phone": "1234567890"},
+                            headers={"If-Match": f'"{contact_id}.1"'})
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] == f'"{contact_id}.2"'
+
+    response = client.get(f"/api/contacts/{contact_id}", headers={"If-None-Match": f'"{contact_id}.1"'})
+    assert response.status_code == 200
+    assert response.json()["phone"] == "1234567890"
+
+
+def test_stale_if_match(client, contact_id):
+    response = client.delete(f"/api/contacts/{contact_id}", headers={"If-Match": f'"{contact_id}.1"'})
+    assert response.status_code == 412, response.text
+    assert client.get(f"/api/contacts/{contact_id}").status_code == 200
+
+
+def test_delete_with_current_if_match(client, contact_id):
+    response = client.delete(f"/api/contacts/{contact_id}", headers={"If-Match": f'"{contact_id}.2"'})
+    assert response.status_code == 200, response.text
+    response = client.delete(f"/api/contacts/{contact_id}", headers={"If-Match": f'"{contact_id}.2"'})
+    assert response.status_code == 404
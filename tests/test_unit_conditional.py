@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+from src.servises import conditional
+
+
+def request(**headers):
+    raw = [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "headers": raw})
+
+
+class TestConditional(unittest.TestCase):
+
+    def test_collection_etag(self):
+        rows = [SimpleNamespace(id=1, version=1), SimpleNamespace(id=2, version=3)]
+        etag = conditional.collection_etag(rows)
+        self.assertEqual(etag, conditional.collection_etag(reversed(rows)))
+        self.assertNotEqual(etag, conditional.collection_etag(rows[:1]))
+        self.assertNotEqual(etag, conditional.collection_etag([rows[0], SimpleNamespace(id=2, version=4)]))
+
+    def test_if_none_match(self):
+        self.assertTrue(conditional.is_not_modified(request(if_none_match='"1.1", W/"1.2"'), '"1.2"', None))
+        self.assertTrue(conditional.is_not_modified(request(if_none_match='*'), '"1.2"', None))
+        self.assertFalse(conditional.is_not_modified(request(if_none_match='"1.1"'), '"1.2"', None))
+        self.assertFalse(conditional.is_not_modified(request(), '"1.2"', None))
+
+    def test_if_modified_since(self):
+        modified = datetime(2026, 10, 17, 12, 0, 0)
+        since = conditional.http_date(modified)
+        self.assertTrue(conditional.is_not_modified(request(if_modified_since=since), '"1.1"', modified))
+        self.assertFalse(conditional.is_not_modified(request(if_modified_since=since), '"1.1"',
+                                                     datetime(2026, 10, 17, 12, 0, 1)))
+        self.assertFalse(conditional.is_not_modified(request(if_modified_since='garbage'), '"1.1"', modified))
+        # If-None-Match takes precedence
+        self.assertFalse(conditional.is_not_modified(request(if_none_match='"1.0"', if_modified_since=since),
+                                                     '"1.1"', modified))
+
+    def test_match_versions(self):
+        self.assertIsNone(conditional.match_versions(request(), 7))
+        self.assertIsNone(conditional.match_versions(request(if_match='*'), 7))
+        self.assertEqual(conditional.match_versions(request(if_match='"7.2", "7.5"'), 7), [2, 5])
+        self.assertEqual(conditional.match_versions(request(if_match='"8.2", W/"7.2", "7.x"'), 7), [])
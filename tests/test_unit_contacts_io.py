@@ -0,0 +1,77 @@
+import csv
+import unittest
+from unittest.mock import patch
+
+from src.servises.contacts_io import ends_in_quotes, iter_csv_records, iter_ndjson_records
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(records):
+    return [record async for record in records]
+
+
+class TestContactsImportParsing(unittest.IsolatedAsyncioTestCase):
+
+    async def test_csv_records(self):
+        data = ('name,lastname,email,phone,birthday,additional\r\n'
+                'John,Smith,smith@gmail.com,9876543210,2000-02-03,"Best\nfriend, ""JS"""\r\n'
+                'Олена,Коваль,olena@ukr.net,380501112233,1999-09-09,\r\n').encode()
+        records = await collect(iter_csv_records(chunked(data, 7)))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["additional"], 'Best\nfriend, "JS"')
+        self.assertEqual(records[1]["name"], "Олена")
+        self.assertEqual(records[1]["additional"], "")
+
+    async def test_stray_quote_stays_in_its_row(self):
+        data = ('name,lastname,email,phone,birthday,additional\n'
+                'John,O"Brien,smith@gmail.com,9876543210,2000-02-03,\n'
+                'Anna,Smith,anna@gmail.com,9876543210,2000-02-03,\n').encode()
+        records = await collect(iter_csv_records(chunked(data, 7)))
+        self.assertEqual([record["lastname"] for record in records], ['O"Brien', "Smith"])
+
+    @patch("src.servises.contacts_io.MAX_CSV_RECORD_CHARS", 100)
+    async def test_unclosed_quote_is_reported(self):
+        rows = "".join(f"Row{i},Smith,smith@gmail.com,9876543210,2000-02-03,\n" for i in range(5))
+        data = ('name,lastname,email,phone,birthday,additional\n'
+                'John,Smith,smith@gmail.com,9876543210,2000-02-03,"never closed\n' + rows).encode()
+        records = await collect(iter_csv_records(chunked(data, 7)))
+        self.assertIn("longer than 100 characters", records[0]["__error__"])
+        # the record is dropped at the cap, the rows after it are read again
+        self.assertEqual([record["name"] for record in records[1:]], ["Row1", "Row2", "Row3", "Row4"])
+
+        records = await collect(iter_csv_records(chunked(b'name,lastname\nJohn,"Smith\n', 7)))
+        self.assertEqual(records, [{"__error__": "Quoted field is not closed at the end of the file"}])
+
+    async def test_csv_errors_become_row_errors(self):
+        limit = csv.field_size_limit(4)
+        try:
+            records = await collect(iter_csv_records(chunked(b'a,b\n1,2\nJohn,Smith\n3,4\n', 7)))
+        finally:
+            csv.field_size_limit(limit)
+        self.assertEqual(records[0], {"a": "1", "b": "2"})
+        self.assertIn("Malformed CSV", records[1]["__error__"])
+        self.assertEqual(records[2], {"a": "3", "b": "4"})
+
+    def test_ends_in_quotes(self):
+        self.assertFalse(ends_in_quotes('a,"b,c",d', False))
+        self.assertTrue(ends_in_quotes('a,"b', False))
+        self.assertTrue(ends_in_quotes('a,"b ""quoted"" c', False))
+        self.assertFalse(ends_in_quotes('a,b"c', False))
+        self.assertFalse(ends_in_quotes('rest of b",c', True))
+        self.assertTrue(ends_in_quotes('still "" inside', True))
+
+    async def test_ndjson_records(self):
+        data = b'{"name": "John"}\n\n[1, 2]\nnot json\n{"name": "Anna"}'
+        records = await collect(iter_ndjson_records(chunked(data, 5)))
+        self.assertEqual(records[0], {"name": "John"})
+        self.assertIn("__error__", records[1])
+        self.assertIn("__error__", records[2])
+        self.assertEqual(records[3], {"name": "Anna"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+from pydantic import ValidationError
+
+from src.config.config import Settings, settings1
+from src.repository.auth import Hash
+
+
+class TestHashPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.patches = [patch.object(Hash, "executor", self.executor),
+                        patch.object(settings1, "hash_workers", 2),
+                        patch.object(settings1, "hash_max_pending", 4)]
+        for item in self.patches:
+            item.start()
+        self.hash = Hash()
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    async def asyncTearDown(self):
+        self.release.set()
+        for item in self.patches:
+            item.stop()
+        self.executor.shutdown(wait=True)
+
+    def blocking(self, value):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return value
+
+    async def wait_for(self, pending):
+        for _ in range(100):
+            if Hash.pending == pending:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"{Hash.pending} hash jobs pending, expected {pending}")
+
+    async def test_pool_runs_at_most_hash_workers_and_exports_the_queue(self):
+        jobs = [asyncio.create_task(self.hash.run_in_pool(self.blocking, i)) for i in range(4)]
+        await self.wait_for(4)
+
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(REGISTRY.get_sample_value("hash_jobs_queued"), 2)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*jobs), [0, 1, 2, 3])
+        self.assertEqual(self.peak, 2)
+        self.assertEqual((Hash.pending, REGISTRY.get_sample_value("hash_jobs_queued")), (0, 0))
+
+    async def test_calls_beyond_the_cap_are_rejected(self):
+        jobs = [asyncio.create_task(self.hash.run_in_pool(self.blocking, i)) for i in range(4)]
+        await self.wait_for(4)
+
+        with self.assertRaises(HTTPException) as raised:
+            await self.hash.run_in_pool(self.blocking, 4)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(raised.exception.headers, {"Retry-After": "1"})
+        self.release.set()
+        await asyncio.gather(*jobs)
+        self.assertEqual(Hash.pending, 0)
+
+
+class TestHashSettings(unittest.TestCase):
+
+    def test_unknown_executor_fails_at_startup(self):
+        with self.assertRaises(ValidationError) as raised:
+            Settings(hash_executor="processes")
+        self.assertIn("'thread' or 'process'", str(raised.exception))
@@ -1,8 +1,8 @@
 import unittest
-from unittest.mock import MagicMock
-from datetime import datetime, timedelta
+from unittest.mock import MagicMock, AsyncMock
+from datetime import date, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contacts, Users
 from src.schemas import Contact, ContactCreate, ContactUpdate
@@ -13,30 +13,33 @@ from src.repository.contacts import (
     remove_contact,
     update_contact,
     get_birthdays,
-    search_contacts
+    search_contacts,
+    birthday_window
 )
 
 
 class TestNotes(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = Users(id=1)
 
     async def test_get_contacts(self):
         contacts = [Contacts(),]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact_found(self):
         contact = Contacts()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
-        self.assertIsNone(result)
+        self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -60,12 +63,12 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
 
     async def test_remove_contact_found(self):
         contact = Contacts()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
-        self.assertIsNone(result, contact)
+        self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -88,7 +91,7 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
             additional='Best friend'
         )
 
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(contact, result)
@@ -104,7 +107,7 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
             additional='Best friend'
         )
 
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
@@ -116,19 +119,33 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
                 lastname="Smith",
                 email="smith@gmail.com",
                 phone="9876543210",
-                birthday=datetime.date.today() + datetime.timedelta(days=3),
+                birthday=date.today() + timedelta(days=3),
                 additional="Just friend",
             ),
         ]
-        self.session.query().filter().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_birthdays(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_birthdays_not_found(self):
-        self.session.query().filter().all.return_value = None
+        self.result.scalars().all.return_value = None
         result = await get_birthdays(user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    def assertWindow(self, today, days, expected):
+        clause = birthday_window(today, days)
+        self.assertEqual(str(clause.compile(compile_kwargs={"literal_binds": True})), expected)
+
+    def test_birthday_window(self):
+        self.assertWindow(date(2024, 6, 10), 7, "contacts.birthday_mmdd BETWEEN 610 AND 617")
+
+    def test_birthday_window_wraps_year_end(self):
+        self.assertWindow(date(2023, 12, 29), 7, "contacts.birthday_mmdd >= 1229 OR contacts.birthday_mmdd <= 105")
+
+    def test_birthday_window_february_29(self):
+        self.assertWindow(date(2023, 2, 21), 7, "contacts.birthday_mmdd BETWEEN 221 AND 229")
+        self.assertWindow(date(2024, 2, 21), 7, "contacts.birthday_mmdd BETWEEN 221 AND 228")
+
     async def test_seach_contacts_found(self):
         query = 'Smith'
         contact = [
@@ -141,14 +158,14 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
                 additional="Just friend",
             )
         ]
-        self.session.query().filter().all.return_value = contact
-        result = await search_contacts(query=query, user=self.user, db=self.db)
+        self.result.scalars().all.return_value = contact
+        result = await search_contacts(query=query, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_seach_contacts_not_found(self):
         query = ''
-        self.session.query().filter().all.return_value = None
-        result = await search_contacts(query=query, user=self.user, db=self.db)
+        self.result.scalars().all.return_value = None
+        result = await search_contacts(query=query, user=self.user, db=self.session)
         self.assertIsNone(result)
 
 
@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+import redis.asyncio as redis
+from fastapi import Response
+from starlette.requests import Request
+
+from src.servises.response_cache import ResponseCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def json_response(body: bytes, etag: str = '"1"') -> Response:
+    response = Response(content=body, media_type="application/json")
+    response.headers["ETag"] = etag
+    response.headers["X-Other"] = "not replayed"
+    return response
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.cache = ResponseCache("test", ttl=60, max_bytes=100)
+
+    async def test_store_and_hit(self):
+        key = await self.cache.key(self.redis, 1, "list", {"skip": 0})
+        self.assertIsNone(await self.cache.get(self.redis, key))
+        await self.cache.store(self.redis, key, json_response(b"[1]"))
+
+        headers, body = await self.cache.get(self.redis, key)
+        self.assertEqual((headers, body), ({"etag": '"1"'}, b"[1]"))
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.hit_ratio), (1, 1, 0.5))
+
+        request = Request({"type": "http", "headers": [(b"if-none-match", b'"1"')]})
+        self.assertEqual(self.cache.respond(request, headers, body).status_code, 304)
+
+    async def test_params_are_part_of_the_key(self):
+        self.assertNotEqual(await self.cache.key(self.redis, 1, "list", {"skip": 0}),
+                            await self.cache.key(self.redis, 1, "list", {"skip": 100}))
+        self.assertNotEqual(await self.cache.key(self.redis, 1, "list", {"skip": 0}),
+                            await self.cache.key(self.redis, 2, "list", {"skip": 0}))
+
+    async def test_invalidate_bumps_generation(self):
+        key = await self.cache.key(self.redis, 1, "list", {})
+        await self.cache.store(self.redis, key, json_response(b"[1]"))
+        await self.cache.invalidate(self.redis, 1)
+
+        new_key = await self.cache.key(self.redis, 1, "list", {})
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(await self.cache.get(self.redis, new_key))
+        # other users keep their entries
+        self.assertEqual(await self.cache.key(self.redis, 2, "list", {}), key.replace(":1:", ":2:"))
+
+    async def test_oversized_body_is_not_stored(self):
+        key = await self.cache.key(self.redis, 1, "list", {})
+        await self.cache.store(self.redis, key, json_response(b"x" * 101))
+        self.assertEqual(self.cache.oversized, 1)
+        self.assertIsNone(await self.cache.get(self.redis, key))
+
+    async def test_redis_errors_disable_the_cache(self):
+        self.assertIsNone(await self.cache.key(None, 1, "list", {}))
+        broken = AsyncMock(spec=redis.Redis)
+        broken.get.side_effect = redis.ConnectionError("down")
+        broken.incr.side_effect = redis.ConnectionError("down")
+        self.assertIsNone(await self.cache.key(broken, 1, "list", {}))
+        await self.cache.invalidate(broken, 1)
+
+
+class TestResponseCacheCap(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = fakeredis.FakeAsyncRedis()
+        # each entry below is 22 bytes: {"etag":"\"1\""}, a newline and [1xx]
+        self.cache = ResponseCache("test", ttl=60, max_bytes=100, max_total_bytes=66, evict_batch=2)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def store(self, user_id):
+        key = await self.cache.key(self.redis, user_id, "list", {})
+        await self.cache.store(self.redis, key, json_response(b"[%d]" % (100 + user_id)))
+        return key
+
+    async def test_oldest_entries_are_evicted_over_the_cap(self):
+        keys = [await self.store(user_id) for user_id in range(3)]
+        self.assertEqual(int(await self.redis.get(self.cache.total_key)), 66)
+
+        keys.append(await self.store(3))
+        self.assertEqual(int(await self.redis.get(self.cache.total_key)), 44)
+        self.assertEqual(self.cache.evicted, 2)
+        self.assertEqual([await self.redis.exists(key) for key in keys], [0, 0, 1, 1])
+        self.assertEqual(await self.redis.zrange(self.cache.index_key, 0, -1), [key.encode() for key in keys[2:]])
+        self.assertEqual(await self.redis.hlen(self.cache.sizes_key), 2)
+
+    async def test_storing_the_same_key_twice_counts_once(self):
+        await self.store(1)
+        await self.store(1)
+        self.assertEqual(int(await self.redis.get(self.cache.total_key)), 22)
+
+    async def test_expired_entries_are_dropped_before_live_ones(self):
+        with patch("src.servises.response_cache.time.time", return_value=1000.0):
+            old = [await self.store(user_id) for user_id in range(2)]
+        for key in old:
+            await self.redis.delete(key)
+        live = await self.store(2)
+
+        await self.store(3)
+        self.assertEqual(self.cache.evicted, 0)
+        self.assertTrue(await self.redis.exists(live))
+        self.assertEqual(int(await self.redis.get(self.cache.total_key)), 44)
+        self.assertEqual(await self.redis.hlen(self.cache.sizes_key), 2)
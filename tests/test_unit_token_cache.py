@@ -0,0 +1,44 @@
+import time
+import unittest
+
+from src.servises.token_cache import TokenCache
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2)
+        self.exp = time.time() + 60
+
+    def test_get_hit(self):
+        claims = {"sub": "smith@gmail.com", "exp": self.exp}
+        self.cache.set("token", claims)
+        self.assertEqual(self.cache.get("token"), claims)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get("token"))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_expired(self):
+        self.cache.set("token", {"sub": "smith@gmail.com", "exp": time.time() - 1})
+        self.assertIsNone(self.cache.get("token"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evict_least_recently_used(self):
+        self.cache.set("first", {"exp": self.exp})
+        self.cache.set("second", {"exp": self.exp})
+        self.cache.get("first")
+        self.cache.set("third", {"exp": self.exp})
+        self.assertIsNone(self.cache.get("second"))
+        self.assertIsNotNone(self.cache.get("first"))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_disabled(self):
+        cache = TokenCache(maxsize=0)
+        cache.set("token", {"exp": self.exp})
+        self.assertIsNone(cache.get("token"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import fakeredis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.config.config import settings1
+from src.database import redis_db
+from src.database.models import Base, Users
+from src.repository import auth as repository_auth
+from src.schemas import UserCache
+
+
+class TestRedisClient(unittest.IsolatedAsyncioTestCase):
+
+    async def test_shared_pool_comes_from_settings(self):
+        with patch.multiple(settings1, redis_host="cache.internal", redis_port=6380, redis_max_connections=7):
+            client = await redis_db.init_redis()
+        try:
+            self.assertIs(await redis_db.get_redis(), client)
+            kwargs = client.connection_pool.connection_kwargs
+            self.assertEqual((kwargs["host"], kwargs["port"]), ("cache.internal", 6380))
+            self.assertEqual(client.connection_pool.max_connections, 7)
+        finally:
+            await redis_db.close_redis()
+        self.assertIsNone(await redis_db.get_redis())
+
+    async def test_close_disconnects_the_pool(self):
+        client = await redis_db.init_redis()
+        with patch.object(client.connection_pool, "disconnect") as disconnect:
+            await redis_db.close_redis()
+        disconnect.assert_awaited_once()
+
+
+class TestGetCurrentUser(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'users.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.session.add(Users(id=1, username="smith@gmail.com", password="x", confirmed=True, avatar="a"))
+        await self.session.commit()
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        self.cache = fakeredis.FakeAsyncRedis()
+        self.token = await repository_auth.create_access_token(data={"sub": "smith@gmail.com"})
+        self.key = repository_auth.user_cache_key("smith@gmail.com")
+
+    async def asyncTearDown(self):
+        await self.cache.aclose()
+        await self.session.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def current_user(self):
+        return await repository_auth.get_current_user(self.token, self.session, self.cache)
+
+    async def test_miss_is_cached_with_one_set_ex(self):
+        with patch.object(self.cache, "expire") as expire:
+            user = await self.current_user()
+        expire.assert_not_called()
+        self.assertEqual((user.id, user.username), (1, "smith@gmail.com"))
+        self.assertEqual(await self.cache.ttl(self.key), repository_auth.USER_CACHE_TTL)
+
+    async def test_hit_does_not_query_the_database(self):
+        await self.current_user()
+        self.statements.clear()
+        self.assertEqual((await self.current_user()).username, "smith@gmail.com")
+        self.assertEqual(self.statements, [])
+
+    async def test_entry_holds_only_the_projection(self):
+        user = await self.current_user()
+        self.assertIsInstance(user, UserCache)
+        entry = json.loads(await self.cache.get(self.key))
+        self.assertEqual(set(entry), set(UserCache.model_fields))
+        self.assertNotIn("password", entry)
+        self.assertEqual(repository_auth.load_cached_user(await self.cache.get(self.key)), user)
+
+    async def test_entries_of_another_format_are_a_miss(self):
+        self.assertIn(f"v{repository_auth.USER_CACHE_VERSION}", self.key)
+        await self.cache.set(self.key, pickle.dumps({"username": "smith@gmail.com"}))
+        self.assertEqual((await self.current_user()).id, 1)
+        self.assertEqual(json.loads(await self.cache.get(self.key))["id"], 1)
+
+    def test_load_rejects_incomplete_entries(self):
+        self.assertIsNone(repository_auth.load_cached_user(b'{"username": "smith@gmail.com"}'))
+        self.assertIsNone(repository_auth.load_cached_user(b"\x80\x04garbage"))